@@ -40,13 +40,20 @@ def create_app():
     app.register_blueprint(admin_bp, url_prefix="/admin")
     app.register_blueprint(cocina_bp, url_prefix="/cocina")
 
+    # ===============================
+    # 🔹 Comandos CLI (flask reconcile-cash ...)
+    # ===============================
+    from .commands import register_commands
+    register_commands(app)
+
     # ===============================
     # 🔹 User Loader
     # ===============================
     @login_manager.user_loader
     def load_user(user_id):
-        from .models import User
-        return User.query.get(int(user_id))
+        # ✅ principal cacheado (id, username, role, is_active): sin query por request
+        from .principal import load_principal
+        return load_principal(user_id)
 
     # ===============================
     # 🔹 Ruta base opcional
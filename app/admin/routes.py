@@ -1,35 +1,28 @@
-from flask import request, jsonify, render_template, redirect, url_for, flash
+from flask import request, jsonify, render_template, redirect, url_for, flash, Response, stream_with_context
 from flask_login import login_required, current_user
 from decimal import Decimal
-from datetime import datetime, timedelta
+from datetime import datetime
 
-from sqlalchemy import or_, func
+from sqlalchemy import or_
 
+from app.counters import CATALOG_COUNTER, bump_counter
 from app.extensions import db
+from app.principal import invalidate_principal
+from app.export import stream_csv, stream_xlsx
+from app.reports import (
+    EXPORT_SHEETS,
+    export_sheet,
+    ROWS_PAGE_DEFAULT,
+    parse_report_filters,
+    report_cache_stats,
+    report_rows_page,
+    report_summary,
+)
+from app.settings import get_setting, get_settings, set_settings
 from app.utils import require_roles
 from . import admin_bp
 
 
-# =========================================================
-# SETTINGS (key/value)
-# =========================================================
-def get_setting(key: str, default: str = "") -> str:
-    from app.models import AppSetting  # import local para evitar ciclos
-    s = AppSetting.query.get(key)
-    return (s.value if s and s.value is not None else default)
-
-
-def set_setting(key: str, value: str) -> None:
-    from app.models import AppSetting  # import local
-    s = AppSetting.query.get(key)
-    if not s:
-        s = AppSetting(key=key, value=value)
-        db.session.add(s)
-    else:
-        s.value = value
-    db.session.commit()
-
-
 def _dec(v, default="0"):
     try:
         return Decimal(str(v if v is not None else default))
@@ -44,10 +37,11 @@ def _dec(v, default="0"):
 @login_required
 @require_roles("admin")
 def admin_dashboard():
-    business_name = get_setting("business_name", "POS Barra")
-    receipt_footer = get_setting("receipt_footer", "Gracias por su compra")
-    receipt_autoprint = get_setting("receipt_autoprint", "1")
-    qr_size = get_setting("qr_size", "120")
+    settings = get_settings()
+    business_name = settings.get("business_name", "POS Barra")
+    receipt_footer = settings.get("receipt_footer", "Gracias por su compra")
+    receipt_autoprint = settings.get("receipt_autoprint", "1")
+    qr_size = settings.get("qr_size", "120")
 
     return render_template(
         "admin/dashboard.html",
@@ -79,20 +73,24 @@ def admin_settings():
         except Exception:
             qr_size = "120"
 
-        set_setting("business_name", business_name)
-        set_setting("receipt_footer", receipt_footer)
-        set_setting("receipt_autoprint", receipt_autoprint)
-        set_setting("qr_size", qr_size)
+        # ✅ las 4 en una sola transacción
+        set_settings({
+            "business_name": business_name,
+            "receipt_footer": receipt_footer,
+            "receipt_autoprint": receipt_autoprint,
+            "qr_size": qr_size,
+        })
 
         flash("✅ Configuración guardada", "success")
         return redirect(url_for("admin.admin_settings"))
 
     # GET
+    settings = get_settings()
     data = {
-        "business_name": get_setting("business_name", "POS Barra"),
-        "receipt_footer": get_setting("receipt_footer", "Gracias por su compra"),
-        "receipt_autoprint": get_setting("receipt_autoprint", "1"),
-        "qr_size": get_setting("qr_size", "120"),
+        "business_name": settings.get("business_name", "POS Barra"),
+        "receipt_footer": settings.get("receipt_footer", "Gracias por su compra"),
+        "receipt_autoprint": settings.get("receipt_autoprint", "1"),
+        "qr_size": settings.get("qr_size", "120"),
     }
     return render_template("admin/settings.html", **data)
 
@@ -161,8 +159,8 @@ def create_product():
 
     # inventario (si ya agregaste columnas al modelo Product)
     track_stock = bool(data.get("track_stock", True))
-if product_type == "supply":
-    track_stock = True
+    if product_type == "supply":
+        track_stock = True
     stock_qty = _dec(data.get("stock_qty"), "0")
     stock_min_qty = _dec(data.get("stock_min_qty"), "0")
     avg_cost = _dec(data.get("avg_cost"), "0")
@@ -193,6 +191,7 @@ if product_type == "supply":
         p.avg_cost = avg_cost
 
     db.session.add(p)
+    bump_counter(CATALOG_COUNTER)  # ✅ invalida el catálogo cacheado del POS
     db.session.commit()
     return jsonify({"ok": True, "id": p.id}), 201
 
@@ -286,11 +285,11 @@ def update_product_admin(product_id):
 
     # ✅ nuevos campos: show_in_pos / product_type / unit (si existen)
     if hasattr(p, "product_type") and "product_type" in data:
-    pt = (data.get("product_type") or "sale").strip().lower()
-    if pt not in ("sale", "supply"):
-        return jsonify({"ok": False, "error": "product_type inválido"}), 400
+        pt = (data.get("product_type") or "sale").strip().lower()
+        if pt not in ("sale", "supply"):
+            return jsonify({"ok": False, "error": "product_type inválido"}), 400
 
-    p.product_type = pt
+        p.product_type = pt
         # si es insumo, no debe aparecer en POS
         if hasattr(p, "show_in_pos"):
             if pt == "supply":
@@ -319,6 +318,7 @@ def update_product_admin(product_id):
     if hasattr(p, "avg_cost") and "avg_cost" in data:
         p.avg_cost = _dec(data.get("avg_cost"), "0")
 
+    bump_counter(CATALOG_COUNTER)  # ✅ invalida el catálogo cacheado del POS
     db.session.commit()
     return jsonify({"ok": True})
 
@@ -642,6 +642,7 @@ def update_user_admin(user_id):
 
         u.is_active = new_active
 
+    invalidate_principal(u.id)  # ✅ rol / desactivación aplican en todos los workers (máx. PRINCIPAL_RECHECK_SECONDS)
     db.session.commit()
     return jsonify({"ok": True})
 
@@ -663,6 +664,7 @@ def reset_password_admin(user_id):
         return jsonify({"ok": False, "error": "Password muy corta (mínimo 4)"}), 400
 
     u.set_password(new_password)
+    invalidate_principal(u.id)
     db.session.commit()
 
     return jsonify({"ok": True})
@@ -671,26 +673,6 @@ def reset_password_admin(user_id):
 # =========================================================
 # REPORTES PRO (HTML + API)
 # =========================================================
-def _parse_date(s: str):
-    try:
-        return datetime.strptime(s, "%Y-%m-%d")
-    except Exception:
-        return None
-
-
-def _payment_label(pm: str) -> str:
-    pm = (pm or "").lower().strip()
-    if pm in ("cash", "efectivo"):
-        return "Efectivo"
-    if pm in ("transfer", "transferencia"):
-        return "Transferencia"
-    if pm in ("card", "tarjeta"):
-        return "Tarjeta"
-    if not pm:
-        return "Sin método"
-    return pm
-
-
 @admin_bp.get("/reportes")
 @login_required
 @require_roles("admin")
@@ -705,133 +687,24 @@ def admin_reportes():
 def admin_api_reportes():
     """
     Query params:
-      from=YYYY-MM-DD
+      from=YYYY-MM-DD   (días en Config.TIMEZONE)
       to=YYYY-MM-DD
       payment_method=cash|transfer|...
       cash_register_id=#
       user_id=#
     """
     try:
-        from app.models import Order, Payment, User, CashRegister, OrderStatus
-
-        q_from = (request.args.get("from") or "").strip()
-        q_to = (request.args.get("to") or "").strip()
-        q_pm = (request.args.get("payment_method") or "").strip().lower()
-        q_cr = (request.args.get("cash_register_id") or "").strip()
-        q_user = (request.args.get("user_id") or "").strip()
-
-        d_from = _parse_date(q_from) if q_from else None
-        d_to = _parse_date(q_to) if q_to else None
-
-        # default hoy
-        if not d_from and not d_to:
-            now = datetime.now()
-            d_from = datetime(now.year, now.month, now.day)
-            d_to = d_from
-
-        if d_from and not d_to:
-            d_to = d_from
-        if d_to and not d_from:
-            d_from = d_to
-
-        start_dt = datetime(d_from.year, d_from.month, d_from.day)
-        end_dt = datetime(d_to.year, d_to.month, d_to.day) + timedelta(days=1)
-
-        q_orders = Order.query.filter(
-            Order.status == OrderStatus.CLOSED.value,
-            Order.created_at >= start_dt,
-            Order.created_at < end_dt
-        )
-
-        if q_cr:
-            q_orders = q_orders.filter(Order.cash_register_id == int(q_cr))
-
-        if q_user:
-            q_orders = q_orders.filter(Order.created_by_id == int(q_user))
-
-        if q_pm:
-            q_orders = q_orders.join(Payment).filter(func.lower(Payment.method) == q_pm)
+        from app.models import User, CashRegister
 
-        orders = q_orders.order_by(Order.created_at.desc()).all()
+        f = parse_report_filters(request.args)
 
-        total_sales = 0.0
-        orders_count = len(orders)
-        sales_by_day_map = {}
-        sales_by_payment_map = {}
-        top_products_map = {}
-        user_totals = {}
-        rows = []
-
-        cash_regs = CashRegister.query.order_by(CashRegister.id.desc()).all()
-        cash_map = {c.id: f"Caja #{c.id}" for c in cash_regs}
-        users = User.query.order_by(User.username.asc()).all()
+        cash_regs = db.session.query(CashRegister.id).order_by(CashRegister.id.desc()).all()
+        users = db.session.query(User.id, User.username).order_by(User.username.asc()).all()
         user_map = {u.id: (u.username or f"User {u.id}") for u in users}
 
-        for o in orders:
-            order_total = float(o.total_amount() or 0)
-            total_sales += order_total
-
-            day_label = o.created_at.strftime("%Y-%m-%d") if o.created_at else "—"
-            sales_by_day_map[day_label] = sales_by_day_map.get(day_label, 0.0) + order_total
-
-            if o.created_by_id:
-                uname = user_map.get(o.created_by_id, f"User {o.created_by_id}")
-                user_totals[uname] = user_totals.get(uname, 0.0) + order_total
-
-            if o.payments:
-                for p in o.payments:
-                    pm = (p.method or "").lower().strip()
-                    if q_pm and pm != q_pm:
-                        continue
-                    sales_by_payment_map[pm] = sales_by_payment_map.get(pm, 0.0) + float(p.amount or 0)
-
-            if o.items:
-                for it in o.items:
-                    pname = (it.product_name or "—")
-                    qty = int(it.quantity or 0)
-                    top_products_map[pname] = top_products_map.get(pname, 0) + qty
-
-            pm_label = "Sin método"
-            if o.payments and len(o.payments) == 1:
-                pm_label = _payment_label(o.payments[0].method)
-            elif o.payments and len(o.payments) > 1:
-                pm_label = "Mixto"
-
-            cr_label = cash_map.get(o.cash_register_id, f"Caja #{o.cash_register_id}")
-            cr_label = f"{cr_label} · #{o.number_in_register}"
-
-            rows.append({
-                "date": o.created_at.strftime("%Y-%m-%d %H:%M") if o.created_at else "—",
-                "cash_register": cr_label,
-                "user": user_map.get(o.created_by_id, "-"),
-                "payment_method": pm_label,
-                "total": order_total,
-            })
-
-        avg_ticket = (total_sales / orders_count) if orders_count else 0.0
-
-        top_user_name = "—"
-        top_user_detail = "—"
-        if user_totals:
-            top_user_name = max(user_totals, key=user_totals.get)
-            top_user_detail = f"{user_totals[top_user_name]:,.0f} CLP"
-
-        sales_by_day = [{"label": k, "value": float(v)} for k, v in sorted(sales_by_day_map.items(), key=lambda x: x[0])]
-
-        sales_by_payment = []
-        for pm_key in ["cash", "transfer"]:
-            if pm_key in sales_by_payment_map:
-                sales_by_payment.append({"label": _payment_label(pm_key), "value": float(sales_by_payment_map[pm_key])})
-        for pm_key, val in sales_by_payment_map.items():
-            if pm_key in ("cash", "transfer"):
-                continue
-            sales_by_payment.append({"label": _payment_label(pm_key), "value": float(val)})
-
-        top_products = sorted(
-            [{"label": k, "value": int(v)} for k, v in top_products_map.items()],
-            key=lambda x: x["value"],
-            reverse=True
-        )[:7]
+        # ✅ KPIs + series: consultas agrupadas (rollups + caja abierta), ver app/reports.py
+        # (el detalle va paginado en /admin/api/reportes/rows)
+        summary = report_summary(f, user_map)
 
         filters = {
             "cash_registers": [{"id": c.id, "name": f"Caja #{c.id}"} for c in cash_regs],
@@ -840,18 +713,8 @@ def admin_api_reportes():
 
         return jsonify({
             "ok": True,
-            "kpis": {
-                "total_sales": float(total_sales),
-                "orders_count": int(orders_count),
-                "avg_ticket": float(avg_ticket),
-                "top_user": {"name": top_user_name, "detail": top_user_detail},
-            },
-            "series": {
-                "sales_by_day": sales_by_day,
-                "sales_by_payment": sales_by_payment,
-                "top_products": top_products,
-            },
-            "rows": rows,
+            "kpis": summary["kpis"],
+            "series": summary["series"],
             "filters": filters,
         })
 
@@ -859,8 +722,84 @@ def admin_api_reportes():
         return jsonify({"ok": False, "message": f"Error reportes: {str(e)}"}), 500
 
 
+@admin_bp.get("/api/reportes/rows")
+@login_required
+@require_roles("admin")
+def admin_api_reportes_rows():
+    """
+    Detalle de pedidos paginado. Mismos filtros que /admin/api/reportes +
+      sort=-date|date|-total|total (default -date)
+      limit=# (default 50, máx 500)
+      cursor=<next_cursor de la página anterior>
+    """
+    try:
+        f = parse_report_filters(request.args)
+        sort = (request.args.get("sort") or "-date").strip()
+        limit = int(request.args.get("limit") or ROWS_PAGE_DEFAULT)
+        rows, next_cursor = report_rows_page(f, sort=sort, limit=limit, cursor=(request.args.get("cursor") or "").strip())
+    except ValueError as e:
+        return jsonify({"ok": False, "message": f"Parámetros inválidos: {str(e)}"}), 400
+
+    return jsonify({"ok": True, "rows": rows, "next_cursor": next_cursor, "sort": sort})
+
+
+@admin_bp.get("/api/reportes/cache")
+@login_required
+@require_roles("admin")
+def admin_api_reportes_cache():
+    """Estado del cache de reportes de este worker (entradas, bytes, hits/misses)."""
+    return jsonify({"ok": True, "cache": report_cache_stats()})
+
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _export_filename(f, ext: str) -> str:
+    return f"reporte_{f.day_from.isoformat()}_{f.day_to.isoformat()}.{ext}"
+
+
 @admin_bp.get("/reportes/export.xlsx")
 @login_required
 @require_roles("admin")
 def admin_reportes_export_xlsx():
-    return jsonify({"ok": False, "message": "Export Excel aún no implementado"}), 501
\ No newline at end of file
+    """
+    Mismos filtros que /admin/api/reportes. Hojas: Pedidos, Líneas y Pagos.
+    Se genera en streaming (cursor del lado del servidor + zip incremental): memoria plana.
+    """
+    try:
+        f = parse_report_filters(request.args)
+    except ValueError as e:
+        return jsonify({"ok": False, "message": f"Filtros inválidos: {str(e)}"}), 400
+
+    sheets = [
+        ("Pedidos", *export_sheet("pedidos", f)),
+        ("Líneas", *export_sheet("lineas", f)),
+        ("Pagos", *export_sheet("pagos", f)),
+    ]
+    return Response(
+        stream_with_context(stream_xlsx(sheets)),
+        mimetype=XLSX_MIMETYPE,
+        headers={"Content-Disposition": f'attachment; filename="{_export_filename(f, "xlsx")}"'},
+    )
+
+
+@admin_bp.get("/reportes/export.csv")
+@login_required
+@require_roles("admin")
+def admin_reportes_export_csv():
+    """Igual que export.xlsx pero una hoja por archivo: ?sheet=pedidos|lineas|pagos (default pedidos)."""
+    sheet = (request.args.get("sheet") or "pedidos").strip().lower()
+    if sheet not in EXPORT_SHEETS:
+        return jsonify({"ok": False, "message": "sheet inválido (pedidos | lineas | pagos)"}), 400
+
+    try:
+        f = parse_report_filters(request.args)
+    except ValueError as e:
+        return jsonify({"ok": False, "message": f"Filtros inválidos: {str(e)}"}), 400
+
+    header, rows = export_sheet(sheet, f)
+    return Response(
+        stream_with_context(stream_csv(header, rows)),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{_export_filename(f, sheet + ".csv")}"'},
+    )
\ No newline at end of file
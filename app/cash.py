@@ -0,0 +1,218 @@
+from decimal import Decimal
+
+from sqlalchemy import func, select, update
+
+from app.cache import TTLCache
+from app.extensions import db
+
+# La caja abierta cambia 2 veces por turno: se cachea (id, status) por proceso.
+# cash_open / cash_close la actualizan al instante en su worker; el TTL corto
+# cubre a los demás workers (las escrituras críticas igual validan status en BD).
+OPEN_REGISTER_TTL_SECONDS = 5
+
+_open_register_cache = TTLCache(maxsize=1, ttl=OPEN_REGISTER_TTL_SECONDS)
+_KEY = "open"
+
+
+def get_open_cash_register_id():
+    """Id de la caja abierta (la última abierta) o None. Sin query si está en cache."""
+    cached = _open_register_cache.get(_KEY)
+    if cached is not None:
+        return cached[0]
+
+    from app.models import CashRegister, CashRegisterStatus  # import local para evitar ciclos
+    row = (
+        db.session.query(CashRegister.id, CashRegister.status)
+        .filter(CashRegister.status == CashRegisterStatus.OPEN.value)
+        .order_by(CashRegister.opened_at.desc())
+        .first()
+    )
+
+    if row:
+        _open_register_cache.set(_KEY, (row.id, row.status))
+        return row.id
+
+    _open_register_cache.set(_KEY, (None, None))
+    return None
+
+
+def get_open_cash_register():
+    """CashRegister abierta (objeto ORM) o None. Confirma el status con la fila real."""
+    from app.models import CashRegister, CashRegisterStatus
+
+    cr_id = get_open_cash_register_id()
+    if cr_id is None:
+        return None
+
+    cr = db.session.get(CashRegister, cr_id)
+    if cr and cr.status == CashRegisterStatus.OPEN.value:
+        return cr
+
+    # otro worker la cerró: se refresca desde la BD
+    invalidate_open_cash_register()
+    cr_id = get_open_cash_register_id()
+    return db.session.get(CashRegister, cr_id) if cr_id else None
+
+
+def set_open_cash_register(cr_id, status="open") -> None:
+    _open_register_cache.set(_KEY, (cr_id, status) if cr_id else (None, None))
+
+
+def invalidate_open_cash_register() -> None:
+    _open_register_cache.clear()
+
+
+def lock_open_register(cr_id, for_close=False) -> bool:
+    """
+    Confirma en BD que la caja sigue abierta y bloquea su fila hasta el commit (Postgres).
+    Cambios de pedidos: FOR KEY SHARE (no choca con las ventas, que hacen UPDATE de la fila).
+    Cierre: FOR UPDATE -> espera a los cambios en curso y los siguientes ven la caja cerrada,
+    así el rollup y los totales de cierre se calculan con los pedidos ya definitivos.
+    Siempre antes de bloquear pedidos (mismo orden de locks que el cierre).
+    """
+    from app.models import CashRegister, CashRegisterStatus
+
+    stmt = select(CashRegister.status).where(CashRegister.id == cr_id)
+    stmt = stmt.with_for_update() if for_close else stmt.with_for_update(read=True, key_share=True)
+    if db.session.execute(stmt).scalar() == CashRegisterStatus.OPEN.value:
+        return True
+
+    invalidate_open_cash_register()  # otro worker la cerró: el cache de este quedó viejo
+    return False
+
+
+# ======================================================
+# TOTALES EN VIVO DE LA CAJA (columnas en cash_registers)
+# ======================================================
+# Se mantienen con UPDATE col = col + delta en la misma transacción que el pedido;
+# /pos/cash/summary lee solo la fila. reconcile_register_totals() los reconstruye.
+MONEY_COLUMNS = ("total_cash", "total_transfer", "total_sales")
+STATUS_COLUMNS = {
+    "prep": "orders_prep",
+    "ready": "orders_ready",
+    "delivered": "orders_delivered",
+    "cancelled": "orders_cancelled",
+    "closed": "orders_closed",
+}
+
+
+def _add(deltas, col, value):
+    if value:
+        deltas[col] = deltas.get(col, 0) + value
+
+
+def payment_deltas(payments, sign=1, deltas=None):
+    """Deltas de total_cash/total_transfer/total_sales para esos pagos (sign=-1 para restar)."""
+    from app.models import PaymentMethod
+
+    deltas = {} if deltas is None else deltas
+    for pay in payments or []:
+        amt = sign * (pay.amount or 0)
+        if pay.method == PaymentMethod.CASH.value:
+            _add(deltas, "total_cash", amt)
+        elif pay.method == PaymentMethod.TRANSFER.value:
+            _add(deltas, "total_transfer", amt)
+        _add(deltas, "total_sales", amt)
+    return deltas
+
+
+def status_deltas(old_status, new_status, deltas=None):
+    """Deltas de contadores por estado al pasar de old_status a new_status (None = pedido nuevo)."""
+    deltas = {} if deltas is None else deltas
+    old_status = (old_status or "").lower() or None
+    new_status = (new_status or "").lower() or None
+    if old_status == new_status:
+        return deltas
+    if old_status in STATUS_COLUMNS:
+        _add(deltas, STATUS_COLUMNS[old_status], -1)
+    if new_status in STATUS_COLUMNS:
+        _add(deltas, STATUS_COLUMNS[new_status], 1)
+    return deltas
+
+
+def order_transition_deltas(order, new_status):
+    """
+    Deltas por cambio de estado de un pedido existente. Si entra o sale de 'cancelled'
+    se restan/suman sus pagos (solo ahí se cargan order.payments).
+    """
+    from app.models import OrderStatus
+
+    cancelled = OrderStatus.CANCELLED.value
+    old_status = (order.status or "").lower()
+    new_status = (new_status or "").lower()
+
+    deltas = status_deltas(old_status, new_status)
+    if old_status != cancelled and new_status == cancelled:
+        payment_deltas(order.payments, sign=-1, deltas=deltas)
+    elif old_status == cancelled and new_status != cancelled:
+        payment_deltas(order.payments, sign=1, deltas=deltas)
+    return deltas
+
+
+def register_totals_values(deltas):
+    """{columna: col + delta} para usar en .values() de un UPDATE a cash_registers."""
+    from app.models import CashRegister
+
+    values = {}
+    for col, delta in (deltas or {}).items():
+        column = getattr(CashRegister, col)
+        values[col] = func.coalesce(column, 0) + delta
+    return values
+
+
+def apply_register_deltas(cash_register_id, deltas) -> None:
+    """Aplica deltas a los totales de la caja con un solo UPDATE atómico (sin leer la fila)."""
+    from app.models import CashRegister
+
+    values = register_totals_values(deltas)
+    if not cash_register_id or not values:
+        return
+    db.session.execute(
+        update(CashRegister)
+        .where(CashRegister.id == cash_register_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def reconcile_register_totals(cash_register_id) -> dict:
+    """
+    Reconstruye totales y contadores de una caja desde orders/payments (no hace commit).
+    Retorna los valores escritos.
+    """
+    from app.models import CashRegister, Order, Payment, OrderStatus, PaymentMethod
+
+    values = {col: 0 for col in STATUS_COLUMNS.values()}
+    rows = (
+        db.session.query(Order.status, func.count(Order.id))
+        .filter(Order.cash_register_id == cash_register_id)
+        .group_by(Order.status)
+        .all()
+    )
+    for status, n in rows:
+        col = STATUS_COLUMNS.get((status or "").lower())
+        if col:
+            values[col] = int(n)
+
+    totals = {col: Decimal("0") for col in MONEY_COLUMNS}
+    rows = (
+        db.session.query(Payment.method, func.sum(Payment.amount))
+        .join(Order, Order.id == Payment.order_id)
+        .filter(Order.cash_register_id == cash_register_id)
+        .filter(Order.status != OrderStatus.CANCELLED.value)
+        .group_by(Payment.method)
+        .all()
+    )
+    for method, amount in rows:
+        amount = Decimal(str(amount or 0))
+        if method == PaymentMethod.CASH.value:
+            totals["total_cash"] += amount
+        elif method == PaymentMethod.TRANSFER.value:
+            totals["total_transfer"] += amount
+        totals["total_sales"] += amount
+    values.update(totals)
+
+    db.session.query(CashRegister).filter(CashRegister.id == cash_register_id).update(
+        values, synchronize_session=False
+    )
+    return values
@@ -1,6 +1,21 @@
-from flask import Blueprint, render_template, jsonify, request
+import json
+import queue
+import time
+from datetime import datetime, timedelta
+
+from flask import Blueprint, render_template, jsonify, request, Response
 from flask_login import login_required
-from sqlalchemy import func
+from sqlalchemy import func, literal, tuple_
+from sqlalchemy.orm import selectinload
+from app.cash import (
+    apply_register_deltas,
+    get_open_cash_register_id,
+    lock_open_register,
+    order_transition_deltas,
+    status_deltas,
+)
+from app.counters import REPORTS_COUNTER, bump_counter
+from app.events import emit, order_payload, subscribe, unsubscribe
 from app.extensions import db
 
 cocina_bp = Blueprint("cocina", __name__)  # sin url_prefix
@@ -41,48 +56,30 @@ def _db_status_from_ui(ui_status: str) -> str:
     return mapping.get(s, "")
 
 
-# ============================================================
-# Helper: caja abierta actual
-# ============================================================
-def _get_caja_abierta():
-    from app.models import CashRegister
-    caja = (
-        CashRegister.query
-        .filter(func.lower(CashRegister.status) == "open")  # ⚠️ si tu campo no se llama status, cámbialo aquí
-        .order_by(CashRegister.id.desc())
-        .first()
-    )
-    return caja
-
-
-# =========================
-# API: pedidos activos
-# =========================
-@cocina_bp.route("/api/pedidos", methods=["GET"])
-@login_required
-def pedidos_activos():
-    from app.models import Order, OrderItem, Product
+def _card(order_id, number, reference_name, status, created_at, items):
+    """Tarjeta de pedido tal como la dibuja cocina.js."""
+    return {
+        "id": order_id,
+        "numero": number or order_id,
+        "cliente": reference_name or "",
+        "estado": _ui_status_from_db(status),
+        "hora": (created_at.strftime("%H:%M") if created_at else ""),
+        "pago": "",
+        "total": 0,
+        "items": items,
+    }
 
-    # 1) Buscar la caja ABIERTA (última)
-    caja = _get_caja_abierta()
-    if not caja:
-        return jsonify({"ok": True, "pedidos": [], "warning": "No hay caja abierta"}), 200
 
-    # 2) Pedidos activos SOLO de esa caja (cocina)
-    orders = (
-        Order.query
-        .filter(Order.cash_register_id == caja.id)
-        .filter(func.lower(Order.status).in_(["prep"]))  # SOLO EN_PREPARACION
-        .order_by(Order.created_at.asc())
-        .all()
-    )
+def _cards(orders):
+    """Tarjetas de los pedidos dados (1 query para los items)."""
+    from app.models import OrderItem, Product
 
     if not orders:
-        return jsonify({"ok": True, "pedidos": []})
+        return []
 
     order_ids = [o.id for o in orders]
 
-    # 3) Items + productos
+    # Items + productos
     rows = (
         db.session.query(OrderItem, Product)
         .join(Product, Product.id == OrderItem.product_id)
@@ -94,94 +91,231 @@ def pedidos_activos():
     for oi, prod in rows:
         items_by_order.setdefault(oi.order_id, []).append({
             "producto": getattr(prod, "name", "") or "",
-            "qty": int(getattr(oi, "qty", 1) or 1),
+            "qty": int(oi.quantity or 1),
         })
 
-    data = []
-    for o in orders:
-        data.append({
-            "id": o.id,
-            "numero": getattr(o, "number_in_register", None) or o.id,
-            "cliente": getattr(o, "reference_name", "") or "",
-            "estado": _ui_status_from_db(getattr(o, "status", "")),
-            "hora": (o.created_at.strftime("%H:%M") if getattr(o, "created_at", None) else ""),
-            "pago": "",
-            "total": 0,
-            "items": items_by_order.get(o.id, [])
-        })
+    return [
+        _card(o.id, o.number_in_register, o.reference_name, o.status, o.created_at, items_by_order.get(o.id, []))
+        for o in orders
+    ]
+
+
+def _pedidos_en_preparacion(caja_id):
+    """Tarjetas de los pedidos EN_PREPARACION de la caja (2 queries)."""
+    from app.models import Order
 
-    return jsonify({"ok": True, "pedidos": data})
+    orders = (
+        Order.query
+        .filter(Order.cash_register_id == caja_id)
+        .filter(Order.status == "prep")  # SOLO EN_PREPARACION (usa ix_orders_register_status_updated)
+        .order_by(Order.created_at.asc())
+        .all()
+    )
+    return _cards(orders)
 
 
 # =========================
-# API: resumen producción (SOLO EN_PREPARACION)
+# Cursor de cambios: "<caja>_<updated_at>_<id>"
 # =========================
-@cocina_bp.route("/api/resumen", methods=["GET"])
-@login_required
-def resumen_produccion():
+# El margen cubre transacciones que marcaron updated_at y confirmaron un poco después;
+# los pedidos del margen pueden repetirse en el siguiente delta (cocina.js los mezcla por id).
+PEDIDOS_SINCE_MARGIN_SECONDS = 5
+
+
+def _make_cursor(caja_id, ts, order_id=0) -> str:
+    return f"{caja_id}_{ts.isoformat()}_{order_id}"
+
+
+def _parse_cursor(v):
+    """-> (caja_id, updated_at, id) o None si no viene/es inválido."""
+    try:
+        caja, ts, oid = str(v).split("_")
+        return int(caja), datetime.fromisoformat(ts), int(oid)
+    except (TypeError, ValueError):
+        return None
+
+
+def _pedidos_delta(caja_id, since_ts, since_id):
     """
-    Devuelve un resumen de productos/cantidades SOLO de pedidos EN_PREPARACION (status='prep')
-    y SOLO de la caja abierta actual.
+    Pedidos de la caja creados o modificados desde el cursor (cualquier estado).
+    -> (tarjetas EN_PREPARACION, ids que ya no están en preparación, nuevo cursor)
     """
-    from app.models import Order, OrderItem, Product
-    from sqlalchemy.orm.attributes import InstrumentedAttribute
-
-    def pick_attr(model, candidates):
-        """Devuelve el primer atributo SQLAlchemy válido que exista en model (columna)."""
-        for name in candidates:
-            attr = getattr(model, name, None)
-            if isinstance(attr, InstrumentedAttribute):
-                return attr, name
-        return None, None
-
-    caja = _get_caja_abierta()
-    if not caja:
-        return jsonify({"ok": True, "items": [], "total_unidades": 0, "warning": "No hay caja abierta"}), 200
+    from app.models import Order, OrderStatus
 
-    # IDs de pedidos en preparación
-    order_ids = (
-        db.session.query(Order.id)
-        .filter(Order.cash_register_id == caja.id)
-        .filter(func.lower(Order.status) == "prep")
+    floor = since_ts - timedelta(seconds=PEDIDOS_SINCE_MARGIN_SECONDS)
+    changed = (
+        Order.query
+        .filter(Order.cash_register_id == caja_id)
+        # todos los estados: así el índice (caja, status, updated_at) sirve para el rango
+        .filter(Order.status.in_([s.value for s in OrderStatus]))
+        .filter(tuple_(Order.updated_at, Order.id) > tuple_(literal(floor), literal(since_id)))
+        .order_by(Order.updated_at.asc(), Order.id.asc())
         .all()
     )
-    order_ids = [x[0] for x in order_ids]
 
-    if not order_ids:
-        return jsonify({"ok": True, "items": [], "total_unidades": 0})
+    cursor = _make_cursor(caja_id, since_ts, since_id)
+    if changed and changed[-1].updated_at and changed[-1].updated_at >= since_ts:
+        cursor = _make_cursor(caja_id, changed[-1].updated_at, changed[-1].id)
+
+    prep = sorted((o for o in changed if o.status == "prep"), key=lambda o: o.id)
+    removed = [o.id for o in changed if o.status != "prep"]
+    return _cards(prep), removed, cursor
 
-    # Detectar columnas reales en tu BD
-    qty_col, qty_name = pick_attr(OrderItem, ["qty", "quantity", "cantidad", "cant"])
-    prod_name_col, prod_name_name = pick_attr(Product, ["name", "nombre", "producto"])
 
-    if qty_col is None:
-        return jsonify({
-            "ok": False,
-            "error": "No encontré columna de cantidad en OrderItem (probé: qty/quantity/cantidad/cant)"
-        }), 500
+# =========================
+# API: pedidos activos
+# =========================
+@cocina_bp.route("/api/pedidos", methods=["GET"])
+@login_required
+def pedidos_activos():
+    """
+    Sin since: lista completa de pedidos EN_PREPARACION + cursor.
+    ?since=<cursor>: solo los creados/cambiados desde entonces ("full": false);
+    los que salieron de preparación vienen en "removed" para que la pantalla los quite.
+    """
+    # 1) Buscar la caja ABIERTA (última) - cacheada, compartida con POS
+    caja_id = get_open_cash_register_id()
+    if not caja_id:
+        return jsonify({"ok": True, "pedidos": [], "warning": "No hay caja abierta"}), 200
 
-    if prod_name_col is None:
-        return jsonify({
-            "ok": False,
-            "error": "No encontré columna de nombre en Product (probé: name/nombre/producto)"
-        }), 500
+    # 2) Delta si el cursor es de esta misma caja
+    since = _parse_cursor(request.args.get("since")) if request.args.get("since") else None
+    if since is not None and since[0] == caja_id:
+        pedidos, removed, cursor = _pedidos_delta(caja_id, since[1], since[2])
+        return jsonify({"ok": True, "full": False, "pedidos": pedidos, "removed": removed, "cursor": cursor})
 
-    # Sumatoria por producto
-    resumen = (
-        db.session.query(
-            prod_name_col.label("producto"),
-            func.coalesce(func.sum(qty_col), 0).label("qty")
+    # 3) Pedidos activos SOLO de esa caja (cocina)
+    as_of = datetime.utcnow()
+    return jsonify({
+        "ok": True,
+        "full": True,
+        "pedidos": _pedidos_en_preparacion(caja_id),
+        "removed": [],
+        "cursor": _make_cursor(caja_id, as_of),
+    })
+
+
+# =========================
+# API: stream en vivo (SSE)
+# =========================
+STREAM_HEARTBEAT_SECONDS = 15
+STREAM_MAX_SECONDS = 300  # luego el navegador reconecta solo (y recibe snapshot nuevo)
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _ui_event(evt, caja_id):
+    """Traduce un evento de app.events a (event, data) para la pantalla, o None si no aplica."""
+    etype = evt.get("type")
+    data = evt.get("data") or {}
+
+    # caja abierta/cerrada, evento recortado o LISTEN reconectado: recargar todo
+    if etype in ("register_opened", "register_closed", "resync") or evt.get("partial"):
+        return "resync", {}
+
+    if data.get("cash_register_id") != caja_id:
+        return None
+
+    if etype == "order_cancelled":
+        return "remove", {"id": data.get("id")}
+
+    if etype in ("order_created", "order_status"):
+        if data.get("status") != "prep":
+            return "remove", {"id": data.get("id")}
+        created_at = data.get("created_at")
+        card = _card(
+            data.get("id"), data.get("number"), data.get("reference_name"), data.get("status"),
+            datetime.fromisoformat(created_at) if created_at else None,
+            [{"producto": i.get("name") or "", "qty": int(i.get("qty") or 1)} for i in data.get("items") or []],
         )
-        .join(Product, Product.id == OrderItem.product_id)
-        .filter(OrderItem.order_id.in_(order_ids))
-        .group_by(prod_name_col)
-        .order_by(func.sum(qty_col).desc())
+        return "upsert", card
+
+    return None
+
+
+@cocina_bp.route("/api/stream", methods=["GET"])
+@login_required
+def stream():
+    """
+    Server-Sent Events: snapshot al conectar y luego upsert/remove por pedido.
+    Sin eventos solo manda un comentario de heartbeat (no consulta la BD).
+    Requiere workers con hilos (cada pantalla mantiene una conexión abierta).
+    """
+    # ✅ primero suscribirse, después leer: no se pierde nada entre snapshot y eventos
+    q = subscribe()
+    try:
+        caja_id = get_open_cash_register_id()
+        snapshot = {
+            "pedidos": _pedidos_en_preparacion(caja_id) if caja_id else [],
+            "warning": None if caja_id else "No hay caja abierta",
+        }
+    except Exception:
+        unsubscribe(q)
+        raise
+    finally:
+        db.session.remove()  # la conexión vuelve al pool mientras el stream espera
+
+    def gen():
+        try:
+            yield "retry: 2000\n\n"
+            yield _sse("snapshot", snapshot)
+
+            deadline = time.monotonic() + STREAM_MAX_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    evt = q.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+
+                ui = _ui_event(evt, caja_id)
+                if ui is None:
+                    continue
+                yield _sse(*ui)
+                if ui[0] == "resync":
+                    return
+        finally:
+            unsubscribe(q)
+
+    return Response(
+        gen(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# =========================
+# API: resumen producción (SOLO EN_PREPARACION)
+# =========================
+@cocina_bp.route("/api/resumen", methods=["GET"])
+@login_required
+def resumen_produccion():
+    """
+    Devuelve un resumen de productos/cantidades SOLO de pedidos EN_PREPARACION (status='prep')
+    y SOLO de la caja abierta actual. La pantalla de cocina lo arma con sus tarjetas
+    (cocina.js); esto queda para otros clientes y se calcula al pedirlo (1 GROUP BY).
+    """
+    from app.models import Order, OrderItem, Product
+
+    caja_id = get_open_cash_register_id()
+    if not caja_id:
+        return jsonify({"ok": True, "items": [], "total_unidades": 0, "warning": "No hay caja abierta"}), 200
+
+    qty = func.coalesce(func.sum(OrderItem.quantity), 0)
+    resumen = (
+        db.session.query(Product.name.label("producto"), qty.label("qty"))
+        .join(OrderItem, OrderItem.product_id == Product.id)
+        .join(Order, Order.id == OrderItem.order_id)
+        .filter(Order.cash_register_id == caja_id, Order.status == "prep")
+        .group_by(Product.name)
+        .order_by(qty.desc())
         .all()
     )
 
     items = [{"producto": r.producto or "", "qty": int(r.qty or 0)} for r in resumen]
     total_unidades = sum(i["qty"] for i in items)
-
     return jsonify({"ok": True, "items": items, "total_unidades": total_unidades})
 
 
@@ -204,8 +338,136 @@ def cambiar_estado(pedido_id):
     if not new_db_status:
         return jsonify({"ok": False, "error": "No se pudo mapear estado"}), 400
 
-    pedido = Order.query.get_or_404(pedido_id)
+    caja_id = get_open_cash_register_id()
+    if not caja_id or not lock_open_register(caja_id):
+        return jsonify({"ok": False, "error": "No hay caja abierta"}), 400
+
+    # FOR UPDATE (Postgres): dos pantallas cambiando el mismo pedido no duplican contadores
+    pedido = Order.query.filter_by(id=pedido_id).with_for_update().first_or_404()
+
+    # caja cerrada: sus totales de cierre ya quedaron guardados, no se tocan
+    if pedido.cash_register_id != caja_id:
+        return jsonify({"ok": False, "error": "Solo puedes cambiar pedidos de la caja abierta"}), 400
+
+    # ✅ totales/contadores en vivo de la caja en la misma transacción
+    apply_register_deltas(pedido.cash_register_id, order_transition_deltas(pedido, new_db_status))
+    old_status = (pedido.status or "").lower()
+    if old_status != new_db_status and "closed" in (old_status, new_db_status):
+        bump_counter(REPORTS_COUNTER)  # ✅ reportes: entra/sale una venta cerrada
     pedido.status = new_db_status
 
+    # ✅ evento en vivo; si vuelve a preparación va el pedido completo (la cocina lo había quitado)
+    if new_db_status == "cancelled":
+        emit("order_cancelled", {"id": pedido.id, "cash_register_id": pedido.cash_register_id})
+    elif new_db_status == "prep":
+        emit("order_status", order_payload(pedido))
+    else:
+        emit("order_status", {"id": pedido.id, "status": new_db_status, "cash_register_id": pedido.cash_register_id})
+
+    db.session.commit()
+    return jsonify({"ok": True})
+
+
+# =========================
+# API: cambiar estado en lote
+# =========================
+# destino -> único estado de origen permitido (así el UPDATE sabe el estado anterior
+# de todas las filas y los contadores se ajustan sin leerlas). Anular sigue siendo por pedido.
+BULK_TRANSITIONS = {
+    "ready": "prep",     # EN_PREPARACION -> LISTO
+    "closed": "ready",   # LISTO -> ENTREGADO
+    "prep": "ready",     # LISTO -> volver a EN_PREPARACION
+}
+BULK_MAX_IDS = 200
+
+
+@cocina_bp.route("/api/pedidos/estado", methods=["POST"])
+@login_required
+def cambiar_estado_lote():
+    """
+    body: {"ids": [..], "estado": "LISTO"} -> un solo UPDATE ... WHERE id IN (..) AND status = origen.
+    Responde el resultado por id: {"id", "ok", "error"?}.
+    """
+    from app.models import Order
+    from sqlalchemy import update
+
+    body = request.get_json(silent=True) or {}
+    ui_estado = (body.get("estado") or "").strip().upper()
+    new_db_status = _db_status_from_ui(ui_estado)
+    from_status = BULK_TRANSITIONS.get(new_db_status)
+    if not from_status:
+        return jsonify({"ok": False, "error": "Estado inválido para cambio en lote"}), 400
+
+    ids = []
+    for v in body.get("ids") or []:
+        try:
+            oid = int(v)
+        except (TypeError, ValueError):
+            return jsonify({"ok": False, "error": f"id inválido: {v}"}), 400
+        if oid not in ids:
+            ids.append(oid)
+    if not ids:
+        return jsonify({"ok": False, "error": "No hay pedidos"}), 400
+    if len(ids) > BULK_MAX_IDS:
+        return jsonify({"ok": False, "error": f"Máximo {BULK_MAX_IDS} pedidos por lote"}), 400
+
+    caja_id = get_open_cash_register_id()
+    if not caja_id or not lock_open_register(caja_id):
+        return jsonify({"ok": False, "error": "No hay caja abierta"}), 400
+
+    # ✅ 1 UPDATE validado (orden de id: mismas filas, mismo orden de locks)
+    moved = db.session.execute(
+        update(Order)
+        .where(Order.id.in_(sorted(ids)))
+        .where(Order.cash_register_id == caja_id)
+        .where(Order.status == from_status)
+        .values(status=new_db_status, updated_at=datetime.utcnow())
+        .returning(Order.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    moved = set(moved)
+
+    if moved:
+        # contadores de caja: todas venían de from_status
+        deltas = {}
+        for _ in moved:
+            status_deltas(from_status, new_db_status, deltas=deltas)
+        apply_register_deltas(caja_id, deltas)
+        if "closed" in (from_status, new_db_status):
+            bump_counter(REPORTS_COUNTER)  # ✅ reportes: entran/salen ventas cerradas
+
+        # eventos en vivo; si vuelven a preparación va el pedido completo
+        if new_db_status == "prep":
+            for o in Order.query.options(selectinload(Order.items)).filter(Order.id.in_(moved)).all():
+                emit("order_status", order_payload(o))
+        else:
+            for oid in sorted(moved):
+                emit("order_status", {"id": oid, "status": new_db_status, "cash_register_id": caja_id})
+
+    # por qué no se movieron los demás
+    current = {}
+    rest = [oid for oid in ids if oid not in moved]
+    if rest:
+        current = dict(
+            db.session.query(Order.id, Order.status)
+            .filter(Order.id.in_(rest), Order.cash_register_id == caja_id)
+            .all()
+        )
+
     db.session.commit()
-    return jsonify({"ok": True})
\ No newline at end of file
+
+    results = []
+    for oid in ids:
+        if oid in moved:
+            results.append({"id": oid, "ok": True, "estado": ui_estado})
+        elif oid not in current:
+            results.append({"id": oid, "ok": False, "error": "Pedido no encontrado en la caja abierta"})
+        else:
+            results.append({
+                "id": oid,
+                "ok": False,
+                "estado": _ui_status_from_db(current[oid]),
+                "error": f"Está {_ui_status_from_db(current[oid])}, no se puede pasar a {ui_estado}",
+            })
+
+    return jsonify({"ok": True, "moved": len(moved), "results": results})
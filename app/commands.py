@@ -0,0 +1,99 @@
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func
+
+from app.extensions import db
+
+
+@click.command("reconcile-cash")
+@click.option("--id", "cash_register_id", type=int, default=None, help="Solo esta caja.")
+@click.option("--all", "all_registers", is_flag=True, help="Todas las cajas (por defecto solo la abierta).")
+@with_appcontext
+def reconcile_cash_command(cash_register_id, all_registers):
+    """Reconstruye totales y contadores en vivo de caja desde orders/payments."""
+    from app.cash import reconcile_register_totals, invalidate_open_cash_register
+    from app.models import CashRegister, CashRegisterStatus
+
+    q = db.session.query(CashRegister.id).order_by(CashRegister.id.asc())
+    if cash_register_id is not None:
+        q = q.filter(CashRegister.id == cash_register_id)
+    elif not all_registers:
+        q = q.filter(CashRegister.status == CashRegisterStatus.OPEN.value)
+
+    ids = [row.id for row in q.all()]
+    for cr_id in ids:
+        values = reconcile_register_totals(cr_id)
+        click.echo(
+            f"caja {cr_id}: ventas {values['total_sales']} "
+            f"(efectivo {values['total_cash']}, transferencia {values['total_transfer']}) "
+            f"prep {values['orders_prep']} listos {values['orders_ready']} "
+            f"entregados {values['orders_delivered']} anulados {values['orders_cancelled']} "
+            f"cerrados {values['orders_closed']}"
+        )
+
+    db.session.commit()
+    invalidate_open_cash_register()
+    click.echo(f"✅ {len(ids)} caja(s) reconciliadas")
+
+
+@click.command("rollup-sales")
+@click.option("--id", "cash_register_id", type=int, default=None, help="Solo esta caja.")
+@click.option("--rebuild", is_flag=True, help="Recalcula también las cajas que ya tienen rollup.")
+@with_appcontext
+def rollup_sales_command(cash_register_id, rebuild):
+    """Carga las ventas de cajas cerradas a sales_daily* (backfill de históricos)."""
+    from app.rollups import build_register_rollup
+    from app.models import CashRegister, CashRegisterStatus
+
+    q = (
+        db.session.query(CashRegister.id)
+        .filter(CashRegister.status == CashRegisterStatus.CLOSED.value)
+        .order_by(CashRegister.id.asc())
+    )
+    if cash_register_id is not None:
+        q = q.filter(CashRegister.id == cash_register_id)
+    elif not rebuild:
+        q = q.filter(CashRegister.rollup_at.is_(None))
+
+    ids = [row.id for row in q.all()]
+    total = 0
+    for cr_id in ids:
+        n = build_register_rollup(cr_id)
+        db.session.commit()  # una transacción por caja
+        total += n
+        click.echo(f"caja {cr_id}: {n} pedidos")
+
+    click.echo(f"✅ {len(ids)} caja(s), {total} pedidos en rollups")
+
+
+@click.command("check-query-plans")
+@click.option("--id", "cash_register_id", type=int, default=None, help="Caja para los filtros (por defecto la última).")
+@click.option("--verbose", is_flag=True, help="Muestra el plan de cada consulta.")
+@with_appcontext
+def check_query_plans_command(cash_register_id, verbose):
+    """EXPLAIN de las consultas calientes; sale con error si alguna recorre completa una tabla grande."""
+    from app.models import CashRegister
+    from app.query_plans import check_query_plans
+
+    if cash_register_id is None:
+        cash_register_id = db.session.query(func.max(CashRegister.id)).scalar() or 0
+
+    failed = 0
+    for name, scans, plan in check_query_plans(cash_register_id):
+        if scans:
+            failed += 1
+            click.echo(f"❌ {name}: recorre completa {', '.join(sorted(set(scans)))}")
+        else:
+            click.echo(f"✅ {name}")
+        if verbose or scans:
+            click.echo(plan)
+
+    if failed:
+        raise click.ClickException(f"{failed} consulta(s) sin índice")
+    click.echo("✅ todas las consultas usan índices")
+
+
+def register_commands(app):
+    app.cli.add_command(reconcile_cash_command)
+    app.cli.add_command(rollup_sales_command)
+    app.cli.add_command(check_query_plans_command)
@@ -11,3 +11,6 @@ class Config:
 
     TIMEZONE = os.getenv("TIMEZONE", "America/Santiago")
     DEFAULT_CURRENCY = os.getenv("DEFAULT_CURRENCY", "CLP")
+
+    # Respuestas guardadas por Idempotency-Key (reintentos de red en POS)
+    IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
@@ -0,0 +1,55 @@
+from sqlalchemy import select, update, insert
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+
+# nombres de contadores (tabla app_counters)
+CATALOG_COUNTER = "catalog"  # productos: nombre/precio/categoría/visibilidad en POS
+SETTINGS_COUNTER = "settings"  # app_settings (ticket / branding)
+REPORTS_COUNTER = "reports"  # pedidos que entran/salen de 'closed' y cierres de caja (cache de reportes)
+USERS_COUNTER = "users"  # rol / activo / password de usuarios (cache de current_user)
+ROLLUPS_COUNTER = "rollups"  # sales_daily* recalculadas (cierre de caja, flask rollup-sales)
+
+
+def _table():
+    from app.models import AppCounter  # import local para evitar ciclos
+    return AppCounter.__table__
+
+
+def get_counter(name: str) -> int:
+    """Valor actual del contador (0 si aún no existe). Lectura por PK."""
+    t = _table()
+    value = db.session.execute(select(t.c.value).where(t.c.name == name)).scalar_one_or_none()
+    return int(value or 0)
+
+
+def get_counters(*names: str) -> tuple:
+    """Valores de varios contadores en una sola lectura, en el orden pedido (0 si no existe)."""
+    t = _table()
+    rows = dict(db.session.execute(select(t.c.name, t.c.value).where(t.c.name.in_(names))).all())
+    return tuple(int(rows.get(name) or 0) for name in names)
+
+
+def bump_counter(name: str) -> int:
+    """
+    Incrementa el contador dentro de la transacción actual (UPDATE ... RETURNING)
+    y retorna el nuevo valor. Se confirma junto con el cambio que lo motivó.
+    """
+    t = _table()
+    value = db.session.execute(
+        update(t)
+        .where(t.c.name == name)
+        .values(value=t.c.value + 1)
+        .returning(t.c.value)
+    ).scalar_one_or_none()
+    if value is not None:
+        return int(value)
+
+    # primera vez: se crea la fila
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(t).values(name=name, value=1))
+        return 1
+    except IntegrityError:
+        # otro proceso la creó entremedio
+        return bump_counter(name)
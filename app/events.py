@@ -0,0 +1,136 @@
+import json
+import logging
+import queue
+import threading
+import time
+
+from sqlalchemy import event as sa_event, text
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+
+# ======================================================
+# EVENTOS EN VIVO (cocina): pedido creado / cambio de estado / anulado
+# ======================================================
+# emit() se llama dentro de la transacción del pedido y el evento sale SOLO si hay commit:
+#   - Postgres: NOTIFY en la misma transacción; un hilo por proceso hace LISTEN y reparte
+#     a los streams SSE de ese proceso (funciona con varios workers).
+#   - Otros motores (dev/SQLite): se reparte en memoria después del commit (un solo proceso).
+# Los streams esperan en una Queue: una cocina sin movimiento no toca la BD.
+CHANNEL = "pos_events"
+NOTIFY_MAX_BYTES = 7900  # límite de payload de NOTIFY (8000)
+LISTEN_RETRY_SECONDS = 3
+
+log = logging.getLogger(__name__)
+
+_subscribers = set()
+_subscribers_lock = threading.Lock()
+_listener_started = False
+_listener_lock = threading.Lock()
+
+
+def _publish_local(evt) -> None:
+    with _subscribers_lock:
+        targets = list(_subscribers)
+    for q in targets:
+        try:
+            q.put_nowait(evt)
+        except queue.Full:
+            pass  # cliente lento: se resincroniza con el snapshot al reconectar
+
+
+def subscribe(maxsize=1000):
+    """Queue que recibe los eventos publicados desde ahora. Llamar unsubscribe() al terminar."""
+    _ensure_listener()
+    q = queue.Queue(maxsize=maxsize)
+    with _subscribers_lock:
+        _subscribers.add(q)
+    return q
+
+
+def unsubscribe(q) -> None:
+    with _subscribers_lock:
+        _subscribers.discard(q)
+
+
+def _is_postgres() -> bool:
+    return db.engine.dialect.name == "postgresql"
+
+
+def emit(event_type: str, data: dict) -> None:
+    """Publica un evento cuando la transacción actual haga commit (si hay rollback, no sale)."""
+    evt = {"type": event_type, "data": data}
+
+    if _is_postgres():
+        payload = json.dumps(evt, default=str)
+        if len(payload.encode("utf-8")) > NOTIFY_MAX_BYTES:
+            # pedido gigante: avisamos solo el id y el cliente recarga el snapshot
+            payload = json.dumps({"type": event_type, "data": {"id": data.get("id")}, "partial": True})
+        db.session.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": payload})
+        return
+
+    db.session.info.setdefault("pending_events", []).append(json.loads(json.dumps(evt, default=str)))
+
+
+@sa_event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    for evt in session.info.pop("pending_events", None) or []:
+        _publish_local(evt)
+
+
+@sa_event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("pending_events", None)
+
+
+def order_payload(order) -> dict:
+    """Datos de un pedido para los eventos (usa order.items; recién creado no hace queries)."""
+    return {
+        "id": order.id,
+        "number": order.number_in_register,
+        "reference_name": order.reference_name,
+        "status": order.status,
+        "created_at": order.created_at.isoformat() if order.created_at else None,
+        "cash_register_id": order.cash_register_id,
+        "items": [{"name": it.product_name, "qty": int(it.quantity or 0)} for it in (order.items or [])],
+    }
+
+
+# ======================================================
+# LISTEN (Postgres): 1 conexión por proceso, solo mientras haya streams abiertos alguna vez
+# ======================================================
+def _ensure_listener() -> None:
+    global _listener_started
+    if _listener_started or not _is_postgres():
+        return
+
+    with _listener_lock:
+        if _listener_started:
+            return
+        url = db.engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        threading.Thread(target=_listen_forever, args=(url,), name="pos-events-listen", daemon=True).start()
+        _listener_started = True
+
+
+def _listen_forever(url: str) -> None:
+    import psycopg
+
+    first = True
+    while True:
+        try:
+            with psycopg.connect(url, autocommit=True) as conn:
+                conn.execute(f"LISTEN {CHANNEL}")
+                if not first:
+                    # se cortó la conexión: pudimos perder eventos, los clientes recargan snapshot
+                    _publish_local({"type": "resync", "data": {}})
+                first = False
+
+                for n in conn.notifies():
+                    try:
+                        evt = json.loads(n.payload)
+                    except ValueError:
+                        continue
+                    _publish_local(evt)
+        except Exception:
+            log.exception("LISTEN %s caído, reintentando", CHANNEL)
+            time.sleep(LISTEN_RETRY_SECONDS)
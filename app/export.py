@@ -0,0 +1,162 @@
+import csv
+import io
+import re
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+# ======================================================
+# EXPORT EN STREAMING (XLSX / CSV) sin dependencias
+# ======================================================
+# Los generadores reciben filas (iterables) y van entregando bytes cada FLUSH_ROWS filas:
+# la memoria no crece con la cantidad de filas. El XLSX es un zip escrito sobre un stream
+# no seekable (zipfile usa data descriptors) con hojas en XML plano (inlineStr).
+FLUSH_ROWS = 500
+
+_ILLEGAL_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+class _Sink(io.RawIOBase):
+    """Destino de escritura que acumula bytes hasta que el generador los entrega."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks.clear()
+        return out
+
+
+def _col(n: int) -> str:
+    """0 -> A, 25 -> Z, 26 -> AA"""
+    s = ""
+    n += 1
+    while n:
+        n, r = divmod(n - 1, 26)
+        s = chr(65 + r) + s
+    return s
+
+
+def _cell(ref: str, v) -> str:
+    if v is None or v == "":
+        return ""
+    if isinstance(v, bool):
+        return f'<c r="{ref}" t="b"><v>{int(v)}</v></c>'
+    if isinstance(v, (int, float, Decimal)):
+        return f'<c r="{ref}"><v>{v}</v></c>'
+    text = escape(_ILLEGAL_XML.sub("", str(v)))
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _row_xml(i: int, values) -> str:
+    cells = "".join(_cell(f"{_col(j)}{i}", v) for j, v in enumerate(values))
+    return f'<row r="{i}">{cells}</row>'
+
+
+def _sheet_name(name: str) -> str:
+    return escape(re.sub(r"[\[\]:*?/\\]", " ", name)[:31])
+
+
+def stream_xlsx(sheets):
+    """
+    sheets: [(nombre, encabezados, filas)] donde filas es un iterable (puede ser un generador).
+    Genera los bytes del .xlsx a medida que se leen las filas.
+    """
+    sink = _Sink()
+    names = []
+
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for n, (name, header, rows) in enumerate(sheets, start=1):
+            names.append(name)
+            with zf.open(f"xl/worksheets/sheet{n}.xml", "w", force_zip64=True) as fh:
+                fh.write(
+                    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                    b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                    b"<sheetData>"
+                )
+                fh.write(_row_xml(1, header).encode("utf-8"))
+
+                buf = []
+                for i, values in enumerate(rows, start=2):
+                    buf.append(_row_xml(i, values))
+                    if len(buf) >= FLUSH_ROWS:
+                        fh.write("".join(buf).encode("utf-8"))
+                        buf.clear()
+                        yield sink.drain()
+                if buf:
+                    fh.write("".join(buf).encode("utf-8"))
+                fh.write(b"</sheetData></worksheet>")
+            yield sink.drain()
+
+        sheet_overrides = "".join(
+            f'<Override PartName="/xl/worksheets/sheet{n}.xml" '
+            f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for n in range(1, len(names) + 1)
+        )
+        zf.writestr(
+            "[Content_Types].xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            f"{sheet_overrides}</Types>",
+        )
+        zf.writestr(
+            "_rels/.rels",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            'Target="xl/workbook.xml"/></Relationships>',
+        )
+        zf.writestr(
+            "xl/workbook.xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+            + "".join(
+                f'<sheet name="{_sheet_name(name)}" sheetId="{n}" r:id="rId{n}"/>'
+                for n, name in enumerate(names, start=1)
+            )
+            + "</sheets></workbook>",
+        )
+        zf.writestr(
+            "xl/_rels/workbook.xml.rels",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + "".join(
+                f'<Relationship Id="rId{n}" '
+                f'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                f'Target="worksheets/sheet{n}.xml"/>'
+                for n in range(1, len(names) + 1)
+            )
+            + "</Relationships>",
+        )
+
+    yield sink.drain()  # directorio central del zip
+
+
+def stream_csv(header, rows):
+    """CSV UTF-8 con BOM (Excel lo abre con tildes bien)."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    buf.write("\ufeff")
+    writer.writerow(header)
+    for n, values in enumerate(rows, start=1):
+        writer.writerow(["" if v is None else v for v in values])
+        if n % FLUSH_ROWS == 0:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode("utf-8")
@@ -0,0 +1,214 @@
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import request, jsonify, make_response, current_app, Response, g
+from flask_login import current_user
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app.cache import TTLCache
+from app.extensions import db
+
+# key -> (endpoint, user_id, status_code, body)  (solo respuestas ya guardadas)
+_replay_cache = TTLCache(maxsize=2048, ttl=600)
+
+_PURGE_EVERY_SECONDS = 600
+_last_purge = 0.0
+
+
+def _table():
+    from app.models import IdempotencyKey  # import local para evitar ciclos
+    return IdempotencyKey.__table__
+
+
+def _ttl_seconds() -> int:
+    return int(current_app.config.get("IDEMPOTENCY_TTL_SECONDS", 86400))
+
+
+def _purge_expired() -> None:
+    """Borra keys vencidas de la tabla (como mucho cada 10 min por proceso)."""
+    global _last_purge
+    now = time.monotonic()
+    if now - _last_purge < _PURGE_EVERY_SECONDS:
+        return
+    _last_purge = now
+
+    t = _table()
+    cutoff = datetime.utcnow() - timedelta(seconds=_ttl_seconds())
+    with db.engine.begin() as conn:
+        conn.execute(t.delete().where(t.c.created_at < cutoff))
+
+
+def _claim(key: str, endpoint: str, user_id):
+    """
+    Reserva la key (fila con status_code NULL = en proceso) en su propia transacción.
+    Retorna None si quedó reservada, o la fila existente si ya estaba.
+    """
+    t = _table()
+    for _ in range(2):
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(t.insert().values(
+                    key=key,
+                    endpoint=endpoint,
+                    user_id=user_id,
+                    created_at=datetime.utcnow()
+                ))
+            return None
+        except IntegrityError:
+            with db.engine.connect() as conn:
+                row = conn.execute(select(t).where(t.c.key == key)).first()
+
+            cutoff = datetime.utcnow() - timedelta(seconds=_ttl_seconds())
+            if row is None or (row.created_at and row.created_at < cutoff):
+                # vencida (o borrada entremedio): se libera y se reintenta la reserva
+                with db.engine.begin() as conn:
+                    conn.execute(t.delete().where(t.c.key == key, t.c.created_at < cutoff))
+                continue
+            return row
+    return None
+
+
+def _store(key: str, status_code: int, body: str) -> None:
+    t = _table()
+    with db.engine.begin() as conn:
+        conn.execute(
+            t.update()
+            .where(t.c.key == key)
+            .values(status_code=status_code, response_body=body)
+        )
+
+
+def commit_response(payload: dict, status: int = 200):
+    """
+    jsonify(payload) + commit de la sesión. Con Idempotency-Key (vista con @idempotent)
+    la respuesta se guarda en la fila reservada DENTRO de la misma transacción:
+    o quedan la venta y su respuesta, o ninguna (sin keys "en proceso" huérfanas).
+    """
+    resp = jsonify(payload)
+    resp.status_code = status
+
+    key = g.get("idempotency_key")
+    stored = None
+    if key and 200 <= status < 300:
+        t = _table()
+        stored = (status, resp.get_data(as_text=True))
+        db.session.execute(
+            t.update()
+            .where(t.c.key == key)
+            .values(status_code=stored[0], response_body=stored[1])
+        )
+
+    db.session.commit()
+    if stored:
+        g.idempotency_stored = stored
+    return resp
+
+
+def _release(key: str) -> None:
+    t = _table()
+    with db.engine.begin() as conn:
+        conn.execute(t.delete().where(t.c.key == key, t.c.status_code.is_(None)))
+
+
+def stored_responses(keys):
+    """{key: fila} de las keys que ya existen en la tabla (una sola query)."""
+    keys = [k for k in set(keys) if k]
+    if not keys:
+        return {}
+    t = _table()
+    rows = db.session.execute(select(t).where(t.c.key.in_(keys))).all()
+    return {row.key: row for row in rows}
+
+
+def remember_many(rows) -> None:
+    """
+    Guarda keys ya resueltas dentro de la transacción de la sesión,
+    así quedan confirmadas junto con las ventas (uso: sync en lote).
+    rows: [{"key", "endpoint", "user_id", "status_code", "response_body"}]
+    """
+    if not rows:
+        return
+    now = datetime.utcnow()
+    db.session.execute(_table().insert(), [dict(r, created_at=now) for r in rows])
+
+
+def _replay(endpoint, user_id, stored):
+    s_endpoint, s_user_id, status_code, body = stored
+
+    if s_endpoint != endpoint or s_user_id != user_id:
+        return jsonify({"ok": False, "error": "Idempotency-Key ya usada en otra operación"}), 422
+
+    if status_code is None:
+        return jsonify({"ok": False, "error": "Operación en proceso, reintenta en unos segundos"}), 409
+
+    resp = Response(body, status=status_code, mimetype="application/json")
+    resp.headers["Idempotent-Replayed"] = "true"
+    return resp
+
+
+def idempotent(fn):
+    """
+    Soporte de header Idempotency-Key para POSTs que escriben (ventas, caja, anulaciones).
+      - 1a vez: reserva la key, ejecuta la vista y guarda status + JSON si fue 2xx
+        (las vistas usan commit_response(): se guarda en la misma transacción).
+      - Reintento: devuelve la respuesta guardada sin volver a ejecutar la vista
+        (no toca productos ni kardex).
+      - Si la vista no fue 2xx, se libera la key para que el cliente pueda reintentar.
+    Sin header, la vista se ejecuta igual que siempre.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = (request.headers.get("Idempotency-Key") or "").strip()
+        if not key:
+            return fn(*args, **kwargs)
+
+        if len(key) > 80:
+            return jsonify({"ok": False, "error": "Idempotency-Key inválida"}), 400
+
+        endpoint = request.endpoint
+        user_id = getattr(current_user, "id", None)
+
+        cached = _replay_cache.get(key)
+        if cached is not None:
+            return _replay(endpoint, user_id, cached)
+
+        _purge_expired()
+
+        row = _claim(key, endpoint, user_id)
+        if row is not None:
+            stored = (row.endpoint, row.user_id, row.status_code, row.response_body)
+            if row.status_code is not None:
+                _replay_cache.set(key, stored)
+            return _replay(endpoint, user_id, stored)
+
+        g.idempotency_key = key
+        g.idempotency_stored = None
+        try:
+            resp = make_response(fn(*args, **kwargs))
+        except BaseException:
+            db.session.rollback()
+            if g.idempotency_stored is None:
+                _release(key)
+            raise
+        finally:
+            g.idempotency_key = None
+
+        if g.idempotency_stored is not None:
+            # ya confirmada junto con la operación
+            status_code, body = g.idempotency_stored
+            _replay_cache.set(key, (endpoint, user_id, status_code, body))
+        elif 200 <= resp.status_code < 300:
+            # vista sin commit_response(): se guarda aparte (compat)
+            body = resp.get_data(as_text=True)
+            _store(key, resp.status_code, body)
+            _replay_cache.set(key, (endpoint, user_id, resp.status_code, body))
+        else:
+            # la vista no confirmó nada útil: descartamos lo pendiente y liberamos la key
+            db.session.rollback()
+            _release(key)
+
+        return resp
+
+    return wrapper
@@ -62,6 +62,8 @@ class Product(db.Model):
     avg_cost = db.Column(db.Numeric(14, 4), nullable=False, default=0)
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # cualquier UPDATE (incluye el descuento de stock en SQL) lo mueve: cursor de /pos/products/stock
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     def apply_purchase(self, qty, unit_cost):
         """
@@ -93,7 +95,7 @@ class Order(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     reference_name = db.Column(db.String(120), nullable=False, index=True)
-    status = db.Column(db.String(20), nullable=False, default=OrderStatus.PREP.value, index=True)
+    status = db.Column(db.String(20), nullable=False, default=OrderStatus.PREP.value)
 
     # 🔗 RELACIÓN CON CAJA
     cash_register_id = db.Column(
@@ -109,6 +111,18 @@ class Order(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint("cash_register_id", "number_in_register", name="uq_order_register_number"),
+        # ✅ cocina: pedidos en preparación de la caja y cambios desde un cursor de updated_at
+        db.Index("ix_orders_register_status_updated", "cash_register_id", "status", "updated_at"),
+        # ✅ reportes: pedidos 'closed' por rango de fechas (reemplaza el índice solo de status)
+        db.Index("ix_orders_status_created", "status", "created_at"),
+        # ✅ pedidos activos de la caja (cierre, cocina): índice parcial, solo unas pocas filas
+        db.Index(
+            "ix_orders_active_register",
+            "cash_register_id",
+            "created_at",
+            postgresql_where=db.text("status IN ('prep', 'ready')"),
+            sqlite_where=db.text("status IN ('prep', 'ready')"),
+        ),
     )
 
     # Auditoría
@@ -120,16 +134,14 @@ class Order(db.Model):
 
     notes = db.Column(db.Text, nullable=True)
 
+    # ✅ Total y unidades del pedido, guardados al crearlo (los items no cambian después;
+    # anular solo cambia status). Historial, ticket y reportes los leen sin cargar items.
+    total_amount = db.Column(db.Numeric(12, 2), nullable=False, default=0, server_default="0")
+    items_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
     items = db.relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
     payments = db.relationship("Payment", back_populates="order", cascade="all, delete-orphan")
 
-    def total_amount(self) -> float:
-        """
-        Total del pedido calculado desde items.
-        Retorna float para facilitar JSON/plantillas.
-        """
-        return sum(float(it.unit_price or 0) * int(it.quantity or 0) for it in (self.items or []))
-
 
 class OrderItem(db.Model):
     __tablename__ = "order_items"
@@ -207,6 +219,20 @@ class CashRegister(db.Model):
     total_orders = db.Column(db.Integer, nullable=True)
     total_cancelled = db.Column(db.Integer, nullable=True)
 
+    # ✅ Contadores en vivo por estado (se actualizan junto con cada pedido; ver app/cash.py)
+    # total_cash / total_transfer / total_sales también se llevan en vivo mientras la caja está abierta
+    orders_prep = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    orders_ready = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    orders_delivered = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    orders_cancelled = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    orders_closed = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    # ✅ Secuencia del correlativo por caja (último number_in_register entregado)
+    last_order_number = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    # ✅ Cuándo se cargaron sus ventas a las tablas sales_daily* (NULL = reportes leen orders)
+    rollup_at = db.Column(db.DateTime, nullable=True)
+
     notes = db.Column(db.String(255), nullable=True)
 
     # 🔗 RELACIÓN CON PEDIDOS
@@ -226,6 +252,32 @@ class AppSetting(db.Model):
     value = db.Column(db.Text, nullable=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+class AppCounter(db.Model):
+    """
+    Contadores/versiones globales (ej: "catalog"). Se incrementan en la misma
+    transacción del cambio; los caches en memoria comparan contra este valor.
+    """
+    __tablename__ = "app_counters"
+
+    name = db.Column(db.String(40), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+class IdempotencyKey(db.Model):
+    """
+    Respuesta guardada de un POST con header Idempotency-Key.
+    Un reintento con la misma key devuelve esto en vez de repetir la venta/cierre.
+    """
+    __tablename__ = "idempotency_keys"
+
+    key = db.Column(db.String(80), primary_key=True)
+    endpoint = db.Column(db.String(80), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
+
+    status_code = db.Column(db.Integer, nullable=True)  # NULL = en proceso
+    response_body = db.Column(db.Text, nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
 class Purchase(db.Model):
     __tablename__ = "purchases"
 
@@ -301,6 +353,11 @@ class StockMove(db.Model):
 
     product = db.relationship("Product")
 
+    __table_args__ = (
+        # ✅ cierre de caja: COGS = movimientos 'sale' de la caja
+        db.Index("ix_stock_moves_register_type", "cash_register_id", "move_type"),
+    )
+
 
 class CashRegisterInventorySnapshot(db.Model):
     """
@@ -347,4 +404,52 @@ class CashRegisterStockCount(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint("cash_register_id", "product_id", "count_type", name="uq_cash_count_once"),
-    )
\ No newline at end of file
+    )
+
+
+# ======================================================
+# ROLLUPS DE VENTAS (pedidos 'closed' por día; se llenan al cerrar caja, ver app/rollups.py)
+# ======================================================
+# pay_key = métodos de pago distintos del pedido, ordenados y unidos con "+" (ej: "cash+transfer"),
+# así el filtro por método de pago de reportes ("tiene un pago con ese método") sigue siendo exacto.
+class SalesDaily(db.Model):
+    __tablename__ = "sales_daily"
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    cash_register_id = db.Column(db.Integer, db.ForeignKey("cash_registers.id"), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
+    pay_key = db.Column(db.String(60), nullable=False, default="")
+
+    orders_count = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+
+class SalesDailyPayment(db.Model):
+    __tablename__ = "sales_daily_payments"
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    cash_register_id = db.Column(db.Integer, db.ForeignKey("cash_registers.id"), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
+    pay_key = db.Column(db.String(60), nullable=False, default="")
+    method = db.Column(db.String(20), nullable=False)
+
+    orders_count = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+
+class SalesDailyProduct(db.Model):
+    __tablename__ = "sales_daily_products"
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    cash_register_id = db.Column(db.Integer, db.ForeignKey("cash_registers.id"), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
+    pay_key = db.Column(db.String(60), nullable=False, default="")
+    product_name = db.Column(db.String(120), nullable=False)
+
+    orders_count = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
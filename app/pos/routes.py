@@ -1,13 +1,34 @@
+import json
+import uuid
 from decimal import Decimal
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
-from flask import request, jsonify, render_template, redirect, url_for
+from flask import request, jsonify, render_template, redirect, url_for, Response
 from flask_login import login_required, current_user
 
-from sqlalchemy import func
+from sqlalchemy import case, insert, update
 from sqlalchemy.exc import IntegrityError
 
+from app.cash import (
+    get_open_cash_register,
+    get_open_cash_register_id,
+    set_open_cash_register,
+    invalidate_open_cash_register,
+    lock_open_register,
+    apply_register_deltas,
+    order_transition_deltas,
+    payment_deltas,
+    reconcile_register_totals,
+    register_totals_values,
+    status_deltas,
+)
+from app.cache import TTLCache
+from app.counters import CATALOG_COUNTER, REPORTS_COUNTER, bump_counter, get_counter
+from app.events import emit, order_payload
 from app.extensions import db
+from app.idempotency import commit_response, idempotent
+from app.rollups import build_register_rollup
+from app.settings import get_settings
 from app.models import Order
 from app.utils import require_roles
 from . import pos_bp
@@ -20,13 +41,10 @@ def _dec(v, default="0"):
         return Decimal(default)
 
 
-# ======================================================
-# SETTINGS (para receipt / branding)
-# ======================================================
-def get_setting(key: str, default: str = "") -> str:
-    from app.models import AppSetting
-    s = AppSetting.query.get(key)
-    return (s.value if s and s.value is not None else default)
+# SUM(qty * costo) en SQL: 3 + 4 decimales, igual que la multiplicación Decimal en Python
+_SUM_PRODUCT = db.Numeric(30, 7)
+
+SNAPSHOT_CHUNK = 1000
 
 
 # ======================================================
@@ -41,16 +59,6 @@ def pos_root():
 # ======================================================
 # CAJA
 # ======================================================
-def get_open_cash_register():
-    from app.models import CashRegister, CashRegisterStatus
-    return (
-        CashRegister.query
-        .filter(CashRegister.status == CashRegisterStatus.OPEN.value)
-        .order_by(CashRegister.opened_at.desc())
-        .first()
-    )
-
-
 @pos_bp.get("/cash/status")
 @login_required
 @require_roles("admin", "cashier")
@@ -86,10 +94,11 @@ def cash_status():
 @pos_bp.post("/cash/open")
 @login_required
 @require_roles("admin", "cashier")
+@idempotent
 def cash_open():
     from app.models import (
         CashRegister, CashRegisterStatus,
-        Product, CashRegisterStockCount,
+        CashRegisterStockCount,
         StockMove, StockMoveType
     )
 
@@ -100,7 +109,9 @@ def cash_open():
     # compat front viejo/nuevo
     counts_open = data.get("counts_open") or data.get("opening_counts") or []
 
-    if get_open_cash_register():
+    # abrir caja es escritura crítica: se consulta la BD, no el cache
+    invalidate_open_cash_register()
+    if get_open_cash_register_id():
         return jsonify({"ok": False, "error": "Ya existe una caja abierta"}), 400
 
     cr = CashRegister(
@@ -108,6 +119,9 @@ def cash_open():
         opened_at=datetime.utcnow(),
         opened_by_id=current_user.id,
         opening_amount=opening_amount,
+        total_cash=Decimal("0"),
+        total_transfer=Decimal("0"),
+        total_sales=Decimal("0"),
         notes=notes
     )
 
@@ -128,13 +142,16 @@ def cash_open():
         adjust_enum = getattr(StockMoveType, "ADJUST", None)
         adjust_type_value = adjust_enum.value if adjust_enum is not None else "adjust"
 
-        for row in counts_open:
-            pid = row.get("product_id")
-            qty_counted = _dec(row.get("qty"), "0")
-            if not pid or qty_counted < 0:
-                continue
+        # ✅ 1 SELECT para todos los productos contados
+        counted = _stock_count_rows(counts_open)
+        products_by_id = _load_products_map(counted)
 
-            prod = Product.query.get(int(pid))
+        now = datetime.utcnow()
+        levels = {}
+        count_rows = []
+        move_rows = []
+        for pid, qty_counted in counted.items():
+            prod = products_by_id.get(pid)
             if not prod:
                 continue
 
@@ -142,51 +159,55 @@ def cash_open():
             if not bool(getattr(prod, "track_stock", True)):
                 continue
 
-            # debe tener stock_qty para sincronizar
-            if not hasattr(prod, "stock_qty"):
-                continue
-
             current_qty = _dec(getattr(prod, "stock_qty", 0), "0")
             delta = qty_counted - current_qty  # + entra, - sale
 
-            # ✅ Actualiza stock real al conteo inicial
-            prod.stock_qty = qty_counted
+            # ✅ Stock real = conteo inicial
+            levels[pid] = qty_counted
 
             # ✅ Registra conteo inicial
-            db.session.add(CashRegisterStockCount(
-                cash_register_id=cr.id,
-                product_id=prod.id,
-                count_type="open",
-                qty=qty_counted,
-                product_name=prod.name,
-                unit=getattr(prod, "unit", None),
-                created_by_id=current_user.id,
-                created_at=datetime.utcnow()
-            ))
+            count_rows.append({
+                "cash_register_id": cr.id,
+                "product_id": pid,
+                "count_type": "open",
+                "qty": qty_counted,
+                "product_name": prod.name,
+                "unit": getattr(prod, "unit", None),
+                "created_by_id": current_user.id,
+                "created_at": now,
+            })
 
             # ✅ Kardex SOLO si hay diferencia
             if delta != 0:
-                unit_cost = _dec(getattr(prod, "avg_cost", 0), "0")
-
-                db.session.add(StockMove(
-                    product_id=prod.id,
-                    move_type=adjust_type_value,
-                    qty_delta=delta,
-                    unit_cost=unit_cost,
-                    ref_table="cash_registers",
-                    ref_id=cr.id,
-                    cash_register_id=cr.id,
-                    created_by_id=current_user.id,
-                    created_at=datetime.utcnow(),
-                ))
-
-    db.session.commit()
-    return jsonify({"ok": True, "cash_register_id": cr.id}), 201
+                move_rows.append({
+                    "product_id": pid,
+                    "move_type": adjust_type_value,
+                    "qty_delta": delta,
+                    "unit_cost": _dec(getattr(prod, "avg_cost", 0), "0"),
+                    "ref_table": "cash_registers",
+                    "ref_id": cr.id,
+                    "cash_register_id": cr.id,
+                    "created_by_id": current_user.id,
+                    "created_at": now,
+                })
+
+        # ✅ 1 UPDATE de stock + inserts en lote
+        _set_stock_levels(levels)
+        if count_rows:
+            db.session.execute(insert(CashRegisterStockCount), count_rows)
+        if move_rows:
+            db.session.execute(insert(StockMove), move_rows)
+
+    emit("register_opened", {"cash_register_id": cr.id})
+    resp = commit_response({"ok": True, "cash_register_id": cr.id}, 201)
+    set_open_cash_register(cr.id)
+    return resp
 
 
 @pos_bp.post("/cash/close")
 @login_required
 @require_roles("admin", "cashier")
+@idempotent
 def cash_close():
     """
     Cierre PRO + Conteo final + Consumo manual (Opción B):
@@ -199,7 +220,6 @@ def cash_close():
     from sqlalchemy import func
     from app.models import (
         OrderStatus,
-        PaymentMethod,
         CashRegisterStatus,
         Product,
         StockMove,
@@ -220,7 +240,9 @@ def cash_close():
     counts_close = data.get("counts_close") or data.get("closing_counts") or []
 
     cr = get_open_cash_register()
-    if not cr:
+    # FOR UPDATE de la caja: espera ventas/cambios de estado en curso; los que lleguen
+    # después ya la ven cerrada (el rollup no se desfasa de los pedidos)
+    if not cr or not lock_open_register(cr.id, for_close=True):
         return jsonify({"ok": False, "error": "No hay caja abierta"}), 400
 
     orders_q = Order.query.filter_by(cash_register_id=cr.id)
@@ -235,40 +257,34 @@ def cash_close():
         synchronize_session=False
     )
 
-    orders_ok = orders_q.filter(Order.status != OrderStatus.CANCELLED.value).all()
-    orders_cancelled = orders_q.filter(Order.status == OrderStatus.CANCELLED.value).count()
-
-    total_cash = Decimal("0")
-    total_transfer = Decimal("0")
-    total_sales = Decimal("0")
-
-    for o in orders_ok:
-        for pay in o.payments:
-            amt = _dec(pay.amount, "0")
-            if pay.method == PaymentMethod.CASH.value:
-                total_cash += amt
-            elif pay.method == PaymentMethod.TRANSFER.value:
-                total_transfer += amt
-            total_sales += amt
+    # ===== Totales por medio de pago + contadores por estado (GROUP BY en SQL) =====
+    # también deja los totales en vivo de la caja cuadrados con los pedidos reales
+    totals = reconcile_register_totals(cr.id)
+    total_cash = totals["total_cash"]
+    total_transfer = totals["total_transfer"]
+    total_sales = totals["total_sales"]
+    orders_cancelled = totals["orders_cancelled"]
+    orders_ok_count = (
+        totals["orders_prep"] + totals["orders_ready"]
+        + totals["orders_delivered"] + totals["orders_closed"]
+    )
 
     # ===== COGS del turno (según SALE) =====
-    cogs = Decimal("0")
-    sale_moves = StockMove.query.filter(
+    cogs = _dec(db.session.query(
+        func.coalesce(func.sum(
+            -StockMove.qty_delta * func.coalesce(StockMove.unit_cost, 0),
+            type_=_SUM_PRODUCT
+        ), 0)
+    ).filter(
         StockMove.cash_register_id == cr.id,
-        StockMove.move_type == StockMoveType.SALE.value
-    ).all()
-
-    for mv in sale_moves:
-        q = _dec(mv.qty_delta, "0")  # negativo
-        uc = _dec(mv.unit_cost, "0")
-        if q < 0:
-            cogs += (q.copy_abs() * uc)
+        StockMove.move_type == StockMoveType.SALE.value,
+        StockMove.qty_delta < 0
+    ).scalar(), "0")
 
     # ===== compras ligadas a caja =====
-    purchases_total = Decimal("0")
-    purchases = Purchase.query.filter(Purchase.cash_register_id == cr.id).all()
-    for p in purchases:
-        purchases_total += _dec(p.total_amount, "0")
+    purchases_total = _dec(db.session.query(
+        func.coalesce(func.sum(Purchase.total_amount), 0)
+    ).filter(Purchase.cash_register_id == cr.id).scalar(), "0")
 
     # ======================================================
     # ✅ Consumo manual de insumos (harina, aceite, etc.)
@@ -277,14 +293,25 @@ def cash_close():
     harina_consumed_qty = Decimal("0")
     harina_consumed_cost = Decimal("0")
 
+    # ✅ 1 SELECT para todos los productos de consumos + conteo final
+    counted_close = _stock_count_rows(counts_close)
+    products_by_id = _load_products_map(
+        [_parse_product_id(row.get("product_id")) for row in consumptions] + list(counted_close)
+    )
+
     if consumptions:
+        # Requiere StockMoveType.CONSUME = "consume"
+        move_type_value = getattr(StockMoveType, "CONSUME").value if hasattr(StockMoveType, "CONSUME") else "consume"
+
+        consumed = []    # [(prod, qty_used)] en el orden recibido
+        remaining = {}   # stock que va quedando (varias filas del mismo insumo)
         for row in consumptions:
-            pid = row.get("product_id")
+            pid = _parse_product_id(row.get("product_id"))
             qty_used = _dec(row.get("qty"), "0")
             if not pid or qty_used <= 0:
                 continue
 
-            prod = Product.query.get(int(pid))
+            prod = products_by_id.get(pid)
             if not prod:
                 continue
 
@@ -296,93 +323,97 @@ def cash_close():
             if hasattr(prod, "product_type") and (prod.product_type or "sale") != "supply":
                 continue
 
-            if not hasattr(prod, "stock_qty"):
-                continue
-
-            current_qty = _dec(getattr(prod, "stock_qty", 0), "0")
+            current_qty = remaining.setdefault(pid, _dec(getattr(prod, "stock_qty", 0), "0"))
             if qty_used > current_qty:
                 return jsonify({
                     "ok": False,
                     "error": f"Consumo supera stock: {prod.name}. Disponible {float(current_qty)}"
                 }), 400
 
-            prod.stock_qty = current_qty - qty_used
-
-            unit_cost = _dec(getattr(prod, "avg_cost", 0), "0")
+            remaining[pid] = current_qty - qty_used
+            consumed.append((prod, qty_used))
 
-            # Requiere StockMoveType.CONSUME = "consume"
-            move_type_value = getattr(StockMoveType, "CONSUME").value if hasattr(StockMoveType, "CONSUME") else "consume"
+        # ✅ 1 UPDATE de stock (condicional: no deja negativos)
+        used_by_pid = {}
+        for prod, qty_used in consumed:
+            used_by_pid[prod.id] = used_by_pid.get(prod.id, Decimal("0")) + qty_used
 
-            db.session.add(StockMove(
-                product_id=prod.id,
-                move_type=move_type_value,
-                qty_delta=_dec(-qty_used, "0"),
-                unit_cost=unit_cost,
-                ref_table="cash_registers",
-                ref_id=cr.id,
-                cash_register_id=cr.id,
-                created_by_id=current_user.id,
-                created_at=datetime.utcnow(),
-            ))
+        cost_by_pid = _apply_stock_deltas({pid: -q for pid, q in used_by_pid.items()}, require_available=True)
+        missing = [pid for pid in used_by_pid if pid not in cost_by_pid]
+        if missing:
+            db.session.rollback()
+            prod = products_by_id[missing[0]]
+            return jsonify({
+                "ok": False,
+                "error": f"Consumo supera stock: {prod.name}. Disponible {float(_dec(prod.stock_qty, '0'))}"
+            }), 400
+
+        now = datetime.utcnow()
+        move_rows = []
+        for prod, qty_used in consumed:
+            unit_cost = _dec(cost_by_pid[prod.id], "0")
+
+            move_rows.append({
+                "product_id": prod.id,
+                "move_type": move_type_value,
+                "qty_delta": _dec(-qty_used, "0"),
+                "unit_cost": unit_cost,
+                "ref_table": "cash_registers",
+                "ref_id": cr.id,
+                "cash_register_id": cr.id,
+                "created_by_id": current_user.id,
+                "created_at": now,
+            })
 
             if (prod.name or "").strip().lower() == "harina":
                 harina_consumed_qty += qty_used
                 harina_consumed_cost += (qty_used * unit_cost)
 
+        if move_rows:
+            db.session.execute(insert(StockMove), move_rows)
+
     # ======================================================
     # ✅ Guardar CONTEO FINAL (insumos + bebidas)
     # ======================================================
     if counts_close:
         CashRegisterStockCount.query.filter_by(cash_register_id=cr.id, count_type="close").delete(synchronize_session=False)
 
-        for row in counts_close:
-            pid = row.get("product_id")
-            qty = _dec(row.get("qty"), "0")
-            if not pid or qty < 0:
-                continue
-
-            prod = Product.query.get(int(pid))
+        now = datetime.utcnow()
+        count_rows = []
+        for pid, qty in counted_close.items():
+            prod = products_by_id.get(pid)
             if not prod:
                 continue
 
             if not bool(getattr(prod, "track_stock", True)):
                 continue
 
-            db.session.add(CashRegisterStockCount(
-                cash_register_id=cr.id,
-                product_id=prod.id,
-                count_type="close",
-                qty=qty,
-                product_name=prod.name,
-                unit=getattr(prod, "unit", None),
-                created_by_id=current_user.id,
-                created_at=datetime.utcnow()
-            ))
-
-    # ===== Snapshot inventario (DESPUÉS del consumo) =====
-    CashRegisterInventorySnapshot.query.filter_by(cash_register_id=cr.id).delete(synchronize_session=False)
-
-    inventory_value = Decimal("0")
-    products = Product.query.order_by(Product.category.asc(), Product.name.asc()).all()
-
-    for p in products:
-        qty = _dec(getattr(p, "stock_qty", 0), "0")
-        avg_cost = _dec(getattr(p, "avg_cost", 0), "0")
-        stock_value = (qty * avg_cost)
+            count_rows.append({
+                "cash_register_id": cr.id,
+                "product_id": pid,
+                "count_type": "close",
+                "qty": qty,
+                "product_name": prod.name,
+                "unit": getattr(prod, "unit", None),
+                "created_by_id": current_user.id,
+                "created_at": now,
+            })
 
-        inventory_value += stock_value
+        if count_rows:
+            db.session.execute(insert(CashRegisterStockCount), count_rows)
 
-        db.session.add(CashRegisterInventorySnapshot(
-            cash_register_id=cr.id,
-            product_id=p.id,
-            product_name=p.name,
-            qty=qty,
-            avg_cost=avg_cost,
-            stock_value=stock_value
-        ))
+    # ===== Snapshot inventario (DESPUÉS del consumo) + valor total en la misma pasada =====
+    CashRegisterInventorySnapshot.query.filter_by(cash_register_id=cr.id).delete(synchronize_session=False)
+    inventory_value = _snapshot_inventory(cr.id)
 
-        if (p.name or "").strip().lower() == "harina":
-            harina_stock_final = float(qty)
+    harina = (
+        db.session.query(Product.stock_qty)
+        .filter(func.lower(func.trim(Product.name)) == "harina")
+        .order_by(Product.category.desc(), Product.name.desc())
+        .first()
+    )
+    if harina is not None:
+        harina_stock_final = float(_dec(harina.stock_qty, "0"))
 
     profit_est = total_sales - cogs
 
@@ -393,12 +424,13 @@ def cash_close():
     cr.total_cash = total_cash
     cr.total_transfer = total_transfer
     cr.total_sales = total_sales
-    cr.total_orders = len(orders_ok)
+    cr.total_orders = orders_ok_count
     cr.total_cancelled = orders_cancelled
 
-    db.session.commit()
-
-    return jsonify({
+    build_register_rollup(cr.id)  # ✅ ventas del día a sales_daily* (reportes)
+    bump_counter(REPORTS_COUNTER)  # ✅ invalida los reportes cacheados
+    emit("register_closed", {"cash_register_id": cr.id})
+    resp = commit_response({
         "ok": True,
         "resume_pro": {
             "total_sales": float(total_sales),
@@ -413,13 +445,85 @@ def cash_close():
             "harina_stock_final": harina_stock_final,
         }
     })
+    set_open_cash_register(None)
+    return resp
+
+def _snapshot_inventory(cash_register_id) -> Decimal:
+    """
+    Foto del inventario de cierre sin cargar productos al ORM:
+    INSERT INTO cash_register_inventory_snapshots ... SELECT ... FROM products,
+    con stock_value calculado en SQL. Retorna el valor total (suma de qty * avg_cost)
+    desde el RETURNING del mismo INSERT; si el motor no soporta RETURNING,
+    se inserta en lotes (executemany).
+    """
+    from sqlalchemy import func, literal, select
+    from app.models import Product, CashRegisterInventorySnapshot
+
+    snap = CashRegisterInventorySnapshot.__table__
+    now = datetime.utcnow()
+    qty = func.coalesce(Product.stock_qty, 0)
+    avg_cost = func.coalesce(Product.avg_cost, 0)
+
+    if db.engine.dialect.insert_returning:
+        stmt = (
+            insert(snap)
+            .from_select(
+                ["cash_register_id", "product_id", "product_name", "qty", "avg_cost", "stock_value", "created_at"],
+                select(literal(cash_register_id), Product.id, Product.name, qty, avg_cost, qty * avg_cost, literal(now))
+            )
+            .returning(snap.c.qty, snap.c.avg_cost)
+        )
+        rows = db.session.execute(stmt).all()
+        return sum((_dec(q, "0") * _dec(c, "0") for q, c in rows), Decimal("0"))
+
+    inventory_value = Decimal("0")
+    batch = []
+    rows = db.session.execute(select(Product.id, Product.name, qty, avg_cost)).all()
+    for pid, name, q, c in rows:
+        value = _dec(q, "0") * _dec(c, "0")
+        inventory_value += value
+        batch.append({
+            "cash_register_id": cash_register_id,
+            "product_id": pid,
+            "product_name": name,
+            "qty": _dec(q, "0"),
+            "avg_cost": _dec(c, "0"),
+            "stock_value": value,
+            "created_at": now,
+        })
+        if len(batch) >= SNAPSHOT_CHUNK:
+            db.session.execute(insert(snap), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(snap), batch)
+    return inventory_value
+
 
 # ======================================================
 # PRODUCTOS (POS): SOLO VENTA (show_in_pos=True)
 # ======================================================
-@pos_bp.get("/products")
-@login_required
-def list_products():
+# El catálogo (nombre/precio/categoría) cambia poco: se sirve un JSON ya armado
+# por versión (contador "catalog", se incrementa al crear/editar productos) con ETag.
+# El stock cambia con cada venta: va aparte en /pos/products/stock.
+_catalog_cache = TTLCache(maxsize=4, ttl=3600)
+_BOOT_ID = uuid.uuid4().hex[:8]  # cambia en cada deploy/reinicio (templates nuevos)
+STOCK_SINCE_MARGIN_SECONDS = 5
+
+
+def _parse_since(v):
+    """as_of devuelto por /pos/products/stock -> datetime naive UTC (None si no viene/es inválido)."""
+    if not v:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(v))
+    except ValueError:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _pos_products_query():
     from app.models import Product
 
     query = Product.query.filter_by(active=True)
@@ -433,8 +537,20 @@ def list_products():
         # si por alguna razón no existe, no rompemos nada
         pass
 
+    return query
+
+
+def _catalog_blob(version: int) -> str:
+    """JSON del catálogo POS para esa versión (se arma 1 vez por proceso)."""
+    key = ("products", version)
+    blob = _catalog_cache.get(key)
+    if blob is not None:
+        return blob
+
+    from app.models import Product
+
     products = (
-        query
+        _pos_products_query()
         .order_by(Product.category.asc(), Product.name.asc())
         .all()
     )
@@ -446,178 +562,639 @@ def list_products():
             "name": p.name,
             "category": p.category,
             "price": float(p.price or 0),
-            # inventario si existe
             "track_stock": bool(getattr(p, "track_stock", True)),
-            "stock_qty": float(getattr(p, "stock_qty", 0) or 0),
             "unit": getattr(p, "unit", "UN"),
         })
-    return jsonify(out)
+
+    blob = json.dumps(out)
+    _catalog_cache.set(key, blob)
+    return blob
+
+
+def _conditional(body, etag: str, mimetype: str):
+    resp = Response(body, mimetype=mimetype)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"  # siempre revalida (304 si no cambió)
+    return resp.make_conditional(request)
+
+
+@pos_bp.get("/products")
+@login_required
+def list_products():
+    version = get_counter(CATALOG_COUNTER)
+    etag = f"catalog-{version}"
+
+    # ✅ tablet con la misma versión: 304 sin armar nada
+    if request.if_none_match.contains(etag):
+        return _conditional(b"", etag, "application/json")
+
+    return _conditional(_catalog_blob(version), etag, "application/json")
+
+
+@pos_bp.get("/products/stock")
+@login_required
+def products_stock():
+    """
+    Stock de productos POS con control de stock.
+    ?since=<as_of anterior> -> solo los que cambiaron desde entonces.
+    """
+    from app.models import Product
+
+    as_of = datetime.utcnow()
+    query = (
+        _pos_products_query()
+        .filter(Product.track_stock.is_(True))
+        .with_entities(Product.id, Product.stock_qty)
+    )
+
+    since = _parse_since(request.args.get("since"))
+    if since is not None:
+        # margen por transacciones que confirmaron después de marcar updated_at
+        query = query.filter(Product.updated_at >= since - timedelta(seconds=STOCK_SINCE_MARGIN_SECONDS))
+
+    items = [{"id": pid, "stock_qty": float(qty or 0)} for pid, qty in query.all()]
+    return jsonify({"ok": True, "as_of": as_of.isoformat(), "items": items})
 
 
 # ======================================================
-# CREAR PEDIDO (cobra y descuenta stock 1:1)
+# Helper: productos del pedido en UNA query
 # ======================================================
-@pos_bp.post("/orders")
-@login_required
-@require_roles("admin", "cashier")
-def create_order():
-    from app.models import (
-        Product,
-        OrderItem,
-        Payment,
-        OrderStatus,
-        PaymentMethod,
-        StockMove,
-        StockMoveType
+def _parse_product_id(v):
+    try:
+        pid = int(v)
+    except (TypeError, ValueError):
+        return None
+    return pid if pid > 0 else None
+
+
+def _load_products_map(product_ids):
+    """
+    Carga todos los productos del payload con un solo SELECT ... WHERE id IN (...).
+    En Postgres bloquea las filas (FOR UPDATE) en orden de id, así dos cajas
+    vendiendo los mismos productos no se bloquean en orden cruzado (deadlock).
+    Retorna {product_id: Product}.
+    """
+    from app.models import Product
+
+    ids = sorted({pid for pid in product_ids if pid})
+    if not ids:
+        return {}
+
+    q = Product.query.filter(Product.id.in_(ids)).order_by(Product.id.asc())
+    if db.engine.dialect.name == "postgresql":
+        q = q.with_for_update(of=Product)
+
+    return {p.id: p for p in q.all()}
+
+
+def _stock_count_rows(rows):
+    """
+    [{product_id, qty}] de un conteo -> {product_id: Decimal} (filas válidas, qty >= 0).
+    Si un producto viene repetido, vale el último conteo.
+    """
+    counted = {}
+    for row in rows or []:
+        pid = _parse_product_id(row.get("product_id"))
+        qty = _dec(row.get("qty"), "0")
+        if not pid or qty < 0:
+            continue
+        counted[pid] = qty
+    return counted
+
+
+def _set_stock_levels(levels):
+    """{product_id: qty} -> products.stock_qty = qty en UN solo UPDATE (conteo inicial)."""
+    from app.models import Product
+
+    if not levels:
+        return
+
+    db.session.execute(
+        update(Product)
+        .where(Product.id.in_(list(levels)))
+        .values(stock_qty=case(levels, value=Product.id))
+        .execution_options(synchronize_session=False)
     )
 
-    data = request.get_json(force=True) or {}
 
-    reference_name = (data.get("reference_name") or "").strip()
+def _apply_stock_deltas(deltas, require_available=False):
+    """
+    Aplica {product_id: qty_delta} a products.stock_qty en UN solo UPDATE ... RETURNING,
+    sin leer/escribir desde Python (no hay carrera entre cajas).
+    - Solo toca productos con track_stock=True.
+    - require_available=True (venta): solo actualiza filas con stock_qty + delta >= 0.
+    Retorna {product_id: avg_cost} de las filas actualizadas; un id que no aparece
+    no se movió (no existe, no controla stock o no alcanzaba el stock).
+    """
+    from app.models import Product
+
+    deltas = {pid: d for pid, d in deltas.items() if d}
+    if not deltas:
+        return {}
+
+    delta_expr = case(deltas, value=Product.id)
+
+    stmt = (
+        update(Product)
+        .where(Product.id.in_(list(deltas)))
+        .where(Product.track_stock.is_(True))
+        .values(stock_qty=Product.stock_qty + delta_expr)
+        .returning(Product.id, Product.avg_cost)
+        .execution_options(synchronize_session=False)
+    )
+    if require_available:
+        stmt = stmt.where(Product.stock_qty + delta_expr >= 0)
+
+    return {row.id: row.avg_cost for row in db.session.execute(stmt)}
+
+
+def _allocate_order_number(cash_register_id, count=1, totals=None):
+    """
+    Correlativo por caja en O(1): UPDATE ... SET last_order_number = last_order_number + :count
+    RETURNING last_order_number. La fila de la caja actúa como secuencia; sin max() ni reintentos.
+    totals: deltas de totales en vivo (app.cash) que se suman en el MISMO UPDATE.
+    Retorna el PRIMER número del bloque reservado (count números consecutivos),
+    o None si la caja ya no está abierta.
+    """
+    from app.models import CashRegister, CashRegisterStatus
+
+    stmt = (
+        update(CashRegister)
+        .where(CashRegister.id == cash_register_id)
+        .where(CashRegister.status == CashRegisterStatus.OPEN.value)
+        .values(
+            last_order_number=CashRegister.last_order_number + count,
+            **register_totals_values(totals)
+        )
+        .returning(CashRegister.last_order_number)
+        .execution_options(synchronize_session=False)
+    )
+    last = db.session.execute(stmt).scalar_one_or_none()
+    if last is None:
+        return None  # la caja se cerró (el cache de caja abierta puede ir unos segundos atrasado)
+    return int(last) - count + 1
+
+
+MAX_ITEM_QTY = 10000  # por línea: mantiene quantity / totales dentro de sus columnas
+
+
+def _parse_qty(v):
+    """Cantidad entera entre 1 y MAX_ITEM_QTY ("2", 2, 2.0); None si no es válida ("2x", 1.5, -1, 1e400)."""
+    try:
+        d = Decimal(str(v).strip())
+        if d <= 0 or d > MAX_ITEM_QTY or d != d.to_integral_value():
+            return None
+        return int(d)
+    except (ArithmeticError, ValueError, TypeError):
+        return None
+
+
+def _order_lines(data):
+    items = data.get("items") or []
+    if not isinstance(items, list):
+        return []
+    return [
+        (_parse_product_id(it.get("product_id")), it) if isinstance(it, dict) else (None, {})
+        for it in items
+    ]
+
+
+def _build_order(data, lines, products_by_id, stock_left):
+    """
+    Valida un payload de venta y arma Order + items + pago en memoria (no toca la BD).
+    stock_left ({product_id: Decimal}) es el stock disponible para validar; si la venta
+    es válida se descuenta ahí, así varias ventas de un mismo lote (sync) no se pisan.
+    Retorna (order, to_deduct, error) con to_deduct = [(product, qty)] de productos con stock.
+    """
+    from app.models import OrderItem, Payment, OrderStatus, PaymentMethod
+
+    reference_name = str(data.get("reference_name") or "").strip()
     if not reference_name:
-        return jsonify({"ok": False, "error": "reference_name es obligatorio"}), 400
+        return None, None, "reference_name es obligatorio"
 
-    items_in = data.get("items") or []
-    if not items_in:
-        return jsonify({"ok": False, "error": "items es obligatorio"}), 400
+    if not lines:
+        return None, None, "items es obligatorio"
 
-    pay = data.get("payment") or {}
-    method = (pay.get("method") or "").strip()
+    pay = data.get("payment") if isinstance(data.get("payment"), dict) else {}
+    method = str(pay.get("method") or "").strip()
     if method not in (PaymentMethod.CASH.value, PaymentMethod.TRANSFER.value):
-        return jsonify({"ok": False, "error": "payment.method inválido"}), 400
+        return None, None, "payment.method inválido"
+
+    # ===== Pre-chequeo stock (evita negativo) =====
+    to_deduct = []
+    needed = {}
+    qtys = []
+    for pid, it in lines:
+        p = products_by_id.get(pid)
+        if not p:
+            return None, None, "Producto inválido"
+        qty = _parse_qty(it.get("qty"))
+        if qty is None:
+            return None, None, f"Cantidad inválida: {p.name}"
+        qtys.append(qty)
 
-    cr = get_open_cash_register()
-    if not cr:
-        return jsonify({"ok": False, "error": "Caja cerrada"}), 400
+        track = bool(getattr(p, "track_stock", True))
+        if track and hasattr(p, "stock_qty"):
+            needed[p.id] = needed.get(p.id, Decimal("0")) + _dec(qty, "0")
+            available = stock_left.setdefault(p.id, _dec(p.stock_qty, "0"))
+            if available < needed[p.id]:
+                return None, None, f"Stock insuficiente: {p.name} (disponible {float(available)})"
+            to_deduct.append((p, qty))
+
+    order = Order(
+        reference_name=reference_name,
+        status=OrderStatus.PREP.value
+    )
 
-    tries = 0
-    while True:
-        tries += 1
+    total = Decimal("0.00")
 
-        last_num = (
-            db.session.query(func.max(Order.number_in_register))
-            .filter(Order.cash_register_id == cr.id)
-            .scalar()
-        )
-        next_num = int(last_num or 0) + 1
+    # ===== Items + total =====
+    for (pid, _), qty in zip(lines, qtys):
+        p = products_by_id[pid]
 
-        order = Order(
-            reference_name=reference_name,
-            status=OrderStatus.PREP.value,
-            created_by_id=current_user.id,
-            cash_register_id=cr.id,
-            number_in_register=next_num
-        )
+        unit_price = _dec(p.price, "0")
 
-        total = Decimal("0.00")
-
-        # ===== Pre-chequeo stock (evita negativo) =====
-        to_deduct = []
-        for it in items_in:
-            p = Product.query.get(it.get("product_id"))
-            qty = int(it.get("qty") or 0)
-            if not p or qty <= 0:
-                return jsonify({"ok": False, "error": "Producto inválido"}), 400
-
-            track = bool(getattr(p, "track_stock", True))
-            if track and hasattr(p, "stock_qty"):
-                if _dec(p.stock_qty, "0") < _dec(qty, "0"):
-                    return jsonify({
-                        "ok": False,
-                        "error": f"Stock insuficiente: {p.name} (disponible {float(p.stock_qty or 0)})"
-                    }), 400
-                to_deduct.append((p, qty))
-
-        # ===== Items + total =====
-        for it in items_in:
-            p = Product.query.get(it.get("product_id"))
-            qty = int(it.get("qty") or 0)
-
-            unit_price = _dec(p.price, "0")
-
-            order.items.append(
-                OrderItem(
-                    product_id=p.id,
-                    product_name=p.name,
-                    unit_price=unit_price,
-                    quantity=qty
-                )
+        order.items.append(
+            OrderItem(
+                product_id=p.id,
+                product_name=p.name,
+                unit_price=unit_price,
+                quantity=qty
             )
+        )
+
+        total += unit_price * qty
+
+    amount = _dec(pay.get("amount"), "0")
+    if amount != total:
+        return None, None, "Monto incorrecto"
 
-            total += unit_price * qty
+    order.total_amount = total
+    order.items_count = sum(qtys)
 
-        amount = _dec(pay.get("amount"), "0")
-        if amount != total:
-            return jsonify({"ok": False, "error": "Monto incorrecto"}), 400
+    order.payments.append(Payment(method=method, amount=amount))
 
-        order.payments.append(Payment(method=method, amount=amount))
+    for pid, q in needed.items():
+        stock_left[pid] -= q
 
-        db.session.add(order)
+    return order, to_deduct, None
 
-        # ===== Descontar stock + registrar kardex (SALE) =====
+
+# ======================================================
+# CREAR PEDIDO (cobra y descuenta stock 1:1)
+# ======================================================
+@pos_bp.post("/orders")
+@login_required
+@require_roles("admin", "cashier")
+@idempotent
+def create_order():
+    from app.models import StockMove, StockMoveType
+
+    data = request.get_json(force=True) or {}
+
+    cr_id = get_open_cash_register_id()
+    if not cr_id:
+        return jsonify({"ok": False, "error": "Caja cerrada"}), 400
+
+    # ===== Productos del pedido (1 query, sirve para validar y para precios) =====
+    lines = _order_lines(data)
+    products_by_id = _load_products_map(pid for pid, _ in lines)
+
+    order, to_deduct, error = _build_order(data, lines, products_by_id, stock_left={})
+    if error:
+        return jsonify({"ok": False, "error": error}), 400
+
+    order.created_by_id = current_user.id
+    order.cash_register_id = cr_id
+
+    db.session.add(order)
+
+    try:
+        # ===== Descontar stock =====
+        # UPDATE condicional: si otra caja vendió el último, la fila no calza y el pedido falla
+        qty_by_pid = {}
         for p, qty in to_deduct:
-            if hasattr(p, "stock_qty"):
-                p.stock_qty = _dec(p.stock_qty, "0") - _dec(qty, "0")
+            qty_by_pid[p.id] = qty_by_pid.get(p.id, Decimal("0")) + _dec(qty, "0")
 
-            unit_cost = _dec(getattr(p, "avg_cost", 0), "0")
+        with db.session.no_autoflush:
+            cost_by_pid = _apply_stock_deltas(
+                {pid: -q for pid, q in qty_by_pid.items()},
+                require_available=True
+            )
 
+        missing = [pid for pid in qty_by_pid if pid not in cost_by_pid]
+        if missing:
+            db.session.rollback()
+            p = products_by_id[missing[0]]
+            return jsonify({
+                "ok": False,
+                "error": f"Stock insuficiente: {p.name}"
+            }), 400
+
+        # ✅ correlativo + totales en vivo al final: el lock de la fila de caja dura solo hasta el commit
+        totals = payment_deltas(order.payments, deltas=status_deltas(None, order.status))
+        with db.session.no_autoflush:
+            order.number_in_register = _allocate_order_number(cr_id, totals=totals)
+        if order.number_in_register is None:
+            db.session.rollback()
+            invalidate_open_cash_register()
+            return jsonify({"ok": False, "error": "Caja cerrada"}), 400
+
+        # ✅ cocina en vivo (sale con el commit)
+        db.session.flush()
+        emit("order_created", order_payload(order))
+
+        # kardex (SALE) ya con order.id, igual que sync_orders
+        for p, qty in to_deduct:
             db.session.add(StockMove(
                 product_id=p.id,
                 move_type=StockMoveType.SALE.value,
                 qty_delta=_dec(-qty, "0"),
-                unit_cost=unit_cost,
+                unit_cost=_dec(cost_by_pid[p.id], "0"),
                 ref_table="orders",
-                ref_id=None,  # si quieres, lo ponemos con order.id luego (requiere flush)
-                cash_register_id=cr.id,
+                ref_id=order.id,
+                cash_register_id=cr_id,
                 created_by_id=current_user.id,
                 created_at=datetime.utcnow(),
             ))
 
-        try:
-            db.session.commit()
-            return jsonify({
+        return commit_response({
+            "ok": True,
+            "order_id": order.id,
+            "order_number": order.number_in_register,
+            "cash_register_id": cr_id
+        })
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"ok": False, "error": "No se pudo asignar correlativo, reintenta"}), 409
+
+
+# ======================================================
+# SYNC OFFLINE: lote de ventas encoladas en pos.js
+# ======================================================
+SYNC_MAX_ORDERS = 200
+
+
+def _parse_client_datetime(v, not_before):
+    """
+    ISO del navegador (UTC) -> (created_at naive UTC, hora original o None).
+    Inválida -> ahora. Futura o anterior a la apertura de la caja (venta hecha con
+    la caja anterior, o reloj del equipo corrido) -> ahora, y se retorna la hora
+    original para dejarla en notes: la venta cuenta en la caja y el día en que se
+    sincroniza, sin perder cuándo se hizo.
+    """
+    now = datetime.utcnow()
+    try:
+        dt = datetime.fromisoformat(str(v))
+    except (TypeError, ValueError):
+        return now, None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    if dt > now or (not_before and dt < not_before):
+        return now, dt
+    return dt, None
+
+
+@pos_bp.post("/orders/sync")
+@login_required
+@require_roles("admin", "cashier")
+def sync_orders():
+    """
+    Recibe las ventas que pos.js encoló sin conexión y las inserta en UNA transacción:
+    1 query de productos, 1 UPDATE de stock, 1 UPDATE de correlativos, inserts en lote.
+    Body: {"orders": [{"client_id", "reference_name", "items", "payment", "created_at"}]}
+    client_id funciona como Idempotency-Key (compartida con POST /pos/orders):
+    reenviar la cola no duplica ventas.
+    Respuesta: {"ok": true, "results": [{"client_id", "ok", "order_id", "order_number"} | {"client_id", "ok": false, "error"}]}
+    """
+    from app.models import StockMove, StockMoveType
+    from app.idempotency import stored_responses, remember_many
+
+    data = request.get_json(force=True) or {}
+    orders_in = data.get("orders") or []
+    if not isinstance(orders_in, list) or not orders_in:
+        return jsonify({"ok": False, "error": "orders es obligatorio"}), 400
+    if len(orders_in) > SYNC_MAX_ORDERS:
+        return jsonify({"ok": False, "error": f"Máximo {SYNC_MAX_ORDERS} pedidos por lote"}), 400
+
+    cr = get_open_cash_register()
+    if not cr:
+        return jsonify({"ok": False, "error": "Caja cerrada"}), 400
+
+    results = [None] * len(orders_in)
+
+    client_ids = []
+    for i, row in enumerate(orders_in):
+        cid = str((row if isinstance(row, dict) else {}).get("client_id") or "").strip()
+        if not cid or len(cid) > 80:
+            results[i] = {"client_id": cid, "ok": False, "error": "client_id inválido"}
+        client_ids.append(cid)
+
+    # ===== Ya sincronizadas (o vendidas online con la misma key): se responde lo guardado =====
+    stored = stored_responses([cid for i, cid in enumerate(client_ids) if results[i] is None])
+    seen = set()
+    for i, cid in enumerate(client_ids):
+        if results[i] is not None:
+            continue
+        if cid in seen:
+            results[i] = {"client_id": cid, "ok": False, "error": "client_id duplicado en el lote"}
+            continue
+        seen.add(cid)
+
+        row = stored.get(cid)
+        if row is None:
+            continue
+        if row.status_code is None:
+            results[i] = {"client_id": cid, "ok": False, "error": "Operación en proceso, reintenta"}
+            continue
+        prev = json.loads(row.response_body or "{}")
+        results[i] = {
+            "client_id": cid,
+            "ok": True,
+            "order_id": prev.get("order_id"),
+            "order_number": prev.get("order_number"),
+            "replayed": True,
+        }
+
+    # ===== Validación en memoria contra un solo SELECT de productos =====
+    pending = [i for i in range(len(orders_in)) if results[i] is None]
+    lines_by_idx = {i: _order_lines(orders_in[i]) for i in pending}
+    products_by_id = _load_products_map(pid for i in pending for pid, _ in lines_by_idx[i])
+
+    stock_left = {}
+    accepted = []  # (idx, order, to_deduct)
+    for i in pending:
+        order, to_deduct, error = _build_order(orders_in[i], lines_by_idx[i], products_by_id, stock_left)
+        if error:
+            results[i] = {"client_id": client_ids[i], "ok": False, "error": error}
+            continue
+        accepted.append((i, order, to_deduct))
+
+    if not accepted:
+        return jsonify({"ok": True, "results": results})
+
+    try:
+        qty_by_pid = {}
+        for _, _, to_deduct in accepted:
+            for p, qty in to_deduct:
+                qty_by_pid[p.id] = qty_by_pid.get(p.id, Decimal("0")) + _dec(qty, "0")
+
+        with db.session.no_autoflush:
+            cost_by_pid = _apply_stock_deltas(
+                {pid: -q for pid, q in qty_by_pid.items()},
+                require_available=True
+            )
+            if any(pid not in cost_by_pid for pid in qty_by_pid):
+                db.session.rollback()
+                return jsonify({"ok": False, "error": "El stock cambió durante la sincronización, reintenta"}), 409
+
+            totals = {}
+            for _, order, _ in accepted:
+                status_deltas(None, order.status, deltas=totals)
+                payment_deltas(order.payments, deltas=totals)
+
+            first_num = _allocate_order_number(cr.id, len(accepted), totals=totals)
+            if first_num is None:
+                db.session.rollback()
+                invalidate_open_cash_register()
+                return jsonify({"ok": False, "error": "Caja cerrada"}), 400
+
+        for n, (i, order, _) in enumerate(accepted):
+            order.cash_register_id = cr.id
+            order.created_by_id = current_user.id
+            order.number_in_register = first_num + n
+            order.created_at, sold_at = _parse_client_datetime(orders_in[i].get("created_at"), cr.opened_at)
+            if sold_at is not None:
+                order.notes = f"[OFFLINE] hora de venta: {sold_at.isoformat(timespec='seconds')} UTC"
+
+        db.session.add_all([order for _, order, _ in accepted])
+        db.session.flush()  # ids de pedidos (insert en lote con RETURNING)
+
+        for _, order, _ in accepted:
+            emit("order_created", order_payload(order))
+
+        now = datetime.utcnow()
+        moves = []
+        keys = []
+        for i, order, to_deduct in accepted:
+            for p, qty in to_deduct:
+                moves.append({
+                    "product_id": p.id,
+                    "move_type": StockMoveType.SALE.value,
+                    "qty_delta": _dec(-qty, "0"),
+                    "unit_cost": _dec(cost_by_pid[p.id], "0"),
+                    "ref_table": "orders",
+                    "ref_id": order.id,
+                    "cash_register_id": cr.id,
+                    "created_by_id": current_user.id,
+                    "created_at": now,
+                })
+
+            body = {
                 "ok": True,
                 "order_id": order.id,
                 "order_number": order.number_in_register,
                 "cash_register_id": cr.id
+            }
+            keys.append({
+                "key": client_ids[i],
+                "endpoint": "pos.create_order",
+                "user_id": current_user.id,
+                "status_code": 200,
+                "response_body": json.dumps(body),
             })
-        except IntegrityError:
-            db.session.rollback()
-            if tries >= 2:
-                return jsonify({"ok": False, "error": "No se pudo asignar correlativo, reintenta"}), 409
+            results[i] = {
+                "client_id": client_ids[i],
+                "ok": True,
+                "order_id": order.id,
+                "order_number": order.number_in_register,
+            }
+
+        if moves:
+            db.session.execute(insert(StockMove), moves)
+        remember_many(keys)
+
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"ok": False, "error": "No se pudo sincronizar el lote, reintenta"}), 409
+
+    return jsonify({"ok": True, "results": results})
+
+
+HISTORY_MAX_LIMIT = 200
 
 
 @pos_bp.get("/orders/history")
 @login_required
 def orders_history():
-    limit = int(request.args.get("limit", 50))
-    show_all = (request.args.get("all") or "").strip() == "1"
+    """
+    Historial paginado por cursor (id DESC):
+      ?limit=50&before_id=<id del último pedido recibido>
+    Pedidos + items en UNA query (join sobre la página), latencia pareja en cualquier página.
+    """
+    from sqlalchemy import select
+    from app.models import OrderItem
 
-    q = Order.query
+    try:
+        limit = int(request.args.get("limit", 50))
+    except (TypeError, ValueError):
+        limit = 50
+    limit = max(1, min(limit, HISTORY_MAX_LIMIT))
+
+    show_all = (request.args.get("all") or "").strip() == "1"
+    try:
+        before_id = int(request.args.get("before_id") or 0)
+    except (TypeError, ValueError):
+        before_id = 0
+
+    page = select(
+        Order.id,
+        Order.number_in_register,
+        Order.cash_register_id,
+        Order.created_at,
+        Order.status,
+        Order.total_amount,
+    )
 
     if not show_all:
-        cr = get_open_cash_register()
-        if cr:
-            q = q.filter(Order.cash_register_id == cr.id)
+        cr_id = get_open_cash_register_id()
+        if cr_id:
+            page = page.where(Order.cash_register_id == cr_id)
         else:
             return jsonify([])
 
-    orders = q.order_by(Order.id.desc()).limit(limit).all()
+    if before_id:
+        page = page.where(Order.id < before_id)
+
+    page = page.order_by(Order.id.desc()).limit(limit).subquery()
+
+    rows = db.session.execute(
+        select(
+            page,
+            OrderItem.product_name,
+            OrderItem.quantity,
+        )
+        .outerjoin(OrderItem, OrderItem.order_id == page.c.id)
+        .order_by(page.c.id.desc(), OrderItem.id.asc())
+    ).all()
 
     out = []
-    for o in orders:
-        out.append({
-            "id": o.id,
-            "number_in_register": int(o.number_in_register or 0),
-            "cash_register_id": o.cash_register_id,
-            "created_at": o.created_at.strftime("%Y-%m-%d %H:%M") if o.created_at else "",
-            "status": str(o.status or ""),
-            "total": float(o.total_amount()),
-            "items": [
-                {"name": it.product_name, "qty": int(it.quantity)}
-                for it in (o.items or [])
-            ]
-        })
+    for r in rows:
+        if not out or out[-1]["id"] != r.id:
+            out.append({
+                "id": r.id,
+                "number_in_register": int(r.number_in_register or 0),
+                "cash_register_id": r.cash_register_id,
+                "created_at": r.created_at.strftime("%Y-%m-%d %H:%M") if r.created_at else "",
+                "status": str(r.status or ""),
+                "total": float(r.total_amount or 0),
+                "items": [],
+            })
+        if r.product_name is None and r.quantity is None:
+            continue  # pedido sin items (outer join)
+
+        out[-1]["items"].append({"name": r.product_name, "qty": int(r.quantity)})
 
     return jsonify(out)
 
@@ -625,7 +1202,15 @@ def orders_history():
 @pos_bp.get("/orders/<int:order_id>")
 @login_required
 def get_order_detail(order_id):
-    order = Order.query.get_or_404(order_id)
+    from sqlalchemy.orm import joinedload
+
+    # pedido + items en una sola query
+    order = (
+        Order.query
+        .options(joinedload(Order.items))
+        .filter(Order.id == order_id)
+        .first_or_404()
+    )
 
     return jsonify({
         "id": order.id,
@@ -634,7 +1219,7 @@ def get_order_detail(order_id):
         "reference_name": order.reference_name,
         "status": order.status,
         "created_at": order.created_at.strftime("%Y-%m-%d %H:%M") if order.created_at else "",
-        "total": float(order.total_amount()),
+        "total": float(order.total_amount or 0),
         "items": [
             {
                 "name": item.product_name,
@@ -650,19 +1235,21 @@ def get_order_detail(order_id):
 @pos_bp.post("/orders/<int:order_id>/cancel")
 @login_required
 @require_roles("admin", "cashier")
+@idempotent
 def cancel_order(order_id):
     """
     Anula pedido y repone stock (para no perder inventario).
     """
-    from app.models import OrderStatus, Product, StockMove, StockMoveType
+    from app.models import OrderStatus, StockMove, StockMoveType
 
-    cr = get_open_cash_register()
-    if not cr:
+    cr_id = get_open_cash_register_id()
+    if not cr_id or not lock_open_register(cr_id):
         return jsonify({"ok": False, "error": "No hay caja abierta"}), 400
 
-    order = Order.query.get_or_404(order_id)
+    # FOR UPDATE (Postgres): anulación y cocina no pisan el estado (stock y totales)
+    order = Order.query.filter_by(id=order_id).with_for_update().first_or_404()
 
-    if order.cash_register_id != cr.id:
+    if order.cash_register_id != cr_id:
         return jsonify({"ok": False, "error": "Solo puedes anular pedidos de la caja abierta"}), 400
 
     st = (order.status or "").lower()
@@ -672,26 +1259,27 @@ def cancel_order(order_id):
     if st in (OrderStatus.DELIVERED.value, OrderStatus.CLOSED.value):
         return jsonify({"ok": False, "error": "No puedes anular un pedido entregado/cerrado"}), 400
 
-    # repone stock por items (solo si track_stock=True)
+    # repone stock por items (solo si track_stock=True), mismo UPDATE atómico que la venta
+    qty_by_pid = {}
     for it in (order.items or []):
-        p = Product.query.get(it.product_id)
-        if not p:
+        qty_by_pid[it.product_id] = qty_by_pid.get(it.product_id, Decimal("0")) + _dec(it.quantity, "0")
+
+    cost_by_pid = _apply_stock_deltas(qty_by_pid)
+
+    for it in (order.items or []):
+        if it.product_id not in cost_by_pid:
             continue
-        track = bool(getattr(p, "track_stock", True))
-        if track and hasattr(p, "stock_qty"):
-            p.stock_qty = _dec(p.stock_qty, "0") + _dec(it.quantity, "0")
-            unit_cost = _dec(getattr(p, "avg_cost", 0), "0")
-            db.session.add(StockMove(
-                product_id=p.id,
-                move_type=StockMoveType.RETURN.value,
-                qty_delta=_dec(it.quantity, "0"),
-                unit_cost=unit_cost,
-                ref_table="orders",
-                ref_id=order.id,
-                cash_register_id=cr.id,
-                created_by_id=current_user.id,
-                created_at=datetime.utcnow(),
-            ))
+        db.session.add(StockMove(
+            product_id=it.product_id,
+            move_type=StockMoveType.RETURN.value,
+            qty_delta=_dec(it.quantity, "0"),
+            unit_cost=_dec(cost_by_pid[it.product_id], "0"),
+            ref_table="orders",
+            ref_id=order.id,
+            cash_register_id=cr_id,
+            created_by_id=current_user.id,
+            created_at=datetime.utcnow(),
+        ))
 
     reason = (request.get_json(silent=True) or {}).get("reason")
     if reason:
@@ -700,10 +1288,10 @@ def cancel_order(order_id):
             prev = (order.notes or "").strip()
             order.notes = (prev + "\n" if prev else "") + f"[ANULADO] {reason}"
 
+    apply_register_deltas(order.cash_register_id, order_transition_deltas(order, OrderStatus.CANCELLED.value))
     order.status = OrderStatus.CANCELLED.value
-    db.session.commit()
-
-    return jsonify({"ok": True, "status": order.status})
+    emit("order_cancelled", {"id": order.id, "cash_register_id": order.cash_register_id})
+    return commit_response({"ok": True, "status": order.status})
 
 
 # ======================================================
@@ -713,12 +1301,13 @@ def cancel_order(order_id):
 @login_required
 def receipt(order_id):
     order = Order.query.get_or_404(order_id)
-    total = order.total_amount()
+    total = float(order.total_amount or 0)
 
-    business_name = get_setting("business_name", "POS Barra")
-    receipt_footer = get_setting("receipt_footer", "Gracias por su compra")
-    receipt_autoprint = get_setting("receipt_autoprint", "1")
-    qr_size = get_setting("qr_size", "120")
+    settings = get_settings()  # ✅ 1 snapshot en memoria (no 4 queries por ticket)
+    business_name = settings.get("business_name", "POS Barra")
+    receipt_footer = settings.get("receipt_footer", "Gracias por su compra")
+    receipt_autoprint = settings.get("receipt_autoprint", "1")
+    qr_size = settings.get("qr_size", "120")
 
     try:
         n = int(qr_size)
@@ -751,48 +1340,49 @@ def qr_order_status(order_id):
 @login_required
 @require_roles("admin", "cashier")
 def cash_summary():
-    from app.models import OrderStatus, PaymentMethod
+    from app.models import CashRegister
 
-    cr = get_open_cash_register()
-    if not cr:
+    cr_id = get_open_cash_register_id()
+    if not cr_id:
         return jsonify({"ok": True, "open": False, "summary": None})
 
-    q = Order.query.filter_by(cash_register_id=cr.id)
-
-    total_orders = q.count()
-    cancelled = q.filter(Order.status == OrderStatus.CANCELLED.value).count()
-    pending = q.filter(Order.status.in_([OrderStatus.PREP.value, OrderStatus.READY.value])).count()
-    delivered = q.filter(Order.status == OrderStatus.DELIVERED.value).count()
-    closed = q.filter(Order.status == OrderStatus.CLOSED.value).count()
-
-    orders_ok = q.filter(Order.status != OrderStatus.CANCELLED.value).all()
-
-    total_cash = Decimal("0")
-    total_transfer = Decimal("0")
-    total_sales = Decimal("0")
+    # ✅ totales en vivo: una sola fila (se mantienen al crear/anular/cambiar estado)
+    row = (
+        db.session.query(
+            CashRegister.total_cash,
+            CashRegister.total_transfer,
+            CashRegister.total_sales,
+            CashRegister.orders_prep,
+            CashRegister.orders_ready,
+            CashRegister.orders_delivered,
+            CashRegister.orders_cancelled,
+            CashRegister.orders_closed,
+        )
+        .filter(CashRegister.id == cr_id)
+        .first()
+    )
+    if row is None:
+        invalidate_open_cash_register()
+        return jsonify({"ok": True, "open": False, "summary": None})
 
-    for o in orders_ok:
-        for pay in (o.payments or []):
-            amt = _dec(pay.amount, "0")
-            if pay.method == PaymentMethod.CASH.value:
-                total_cash += amt
-            elif pay.method == PaymentMethod.TRANSFER.value:
-                total_transfer += amt
-            total_sales += amt
+    total_orders = (
+        row.orders_prep + row.orders_ready + row.orders_delivered
+        + row.orders_cancelled + row.orders_closed
+    )
 
     return jsonify({
         "ok": True,
         "open": True,
-        "cash_register_id": cr.id,
+        "cash_register_id": cr_id,
         "summary": {
-            "total_sales": float(total_sales),
-            "total_cash": float(total_cash),
-            "total_transfer": float(total_transfer),
+            "total_sales": float(row.total_sales or 0),
+            "total_cash": float(row.total_cash or 0),
+            "total_transfer": float(row.total_transfer or 0),
             "total_orders": int(total_orders),
-            "cancelled": int(cancelled),
-            "pending": int(pending),
-            "delivered": int(delivered),
-            "closed": int(closed),
+            "cancelled": int(row.orders_cancelled),
+            "pending": int(row.orders_prep + row.orders_ready),
+            "delivered": int(row.orders_delivered),
+            "closed": int(row.orders_closed),
         }
     })
 
@@ -831,12 +1421,24 @@ def inventory_items():
 @pos_bp.get("/ui")
 @login_required
 def pos_ui():
-    from app.models import Product
+    version = get_counter(CATALOG_COUNTER)
+    etag = f"ui-{_BOOT_ID}-{version}"
+
+    if request.if_none_match.contains(etag):
+        return _conditional(b"", etag, "text/html")
+
+    key = ("ui", version)
+    html = _catalog_cache.get(key)
+    if html is None:
+        from app.models import Product
+
+        products = (
+            Product.query
+            .filter_by(active=True)
+            .order_by(Product.category.asc(), Product.name.asc())
+            .all()
+        )
+        html = render_template("pos.html", products=products)
+        _catalog_cache.set(key, html)
 
-    products = (
-        Product.query
-        .filter_by(active=True)
-        .order_by(Product.category.asc(), Product.name.asc())
-        .all()
-    )
-    return render_template("pos.html", products=products)
\ No newline at end of file
+    return _conditional(html, etag, "text/html")
\ No newline at end of file
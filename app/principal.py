@@ -0,0 +1,102 @@
+import time
+
+from app.cache import TTLCache
+from app.counters import USERS_COUNTER, bump_counter, get_counter
+from app.extensions import db
+
+# Usuario logueado por proceso: evita cargar el usuario en cada request
+# (cocina hace polling cada 5s por pantalla). Las ediciones desde admin suben el
+# contador "users" en su misma transacción; cada worker lo revisa como mucho cada
+# PRINCIPAL_RECHECK_SECONDS (igual que settings), así rol / desactivación aplican
+# en todos los workers dentro de esa ventana sin una query por request.
+PRINCIPAL_TTL_SECONDS = 3600
+PRINCIPAL_RECHECK_SECONDS = 5
+
+_principal_cache = TTLCache(maxsize=256, ttl=PRINCIPAL_TTL_SECONDS)  # id -> (versión, principal)
+_users_version = (None, 0.0)  # (contador "users" conocido, cuándo se leyó)
+
+
+class UserPrincipal:
+    """
+    Versión liviana de User para current_user (lo que usan require_roles,
+    created_by_id y los templates). No es un objeto ORM: no se asigna a relaciones.
+    """
+    __slots__ = ("id", "username", "role", "is_active")
+
+    def __init__(self, id, username, role, is_active):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.is_active = bool(is_active)
+
+    # --- interfaz Flask-Login ---
+    @property
+    def is_authenticated(self):
+        return True
+
+    @property
+    def is_anonymous(self):
+        return False
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        return isinstance(other, UserPrincipal) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"<UserPrincipal {self.id} {self.username} ({self.role})>"
+
+
+def _current_version():
+    """Contador "users" de este worker; se relee de la base como mucho cada PRINCIPAL_RECHECK_SECONDS."""
+    global _users_version
+    version, checked_at = _users_version
+    if version is not None and time.monotonic() - checked_at < PRINCIPAL_RECHECK_SECONDS:
+        return version
+
+    version = get_counter(USERS_COUNTER)
+    _users_version = (version, time.monotonic())
+    return version
+
+
+def load_principal(user_id):
+    """Principal del usuario o None si no existe / está desactivado."""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    # el contador se lee ANTES que el usuario: una entrada nunca queda con versión más nueva que sus datos
+    version = _current_version()
+    cached = _principal_cache.get(user_id)
+    if cached is not None and cached[0] == version:
+        principal = cached[1]
+        return principal if principal.is_active else None
+
+    from app.models import User  # import local para evitar ciclos
+    row = (
+        db.session.query(User.id, User.username, User.role, User.is_active)
+        .filter(User.id == user_id)
+        .first()
+    )
+    if row is None:
+        return None
+
+    principal = UserPrincipal(row.id, row.username, row.role, row.is_active)
+    _principal_cache.set(user_id, (version, principal))
+    return principal if principal.is_active else None
+
+
+def invalidate_principal(user_id) -> None:
+    """
+    Llamar ANTES del commit de la edición: sube el contador "users" en la misma
+    transacción (los demás workers lo ven en su próxima revisión) y limpia este worker.
+    """
+    global _users_version
+    bump_counter(USERS_COUNTER)
+    _principal_cache.pop(int(user_id))
+    _users_version = (None, 0.0)
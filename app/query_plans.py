@@ -0,0 +1,120 @@
+import json
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, literal, select, tuple_
+
+from app.extensions import db
+
+# ======================================================
+# PLANES DE LAS CONSULTAS CALIENTES (flask check-query-plans)
+# ======================================================
+# Corre EXPLAIN de las consultas reales (mismo SQL que arma la app) y marca las que
+# recorren completa una tabla grande. En Postgres se desactiva enable_seqscan dentro
+# de la transacción: si igual sale "Seq Scan", no hay índice que sirva (no depende
+# de cuántas filas tenga la base donde se corre). tests/test_query_plans.py lo corre
+# sobre una base sembrada en cada cambio.
+HOT_TABLES = ("orders", "order_items", "payments", "stock_moves")
+
+_SQLITE_SCAN = re.compile(r"^SCAN (\w+)")
+
+
+def _hot_queries(cr_id):
+    """[(nombre, statement)] con los mismos filtros que usan reportes, cocina y caja."""
+    from app.models import Order, OrderStatus, StockMove, StockMoveType
+    from app.reports import ReportFilters, _raw_conditions, report_rows_select
+
+    today = datetime.utcnow().date()
+    f = ReportFilters(day_from=today - timedelta(days=7), day_to=today)
+    f_cash = f._replace(payment_method="cash")
+    since = datetime.utcnow() - timedelta(minutes=5)
+
+    return [
+        ("reportes: pedidos cerrados del rango",
+         select(Order.created_by_id, func.sum(Order.total_amount))
+         .where(*_raw_conditions(f)).group_by(Order.created_by_id)),
+        ("reportes: pedidos cerrados del rango, por método",
+         select(func.count(Order.id)).where(*_raw_conditions(f_cash))),
+        ("reportes: detalle paginado",
+         report_rows_select(f).order_by(Order.created_at.desc(), Order.id.desc()).limit(50)),
+        ("cocina: pedidos en preparación",
+         select(Order.id).where(Order.cash_register_id == cr_id, Order.status == OrderStatus.PREP.value)
+         .order_by(Order.created_at.asc())),
+        ("cocina: cambios desde cursor",
+         select(Order.id).where(
+             Order.cash_register_id == cr_id,
+             Order.status.in_([s.value for s in OrderStatus]),
+             tuple_(Order.updated_at, Order.id) > tuple_(literal(since), literal(0)),
+         ).order_by(Order.updated_at.asc(), Order.id.asc())),
+        ("caja: contadores por estado",
+         select(Order.status, func.count(Order.id)).where(Order.cash_register_id == cr_id).group_by(Order.status)),
+        ("cierre: pedidos pendientes",
+         select(Order.id).where(
+             Order.cash_register_id == cr_id,
+             Order.status.in_([OrderStatus.PREP.value, OrderStatus.READY.value]),
+         )),
+        ("cierre: COGS de la caja",
+         select(func.sum(StockMove.qty_delta)).where(
+             StockMove.cash_register_id == cr_id,
+             StockMove.move_type == StockMoveType.SALE.value,
+         )),
+    ]
+
+
+def _explain(conn, stmt, prefix):
+    """Ejecuta stmt con EXPLAIN antepuesto (mismos parámetros ya procesados por SQLAlchemy)."""
+    def _rewrite(conn_, cursor, statement, parameters, context, executemany):
+        return prefix + statement, parameters
+
+    event.listen(conn, "before_cursor_execute", _rewrite, retval=True)
+    try:
+        return conn.execute(stmt).fetchall()
+    finally:
+        event.remove(conn, "before_cursor_execute", _rewrite)
+
+
+def _pg_seq_scans(node, out):
+    if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") in HOT_TABLES:
+        out.append(node["Relation Name"])
+    for child in node.get("Plans") or []:
+        _pg_seq_scans(child, out)
+    return out
+
+
+def _sqlite_full_scans(rows):
+    out = []
+    for row in rows:
+        detail = row[-1]
+        m = _SQLITE_SCAN.match(detail)
+        if m and "USING" not in detail and m.group(1).startswith(HOT_TABLES):
+            out.append(m.group(1))
+    return out
+
+
+def check_query_plans(cr_id):
+    """[(nombre, tablas recorridas completas, plan en texto)] para cada consulta caliente."""
+    dialect = db.engine.dialect.name
+    results = []
+
+    with db.engine.connect() as conn:
+        for name, stmt in _hot_queries(cr_id):
+            trans = conn.begin()
+            try:
+                if dialect == "postgresql":
+                    conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+                    rows = _explain(conn, stmt, "EXPLAIN (FORMAT JSON) ")
+                    plan = rows[0][0]
+                    plan = json.loads(plan) if isinstance(plan, str) else plan
+                    scans = _pg_seq_scans(plan[0]["Plan"], [])
+                    text = json.dumps(plan[0]["Plan"], indent=1)
+                elif dialect == "sqlite":
+                    rows = _explain(conn, stmt, "EXPLAIN QUERY PLAN ")
+                    scans = _sqlite_full_scans(rows)
+                    text = "\n".join(str(r[-1]) for r in rows)
+                else:
+                    raise RuntimeError(f"Motor no soportado: {dialect}")
+            finally:
+                trans.rollback()
+            results.append((name, scans, text))
+
+    return results
@@ -0,0 +1,534 @@
+import json
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from typing import NamedTuple, Optional
+from zoneinfo import ZoneInfo
+
+from flask import current_app
+from sqlalchemy import case, exists, func, literal, select, tuple_, union_all
+from sqlalchemy.orm import aliased
+
+from app.cache import TTLCache
+from app.counters import REPORTS_COUNTER, ROLLUPS_COUNTER, get_counter, get_counters
+from app.extensions import db
+
+# ======================================================
+# REPORTES DE VENTAS (pedidos 'closed')
+# ======================================================
+# Cada serie es una consulta agrupada en SQL: cajas con rollup (app/rollups.py) desde
+# sales_daily*, el resto (la caja abierta) desde orders. Los días son del TIMEZONE
+# configurado; created_at se guarda en UTC naive.
+TOP_PRODUCTS_LIMIT = 7
+
+# Resumen (kpis + series) cacheado por filtros, ver report_summary()
+REPORT_CACHE_MAX_ENTRIES = 256
+REPORT_CACHE_MAX_BYTES = 8 * 1024 * 1024
+REPORT_CACHE_TTL_SECONDS = 24 * 3600
+
+_summary_cache = TTLCache(
+    maxsize=REPORT_CACHE_MAX_ENTRIES, ttl=REPORT_CACHE_TTL_SECONDS, maxbytes=REPORT_CACHE_MAX_BYTES
+)
+_opened_day_cache = TTLCache(maxsize=8, ttl=3600)  # caja -> día local de apertura
+
+
+class ReportFilters(NamedTuple):
+    day_from: date
+    day_to: date
+    payment_method: str = ""  # "" = todos
+    cash_register_id: Optional[int] = None
+    user_id: Optional[int] = None
+
+
+def report_tz() -> ZoneInfo:
+    return ZoneInfo(current_app.config.get("TIMEZONE") or "UTC")
+
+
+def local_day(created_at) -> Optional[date]:
+    """Día local (TIMEZONE) de un datetime UTC naive."""
+    if not created_at:
+        return None
+    return created_at.replace(tzinfo=timezone.utc).astimezone(report_tz()).date()
+
+
+def local_datetime(created_at):
+    return created_at.replace(tzinfo=timezone.utc).astimezone(report_tz()) if created_at else None
+
+
+def _utc_midnight(d: date) -> datetime:
+    """Medianoche local del día d, en UTC naive (para comparar contra created_at)."""
+    local = datetime.combine(d, time.min, tzinfo=report_tz())
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _parse_date(s: str):
+    try:
+        return datetime.strptime(s, "%Y-%m-%d").date()
+    except Exception:
+        return None
+
+
+def parse_report_filters(args) -> ReportFilters:
+    """from/to (YYYY-MM-DD, por defecto hoy), payment_method, cash_register_id, user_id."""
+    q_from = (args.get("from") or "").strip()
+    q_to = (args.get("to") or "").strip()
+    q_pm = (args.get("payment_method") or "").strip().lower()
+    q_cr = (args.get("cash_register_id") or "").strip()
+    q_user = (args.get("user_id") or "").strip()
+
+    d_from = _parse_date(q_from) if q_from else None
+    d_to = _parse_date(q_to) if q_to else None
+
+    # default hoy (en el TIMEZONE del local)
+    if not d_from and not d_to:
+        d_from = datetime.now(report_tz()).date()
+        d_to = d_from
+
+    if d_from and not d_to:
+        d_to = d_from
+    if d_to and not d_from:
+        d_from = d_to
+
+    return ReportFilters(
+        day_from=d_from,
+        day_to=d_to,
+        payment_method=q_pm,
+        cash_register_id=int(q_cr) if q_cr else None,
+        user_id=int(q_user) if q_user else None,
+    )
+
+
+def payment_label(pm: str) -> str:
+    pm = (pm or "").lower().strip()
+    if pm in ("cash", "efectivo"):
+        return "Efectivo"
+    if pm in ("transfer", "transferencia"):
+        return "Transferencia"
+    if pm in ("card", "tarjeta"):
+        return "Tarjeta"
+    if not pm:
+        return "Sin método"
+    return pm
+
+
+# ======================================================
+# Condiciones
+# ======================================================
+def order_conditions(f: ReportFilters) -> list:
+    """Pedidos 'closed' del rango (días locales) con los filtros del reporte."""
+    from app.models import Order, OrderStatus, Payment
+
+    conds = [
+        Order.status == OrderStatus.CLOSED.value,
+        Order.created_at >= _utc_midnight(f.day_from),
+        Order.created_at < _utc_midnight(f.day_to + timedelta(days=1)),
+    ]
+    if f.cash_register_id is not None:
+        conds.append(Order.cash_register_id == f.cash_register_id)
+    if f.user_id is not None:
+        conds.append(Order.created_by_id == f.user_id)
+    if f.payment_method:
+        pay = aliased(Payment)  # también se usa dentro de consultas que ya leen payments
+        conds.append(
+            exists()
+            .where(pay.order_id == Order.id, func.lower(pay.method) == f.payment_method)
+            .correlate(Order)
+        )
+    return conds
+
+
+def _rolled_registers():
+    from app.models import CashRegister
+    return select(CashRegister.id).where(CashRegister.rollup_at.is_not(None)).scalar_subquery()
+
+
+def _raw_conditions(f: ReportFilters) -> list:
+    """Como order_conditions pero solo cajas SIN rollup (esas se leen de sales_daily*)."""
+    from app.models import Order
+    return order_conditions(f) + [Order.cash_register_id.not_in(_rolled_registers())]
+
+
+def _rollup_conditions(model, f: ReportFilters) -> list:
+    from app.rollups import pay_key_has
+
+    conds = [model.day >= f.day_from, model.day <= f.day_to, model.cash_register_id.in_(_rolled_registers())]
+    if f.cash_register_id is not None:
+        conds.append(model.cash_register_id == f.cash_register_id)
+    if f.user_id is not None:
+        conds.append(model.user_id == f.user_id)
+    if f.payment_method:
+        conds.append(pay_key_has(model.pay_key, f.payment_method))
+    return conds
+
+
+def _local_day_label(column, f: ReportFilters):
+    """Expresión SQL 'YYYY-MM-DD' del día local de un timestamp UTC naive."""
+    tz = current_app.config.get("TIMEZONE") or "UTC"
+    if db.engine.dialect.name == "postgresql":
+        return func.to_char(func.timezone(tz, func.timezone("UTC", column)), "YYYY-MM-DD")
+
+    # otros motores (dev): tramos por medianoche local del rango (respeta cambios de horario)
+    whens = []
+    d = f.day_from
+    while d <= f.day_to:
+        whens.append((column < _utc_midnight(d + timedelta(days=1)), literal(d.strftime("%Y-%m-%d"))))
+        d += timedelta(days=1)
+    return case(*whens, else_=literal("—"))
+
+
+# ======================================================
+# KPIs + series
+# ======================================================
+def _open_register_day():
+    """Día local en que se abrió la caja abierta (None si no hay caja abierta)."""
+    from app.cash import get_open_cash_register_id
+    from app.models import CashRegister
+
+    cr_id = get_open_cash_register_id()
+    if cr_id is None:
+        return None
+
+    day = _opened_day_cache.get(cr_id)
+    if day is None:
+        opened_at = db.session.execute(select(CashRegister.opened_at).where(CashRegister.id == cr_id)).scalar()
+        day = local_day(opened_at) or datetime.now(report_tz()).date()
+        _opened_day_cache.set(cr_id, day)
+    return day
+
+
+def _summary_cache_key(f: ReportFilters):
+    """
+    Rango que termina antes del día en que se abrió la caja abierta (o antes de hoy si
+    no hay caja abierta): sus pedidos son de cajas cerradas y ya no cambian; solo cambia
+    lo que se lee de sales_daily* -> la clave lleva la versión "rollups" (sube al
+    recalcular un rollup: cierre de caja, flask rollup-sales --rebuild).
+    Si no, la clave lleva además la versión "reports" (sube al pasar pedidos a/desde
+    'closed' y al cerrar caja), así todos los workers dejan de usar el resumen viejo.
+    """
+    today = datetime.now(report_tz()).date()
+    open_day = _open_register_day()
+    frozen_before = min(open_day, today) if open_day else today
+
+    if f.day_to < frozen_before:
+        return ("frozen", get_counter(ROLLUPS_COUNTER), f)
+    return ("v", *get_counters(REPORTS_COUNTER, ROLLUPS_COUNTER), f)
+
+
+def report_cache_stats() -> dict:
+    return _summary_cache.stats()
+
+
+def report_summary(f: ReportFilters, user_names: dict) -> dict:
+    """kpis + series del reporte. Sale del cache si los filtros ya se calcularon con los mismos datos."""
+    key = _summary_cache_key(f)
+    data = _summary_cache.get(key)
+    if data is None:
+        data = _compute_summary(f)
+        _summary_cache.set(key, data, size=len(json.dumps(data)))
+
+    # el nombre del usuario top se resuelve aquí (el cache guarda el id)
+    top_user = {"name": "—", "detail": "—"}
+    if data["top_user"]:
+        uid, revenue = data["top_user"]
+        top_user = {"name": user_names.get(uid, f"User {uid}"), "detail": f"{revenue:,.0f} CLP"}
+
+    return {"kpis": {**data["kpis"], "top_user": top_user}, "series": data["series"]}
+
+
+def _compute_summary(f: ReportFilters) -> dict:
+    """kpis + series (4 consultas agrupadas). top_user = (user_id, ventas) o None."""
+    from app.models import Order, OrderItem, Payment, SalesDaily, SalesDailyPayment, SalesDailyProduct
+
+    raw = _raw_conditions(f)
+
+    # 1) total / cantidad / por día / por usuario
+    total_sales = Decimal("0")
+    orders_count = 0
+    by_day = {}
+    by_user = {}
+
+    day_label = _local_day_label(Order.created_at, f)
+    raw_daily = (
+        select(day_label, Order.created_by_id, func.count(Order.id), func.sum(Order.total_amount))
+        .where(*raw)
+        .group_by(day_label, Order.created_by_id)
+    )
+    rollup_daily = (
+        select(SalesDaily.day, SalesDaily.user_id, func.sum(SalesDaily.orders_count), func.sum(SalesDaily.revenue))
+        .where(*_rollup_conditions(SalesDaily, f))
+        .group_by(SalesDaily.day, SalesDaily.user_id)
+    )
+    for stmt in (rollup_daily, raw_daily):
+        for day, uid, n, revenue in db.session.execute(stmt).all():
+            revenue = Decimal(str(revenue or 0))
+            label = day.strftime("%Y-%m-%d") if hasattr(day, "strftime") else str(day)
+            total_sales += revenue
+            orders_count += int(n or 0)
+            by_day[label] = by_day.get(label, Decimal("0")) + revenue
+            if uid:
+                by_user[uid] = by_user.get(uid, Decimal("0")) + revenue
+
+    # 2) mix de pagos (si se filtra por método, solo ese método)
+    by_payment = {}
+    method = func.lower(func.trim(Payment.method))
+    raw_pay = select(method, func.sum(Payment.amount)).join(Order, Order.id == Payment.order_id).where(*raw)
+    rollup_pay = select(SalesDailyPayment.method, func.sum(SalesDailyPayment.amount)).where(
+        *_rollup_conditions(SalesDailyPayment, f)
+    )
+    if f.payment_method:
+        raw_pay = raw_pay.where(func.lower(Payment.method) == f.payment_method)
+        rollup_pay = rollup_pay.where(SalesDailyPayment.method == f.payment_method)
+    for stmt in (rollup_pay.group_by(SalesDailyPayment.method), raw_pay.group_by(method).order_by(method)):
+        for pm, amount in db.session.execute(stmt).all():
+            pm = pm or ""
+            by_payment[pm] = by_payment.get(pm, Decimal("0")) + Decimal(str(amount or 0))
+
+    # 3) top productos: rollup + orders en un solo GROUP BY ... LIMIT
+    lines = union_all(
+        select(SalesDailyProduct.product_name.label("name"), SalesDailyProduct.units.label("units"))
+        .where(*_rollup_conditions(SalesDailyProduct, f)),
+        select(OrderItem.product_name.label("name"), OrderItem.quantity.label("units"))
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(*raw),
+    ).subquery()
+    units = func.sum(lines.c.units)
+    top_products = [
+        {"label": name or "—", "value": int(n or 0)}
+        for name, n in db.session.execute(
+            select(lines.c.name, units)
+            .group_by(lines.c.name)
+            .order_by(units.desc(), lines.c.name.asc())
+            .limit(TOP_PRODUCTS_LIMIT)
+        ).all()
+    ]
+
+    avg_ticket = (total_sales / orders_count) if orders_count else Decimal("0")
+
+    top_user = None
+    if by_user:
+        top_uid = max(by_user, key=by_user.get)
+        top_user = (top_uid, float(by_user[top_uid]))
+
+    sales_by_day = [{"label": k, "value": float(v)} for k, v in sorted(by_day.items(), key=lambda x: x[0])]
+
+    sales_by_payment = []
+    for pm_key in ["cash", "transfer"]:
+        if pm_key in by_payment:
+            sales_by_payment.append({"label": payment_label(pm_key), "value": float(by_payment[pm_key])})
+    for pm_key, val in sorted(by_payment.items()):
+        if pm_key in ("cash", "transfer"):
+            continue
+        sales_by_payment.append({"label": payment_label(pm_key), "value": float(val)})
+
+    return {
+        "kpis": {
+            "total_sales": float(total_sales),
+            "orders_count": int(orders_count),
+            "avg_ticket": float(avg_ticket),
+        },
+        "top_user": top_user,
+        "series": {
+            "sales_by_day": sales_by_day,
+            "sales_by_payment": sales_by_payment,
+            "top_products": top_products,
+        },
+    }
+
+
+# ======================================================
+# Filas de detalle
+# ======================================================
+def report_rows_select(f: ReportFilters):
+    """SELECT de filas de detalle (1 fila por pedido, sin cargar objetos ORM)."""
+    from app.models import Order, Payment, User
+
+    payments_count = (
+        select(func.count(Payment.id)).where(Payment.order_id == Order.id).correlate(Order).scalar_subquery()
+    )
+    first_method = (
+        select(func.min(Payment.method)).where(Payment.order_id == Order.id).correlate(Order).scalar_subquery()
+    )
+    return (
+        select(
+            Order.id,
+            Order.created_at,
+            Order.cash_register_id,
+            Order.number_in_register,
+            Order.created_by_id,
+            Order.total_amount,
+            User.id.label("user_exists"),
+            User.username,
+            payments_count.label("payments_count"),
+            first_method.label("first_method"),
+        )
+        .outerjoin(User, User.id == Order.created_by_id)
+        .where(*order_conditions(f))
+    )
+
+
+def report_row_json(r) -> dict:
+    created = local_datetime(r.created_at)
+
+    pm_label = "Sin método"
+    if r.payments_count == 1:
+        pm_label = payment_label(r.first_method)
+    elif (r.payments_count or 0) > 1:
+        pm_label = "Mixto"
+
+    user = "-"
+    if r.user_exists is not None:
+        user = r.username or f"User {r.created_by_id}"
+
+    return {
+        "id": r.id,
+        "date": created.strftime("%Y-%m-%d %H:%M") if created else "—",
+        "cash_register": f"Caja #{r.cash_register_id} · #{r.number_in_register}",
+        "user": user,
+        "payment_method": pm_label,
+        "total": float(r.total_amount or 0),
+    }
+
+
+# ======================================================
+# Detalle paginado (keyset): orden por (created_at, id) o (total_amount, id)
+# ======================================================
+ROWS_PAGE_DEFAULT = 50
+ROWS_PAGE_MAX = 500
+ROW_SORTS = ("-date", "date", "-total", "total")
+
+
+def _sort_column(sort: str):
+    from app.models import Order
+    return Order.total_amount if sort.lstrip("-") == "total" else Order.created_at
+
+
+def _parse_row_cursor(sort: str, cursor: str):
+    """'<valor>_<id>' -> (valor, id); ValueError si no corresponde al orden pedido."""
+    value, _, oid = (cursor or "").rpartition("_")
+    if not value:
+        raise ValueError("cursor inválido")
+    if sort.lstrip("-") == "total":
+        try:
+            return Decimal(value), int(oid)
+        except ArithmeticError:
+            raise ValueError("cursor inválido")
+    return datetime.fromisoformat(value), int(oid)
+
+
+def _row_cursor(sort: str, r) -> str:
+    value = r.total_amount if sort.lstrip("-") == "total" else r.created_at.isoformat()
+    return f"{value}_{r.id}"
+
+
+def report_rows_page(f: ReportFilters, sort: str = "-date", limit: int = ROWS_PAGE_DEFAULT, cursor: str = ""):
+    """
+    Una página del detalle: (filas, next_cursor o None). Cada página es un
+    WHERE (col, id) < / > (cursor) ... LIMIT n: costo constante sin importar el rango.
+    """
+    from app.models import Order
+
+    if sort not in ROW_SORTS:
+        raise ValueError("sort inválido (-date | date | -total | total)")
+    limit = max(1, min(int(limit), ROWS_PAGE_MAX))
+
+    col = _sort_column(sort)
+    descending = sort.startswith("-")
+
+    stmt = report_rows_select(f)
+    if cursor:
+        value, oid = _parse_row_cursor(sort, cursor)
+        key = tuple_(col, Order.id)
+        stmt = stmt.where(key < tuple_(literal(value), literal(oid)) if descending else key > tuple_(literal(value), literal(oid)))
+
+    if descending:
+        stmt = stmt.order_by(col.desc(), Order.id.desc())
+    else:
+        stmt = stmt.order_by(col.asc(), Order.id.asc())
+
+    page = db.session.execute(stmt.limit(limit + 1)).all()
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    next_cursor = _row_cursor(sort, page[-1]) if has_more and page else None
+    return [report_row_json(r) for r in page], next_cursor
+
+
+# ======================================================
+# Export (XLSX / CSV): mismas condiciones, filas en streaming
+# ======================================================
+EXPORT_YIELD_PER = 2000
+
+EXPORT_SHEETS = {
+    "pedidos": ["Fecha", "Caja", "N° pedido", "Usuario", "Pago", "Unidades", "Total"],
+    "lineas": ["Fecha", "Caja", "N° pedido", "Usuario", "Producto", "Cantidad", "Precio unitario", "Subtotal"],
+    "pagos": ["Fecha", "Caja", "N° pedido", "Usuario", "Método", "Monto"],
+}
+
+
+def _stream(stmt):
+    """Filas con cursor del lado del servidor (Postgres), de a EXPORT_YIELD_PER."""
+    return db.session.execute(stmt.execution_options(yield_per=EXPORT_YIELD_PER))
+
+
+def _order_cols(r):
+    created = local_datetime(r.created_at)
+    return [
+        created.strftime("%Y-%m-%d %H:%M") if created else "",
+        f"Caja #{r.cash_register_id}",
+        r.number_in_register,
+        (r.username or f"User {r.created_by_id}") if r.user_exists is not None else "",
+    ]
+
+
+def _export_orders(f: ReportFilters):
+    from app.models import Order
+
+    stmt = report_rows_select(f).add_columns(Order.items_count).order_by(Order.created_at.asc(), Order.id.asc())
+    for r in _stream(stmt):
+        row = report_row_json(r)
+        yield _order_cols(r) + [row["payment_method"], int(r.items_count or 0), Decimal(str(r.total_amount or 0))]
+
+
+def _export_lines(f: ReportFilters):
+    from app.models import Order, OrderItem, User
+
+    stmt = (
+        select(
+            Order.created_at, Order.cash_register_id, Order.number_in_register, Order.created_by_id,
+            User.id.label("user_exists"), User.username,
+            OrderItem.product_name, OrderItem.quantity, OrderItem.unit_price,
+        )
+        .join(Order, Order.id == OrderItem.order_id)
+        .outerjoin(User, User.id == Order.created_by_id)
+        .where(*order_conditions(f))
+        .order_by(Order.created_at.asc(), Order.id.asc(), OrderItem.id.asc())
+    )
+    for r in _stream(stmt):
+        price = Decimal(str(r.unit_price or 0))
+        qty = int(r.quantity or 0)
+        yield _order_cols(r) + [r.product_name or "", qty, price, price * qty]
+
+
+def _export_payments(f: ReportFilters):
+    from app.models import Order, Payment, User
+
+    stmt = (
+        select(
+            Order.created_at, Order.cash_register_id, Order.number_in_register, Order.created_by_id,
+            User.id.label("user_exists"), User.username,
+            Payment.method, Payment.amount,
+        )
+        .join(Order, Order.id == Payment.order_id)
+        .outerjoin(User, User.id == Order.created_by_id)
+        .where(*order_conditions(f))
+        .order_by(Order.created_at.asc(), Order.id.asc(), Payment.id.asc())
+    )
+    for r in _stream(stmt):
+        yield _order_cols(r) + [payment_label(r.method), Decimal(str(r.amount or 0))]
+
+
+_EXPORT_ROWS = {"pedidos": _export_orders, "lineas": _export_lines, "pagos": _export_payments}
+
+
+def export_sheet(name: str, f: ReportFilters):
+    """(encabezados, generador de filas) de una hoja del export."""
+    return EXPORT_SHEETS[name], _EXPORT_ROWS[name](f)
@@ -0,0 +1,131 @@
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import delete, insert, literal, select, update
+
+from app.extensions import db
+
+# ======================================================
+# ROLLUPS DE VENTAS POR DÍA (sales_daily, sales_daily_payments, sales_daily_products)
+# ======================================================
+# Al cerrar caja sus pedidos quedan en estado final: se agregan una vez por
+# (día, caja, usuario, pay_key[, método | producto]) y reportes lee esas filas.
+# Cajas con rollup_at NULL (la abierta, o antiguas sin backfill) se leen desde orders.
+# Los pedidos de una caja cerrada ya no cambian: ventas, anulación y cocina bloquean la
+# fila de la caja abierta (cash.lock_open_register) y el cierre espera a que terminen.
+
+
+def order_day(created_at):
+    """Día de reporte de un pedido: día local (Config.TIMEZONE), igual que el filtro from/to."""
+    from app.reports import local_day
+    return local_day(created_at)
+
+
+def pay_key(methods) -> str:
+    """Métodos de pago distintos del pedido, ordenados: "cash", "cash+transfer", "" (sin pagos)."""
+    return "+".join(sorted({(m or "").lower().strip() for m in methods if (m or "").strip()}))
+
+
+def pay_key_has(column, method):
+    """Condición SQL: el pay_key incluye ese método."""
+    return (literal("+").concat(column).concat("+")).contains(f"+{method}+", autoescape=True)
+
+
+def _add(bucket, key, **values):
+    row = bucket.setdefault(key, {k: 0 for k in values})
+    for k, v in values.items():
+        row[k] += v
+
+
+def build_register_rollup(cash_register_id) -> int:
+    """
+    (Re)calcula las filas de rollup de la caja desde sus pedidos 'closed' y marca
+    cash_registers.rollup_at. Sube el contador "rollups" (los reportes cacheados de días
+    pasados dependen de él). No hace commit. Retorna la cantidad de pedidos agregados.
+    """
+    from app.models import (
+        CashRegister, Order, OrderItem, OrderStatus, Payment,
+        SalesDaily, SalesDailyPayment, SalesDailyProduct,
+    )
+
+    for model in (SalesDaily, SalesDailyPayment, SalesDailyProduct):
+        db.session.execute(delete(model).where(model.cash_register_id == cash_register_id))
+
+    closed = (Order.cash_register_id == cash_register_id, Order.status == OrderStatus.CLOSED.value)
+
+    # 3 lecturas (pedidos, pagos, líneas) y el resto en memoria: O(pedidos de la caja), una sola vez
+    orders = db.session.execute(
+        select(Order.id, Order.created_at, Order.created_by_id, Order.total_amount, Order.items_count)
+        .where(*closed, Order.created_at.is_not(None))
+    ).all()
+    if not orders:
+        _mark_rolled_up(CashRegister, cash_register_id)
+        return 0
+
+    payments_by_order = {}
+    for order_id, method, amount in db.session.execute(
+        select(Payment.order_id, Payment.method, Payment.amount)
+        .join(Order, Order.id == Payment.order_id)
+        .where(*closed)
+    ).all():
+        payments_by_order.setdefault(order_id, []).append(((method or "").lower().strip(), amount))
+
+    items_by_order = {}
+    for order_id, name, qty, unit_price in db.session.execute(
+        select(OrderItem.order_id, OrderItem.product_name, OrderItem.quantity, OrderItem.unit_price)
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(*closed)
+    ).all():
+        items_by_order.setdefault(order_id, []).append((name or "—", int(qty or 0), unit_price))
+
+    daily, by_method, by_product = {}, {}, {}
+    for o in orders:
+        pays = payments_by_order.get(o.id, [])
+        key = (order_day(o.created_at), o.created_by_id, pay_key(m for m, _ in pays))
+
+        _add(daily, key, orders_count=1, units=int(o.items_count or 0), revenue=Decimal(str(o.total_amount or 0)))
+
+        amounts = {}
+        for method, amount in pays:
+            if method:
+                amounts[method] = amounts.get(method, Decimal("0")) + Decimal(str(amount or 0))
+        for method, amount in amounts.items():
+            _add(by_method, key + (method,), orders_count=1, amount=amount)
+
+        lines = {}
+        for name, qty, unit_price in items_by_order.get(o.id, []):
+            units, revenue = lines.get(name, (0, Decimal("0")))
+            lines[name] = (units + qty, revenue + Decimal(str(unit_price or 0)) * qty)
+        for name, (units, revenue) in lines.items():
+            _add(by_product, key + (name,), orders_count=1, units=units, revenue=revenue)
+
+    def rows(bucket, extra=None):
+        out = []
+        for key, values in bucket.items():
+            day, user_id, pk = key[:3]
+            row = {"day": day, "cash_register_id": cash_register_id, "user_id": user_id, "pay_key": pk, **values}
+            if extra:
+                row[extra] = key[3]
+            out.append(row)
+        return out
+
+    db.session.execute(insert(SalesDaily), rows(daily))
+    if by_method:
+        db.session.execute(insert(SalesDailyPayment), rows(by_method, "method"))
+    if by_product:
+        db.session.execute(insert(SalesDailyProduct), rows(by_product, "product_name"))
+
+    _mark_rolled_up(CashRegister, cash_register_id)
+    return len(orders)
+
+
+def _mark_rolled_up(CashRegister, cash_register_id) -> None:
+    from app.counters import ROLLUPS_COUNTER, bump_counter
+
+    bump_counter(ROLLUPS_COUNTER)
+    db.session.execute(
+        update(CashRegister)
+        .where(CashRegister.id == cash_register_id)
+        .values(rollup_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
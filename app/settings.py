@@ -0,0 +1,75 @@
+import time
+from types import MappingProxyType
+
+from app.counters import SETTINGS_COUNTER, bump_counter, get_counter
+from app.extensions import db
+
+# Snapshot de app_settings por proceso: (version, dict inmutable).
+# Se recarga entero (1 query) cuando cambia el contador "settings"; la versión
+# se revisa como mucho cada SETTINGS_RECHECK_SECONDS (cubre a los otros workers).
+SETTINGS_RECHECK_SECONDS = 5
+
+_snapshot = (None, MappingProxyType({}))
+_checked_at = 0.0
+
+
+def _load_all():
+    from app.models import AppSetting  # import local para evitar ciclos
+    rows = db.session.query(AppSetting.key, AppSetting.value).all()
+    return MappingProxyType({k: v for k, v in rows if v is not None})
+
+
+def _install(version, values) -> None:
+    global _snapshot, _checked_at
+    _snapshot = (version, values)
+    _checked_at = time.monotonic()
+
+
+def get_settings():
+    """Todas las settings (dict de solo lectura). Sin query si el snapshot está vigente."""
+    global _checked_at
+    version, values = _snapshot
+    if version is not None and time.monotonic() - _checked_at < SETTINGS_RECHECK_SECONDS:
+        return values
+
+    current = get_counter(SETTINGS_COUNTER)
+    if current == version:
+        _checked_at = time.monotonic()
+        return values
+
+    values = _load_all()
+    _install(current, values)
+    return values
+
+
+def get_setting(key: str, default: str = "") -> str:
+    return get_settings().get(key, default)
+
+
+def set_settings(values: dict) -> None:
+    """Guarda varias settings en UNA transacción e invalida el snapshot de todos los workers."""
+    from app.models import AppSetting
+
+    if not values:
+        return
+
+    existing = {
+        s.key: s
+        for s in AppSetting.query.filter(AppSetting.key.in_(list(values))).all()
+    }
+    for key, value in values.items():
+        s = existing.get(key)
+        if not s:
+            db.session.add(AppSetting(key=key, value=value))
+        else:
+            s.value = value
+
+    version = bump_counter(SETTINGS_COUNTER)
+    db.session.commit()
+
+    # ✅ este worker ve el cambio al instante
+    _install(version, _load_all())
+
+
+def set_setting(key: str, value: str) -> None:
+    set_settings({key: value})
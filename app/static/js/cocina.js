@@ -5,6 +5,13 @@ document.addEventListener("DOMContentLoaded", () => {
   const lastUpdateBadge = document.getElementById("lastUpdateBadge");
   const btnRefresh = document.getElementById("btnRefresh");
 
+  // ✅ Selección múltiple (marcar LISTO en lote)
+  const bulkBar = document.getElementById("bulkBar");
+  const bulkCount = document.getElementById("bulkCount");
+  const btnBulkReady = document.getElementById("btnBulkReady");
+  const btnSelectAll = document.getElementById("btnSelectAll");
+  const seleccionados = new Set();
+
   // ✅ Resumen UI
   const resumenGrid = document.getElementById("resumenGrid");
   const resumenTotal = document.getElementById("resumenTotal");
@@ -68,7 +75,12 @@ document.addEventListener("DOMContentLoaded", () => {
       <div class="col-12 col-md-6 col-xl-4">
         <div class="card shadow-sm border-0">
           <div class="card-header bg-white d-flex justify-content-between align-items-center">
-            <div class="fw-bold">#${p.numero ?? p.id} <span class="text-muted fw-normal ms-2 small">${p.hora || ""}</span></div>
+            <div class="fw-bold">
+              ${estado === "EN_PREPARACION"
+                ? `<input type="checkbox" class="form-check-input me-2" data-select="${p.id}" ${seleccionados.has(p.id) ? "checked" : ""}>`
+                : ""}
+              #${p.numero ?? p.id} <span class="text-muted fw-normal ms-2 small">${p.hora || ""}</span>
+            </div>
             ${badge(estado)}
           </div>
           <div class="card-body">
@@ -86,7 +98,48 @@ document.addEventListener("DOMContentLoaded", () => {
     `;
   }
 
+  // ✅ Estado local (stream): id -> tarjeta EN_PREPARACION
+  const pedidosById = new Map();
+
+  function pedidosOrdenados() {
+    return [...pedidosById.values()].sort((a, b) => a.id - b.id);
+  }
+
+  // Resumen calculado con las tarjetas en pantalla (mismo formato que /cocina/api/resumen)
+  function resumenLocal(pedidos) {
+    const porProducto = new Map();
+    pedidos.forEach(p => (p.items || []).forEach(i => {
+      porProducto.set(i.producto, (porProducto.get(i.producto) || 0) + (i.qty || 0));
+    }));
+    const items = [...porProducto.entries()]
+      .map(([producto, qty]) => ({ producto, qty }))
+      .sort((a, b) => b.qty - a.qty);
+    return { items, total: items.reduce((acc, i) => acc + i.qty, 0) };
+  }
+
+  function renderLocal() {
+    const pedidos = pedidosOrdenados();
+    render(pedidos);
+    const r = resumenLocal(pedidos);
+    renderResumen(r.items, r.total);
+    lastUpdateBadge.textContent = "Actualizado: " + now();
+  }
+
+  function renderSeleccion(pedidos) {
+    // solo quedan seleccionados los que siguen EN_PREPARACION en pantalla
+    const enPrep = new Set((pedidos || [])
+      .filter(p => (p.estado || "").toUpperCase() === "EN_PREPARACION")
+      .map(p => p.id));
+    [...seleccionados].forEach(id => { if (!enPrep.has(id)) seleccionados.delete(id); });
+
+    if (!bulkBar) return;
+    bulkBar.classList.toggle("d-none", enPrep.size === 0);
+    bulkCount.textContent = seleccionados.size;
+    btnBulkReady.disabled = seleccionados.size === 0;
+  }
+
   function render(pedidos) {
+    renderSeleccion(pedidos);
     if (!pedidos || pedidos.length === 0) {
       grid.innerHTML = "";
       emptyState.classList.remove("d-none");
@@ -127,49 +180,39 @@ document.addEventListener("DOMContentLoaded", () => {
     });
   }
 
-  async function cargarResumen() {
-    try {
-      // OJO: tu blueprint está montado en /cocina/, por eso usamos /cocina/api/...
-      const res = await fetch("/cocina/api/resumen", { headers: { "Accept": "application/json" } });
-      if (!res.ok) throw new Error("HTTP " + res.status);
-
-      const data = await res.json();
-      if (!data.ok) return;
-
-      renderResumen(data.items || [], data.total_unidades || 0);
-    } catch (e) {
-      // Si falla resumen, no queremos tumbar la cocina
-      console.warn("Resumen no disponible:", e);
-      renderResumen([], 0);
-    }
-  }
-
   // =========================
   // Carga principal
   // =========================
+  // Cursor del último delta (null = pedir lista completa)
+  let cursor = null;
+
   async function cargar() {
     try {
-      connStatus.textContent = "Cargando...";
-
-      // Pedidos + resumen en paralelo
-      const [pedidosRes] = await Promise.all([
-        fetch("/cocina/api/pedidos", { headers: { "Accept": "application/json" } }),
-        cargarResumen()
-      ]);
+      const url = cursor ? `/cocina/api/pedidos?since=${encodeURIComponent(cursor)}` : "/cocina/api/pedidos";
+      const res = await fetch(url, { headers: { "Accept": "application/json" } });
+      if (!res.ok) throw new Error("HTTP " + res.status);
 
-      if (!pedidosRes.ok) throw new Error("HTTP " + pedidosRes.status);
+      const data = await res.json();
 
-      const data = await pedidosRes.json();
-      render(data.pedidos || []);
+      // lista completa (primera vez / cambió la caja) o solo cambios
+      if (data.full !== false) pedidosById.clear();
+      (data.removed || []).forEach(id => pedidosById.delete(id));
+      (data.pedidos || []).forEach(p => pedidosById.set(p.id, p));
+      cursor = data.cursor || null;
 
-      lastUpdateBadge.textContent = "Actualizado: " + now();
-      connStatus.textContent = "OK";
+      renderLocal();
+      connStatus.textContent = data.warning || "OK";
     } catch (e) {
       console.error(e);
       connStatus.textContent = "Error / sin conexión";
     }
   }
 
+  function recargar() {
+    cursor = null;
+    return cargar();
+  }
+
   async function cambiarEstado(id, estado) {
     const res = await fetch(`/cocina/api/pedidos/${id}/estado`, {
       method: "POST",
@@ -183,10 +226,57 @@ document.addEventListener("DOMContentLoaded", () => {
       return;
     }
 
-    // recargar lista y resumen
-    await cargar();
+    // en vivo: el stream trae el cambio; sin stream, recargar lista y resumen
+    if (!stream) await cargar();
+  }
+
+  async function marcarListoLote() {
+    const ids = [...seleccionados];
+    if (ids.length === 0) return;
+
+    btnBulkReady.disabled = true;
+    try {
+      const res = await fetch("/cocina/api/pedidos/estado", {
+        method: "POST",
+        headers: { "Content-Type": "application/json", "Accept": "application/json" },
+        body: JSON.stringify({ ids, estado: "LISTO" })
+      });
+      const j = await res.json().catch(() => ({}));
+      if (!res.ok || !j.ok) {
+        alert(j.error || `No se pudo cambiar estado (HTTP ${res.status})`);
+        return;
+      }
+
+      seleccionados.clear();
+      const fallidos = (j.results || []).filter(r => !r.ok);
+      if (fallidos.length) {
+        alert("No se movieron:\n" + fallidos.map(r => `#${pedidosById.get(r.id)?.numero ?? r.id}: ${r.error}`).join("\n"));
+      }
+    } finally {
+      // en vivo: el stream trae los cambios; sin stream, recargar
+      if (!stream) await cargar();
+      else renderLocal();
+    }
   }
 
+  grid.addEventListener("change", (e) => {
+    const chk = e.target.closest("input[data-select]");
+    if (!chk) return;
+    const id = Number(chk.getAttribute("data-select"));
+    if (chk.checked) seleccionados.add(id);
+    else seleccionados.delete(id);
+    renderSeleccion(pedidosOrdenados());
+  });
+
+  btnSelectAll?.addEventListener("click", () => {
+    const enPrep = pedidosOrdenados().filter(p => (p.estado || "").toUpperCase() === "EN_PREPARACION");
+    const todos = enPrep.length > 0 && enPrep.every(p => seleccionados.has(p.id));
+    enPrep.forEach(p => (todos ? seleccionados.delete(p.id) : seleccionados.add(p.id)));
+    renderLocal();
+  });
+
+  btnBulkReady?.addEventListener("click", marcarListoLote);
+
   grid.addEventListener("click", async (e) => {
     const btn = e.target.closest("button[data-action]");
     if (!btn) return;
@@ -203,8 +293,51 @@ document.addEventListener("DOMContentLoaded", () => {
     btn.disabled = false;
   });
 
-  btnRefresh?.addEventListener("click", cargar);
+  // =========================
+  // ✅ En vivo (SSE): snapshot al conectar + upsert/remove por pedido
+  // =========================
+  let stream = null;
+
+  function conectar() {
+    if (stream) stream.close();
+    connStatus.textContent = "Conectando...";
+    stream = new EventSource("/cocina/api/stream");
+
+    stream.addEventListener("snapshot", (e) => {
+      const data = JSON.parse(e.data);
+      pedidosById.clear();
+      (data.pedidos || []).forEach(p => pedidosById.set(p.id, p));
+      renderLocal();
+      connStatus.textContent = data.warning || "En vivo";
+    });
+
+    stream.addEventListener("upsert", (e) => {
+      const p = JSON.parse(e.data);
+      pedidosById.set(p.id, p);
+      renderLocal();
+    });
+
+    stream.addEventListener("remove", (e) => {
+      const { id } = JSON.parse(e.data);
+      if (pedidosById.delete(id)) renderLocal();
+    });
+
+    // cambió la caja o se perdieron eventos: snapshot nuevo
+    stream.addEventListener("resync", conectar);
+
+    stream.onerror = () => {
+      // EventSource reintenta solo (retry: 2000)
+      connStatus.textContent = "Error / sin conexión";
+    };
+  }
 
-  cargar();
-  setInterval(cargar, 5000);
+  if (window.EventSource) {
+    btnRefresh?.addEventListener("click", conectar);
+    conectar();
+  } else {
+    // navegador sin SSE: polling de cambios (delta con cursor)
+    btnRefresh?.addEventListener("click", recargar);
+    cargar();
+    setInterval(cargar, 5000);
+  }
 });
\ No newline at end of file
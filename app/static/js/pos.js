@@ -1,7 +1,7 @@
 /* =========================================================
    POS.JS (FULL - limpio y estable)
    - Correlativo por caja: number_in_register en historial
-   - Historial: primer item + (+N)
+   - Historial: primer item + (+N), scroll infinito (cursor before_id)
    - Estados: prep/ready/delivered/closed/cancelled
    - Abrir/Cerrar caja: MODALES con conteo inicial/final
    - Evita redeclare / handlers duplicados
@@ -9,6 +9,9 @@
    - Anular pedido real: POST /pos/orders/<id>/cancel
    - ✅ REGLAS PAGO: cash/transfer requieren paid >= total
    - ✅ Vuelto: paid - total (cash/transfer)
+   - ✅ Idempotency-Key en ventas/caja/anulación (reintentos sin duplicar)
+   - ✅ Offline: ventas en cola (localStorage) + sync en lote /pos/orders/sync
+   - ✅ Catálogo con ETag (304) + stock aparte (/pos/products/stock?since=)
    ========================================================= */
 
 (() => {
@@ -19,6 +22,16 @@
   let total = 0;
   let currentDetailOrderId = null;
   let cashIsOpen = false;
+  let pendingOrderKey = null; // Idempotency-Key de la venta en curso (se reusa si se reintenta)
+  let syncing = false;
+  const stockById = new Map(); // product_id -> stock_qty (solo productos con control de stock)
+  let stockAsOf = null;        // cursor "since" del último /pos/products/stock
+
+  /* ================== OFFLINE (localStorage) ================== */
+  const OFFLINE_QUEUE_KEY = "pos_offline_queue";
+  const PRODUCTS_CACHE_KEY = "pos_products_cache";
+  const CASH_OPEN_KEY = "pos_cash_open";
+  const SYNC_BATCH = 50;
 
   /* ================== DOM SAFE GET ================== */
   const $ = (id) => document.getElementById(id);
@@ -45,6 +58,7 @@
 
   const cashStatusBadge = $("cashStatusBadge");
   const cashStatusInfo = $("cashStatusInfo");
+  const offlineQueueBadge = $("offlineQueueBadge");
 
   /* Modal ABRIR */
   const openCashModal = $("openCashModal");
@@ -152,12 +166,28 @@
     return items;
   }
 
-  async function postJSON(url, payload) {
-    const res = await fetch(url, {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify(payload || {}),
-    });
+  function newIdempotencyKey() {
+    if (window.crypto?.randomUUID) return crypto.randomUUID();
+    return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+  }
+
+  // idemKey: si viene, se manda como Idempotency-Key y se reintenta (misma key)
+  // cuando falla la red; el backend devuelve la respuesta guardada sin duplicar.
+  async function postJSON(url, payload, idemKey = null) {
+    const headers = { "Content-Type": "application/json" };
+    if (idemKey) headers["Idempotency-Key"] = idemKey;
+
+    let res = null;
+    for (let attempt = 0; ; attempt++) {
+      try {
+        res = await fetch(url, { method: "POST", headers, body: JSON.stringify(payload || {}) });
+        break;
+      } catch (err) {
+        if (!idemKey || attempt >= 2) throw err;
+        await new Promise((r) => setTimeout(r, 800 * (attempt + 1)));
+      }
+    }
+
     const data = await res.json().catch(() => ({}));
     if (!res.ok || data.ok === false) {
       throw new Error(data.error || data.message || `Error HTTP ${res.status}`);
@@ -285,32 +315,82 @@
   function loadProducts() {
     if (!productsEl) return;
 
+    // el navegador revalida con If-None-Match: si el catálogo no cambió, responde 304 (cache)
     fetch("/pos/products")
       .then((r) => r.json())
       .then((data) => {
-        productsEl.innerHTML = "";
+        try { localStorage.setItem(PRODUCTS_CACHE_KEY, JSON.stringify(data || [])); } catch {}
+        renderProducts(data);
+      })
+      .catch((e) => {
+        // sin conexión: usamos el último catálogo conocido
+        console.error("Error productos:", e);
+        try { renderProducts(JSON.parse(localStorage.getItem(PRODUCTS_CACHE_KEY) || "[]")); } catch {}
+      });
+  }
 
-        (data || []).forEach((p) => {
-          const col = document.createElement("div");
-          col.className = "col-md-4 position-relative";
+  function renderProducts(data) {
+    productsEl.innerHTML = "";
 
-          const btn = document.createElement("button");
-          btn.type = "button";
-          btn.className = "btn btn-primary w-100 product-btn";
-          btn.style.height = "120px";
-          btn.style.fontSize = "22px";
-          btn.innerText = `${p.name}\n$${money(p.price)}`;
-          btn.dataset.id = p.id;
+    (data || []).forEach((p) => {
+      const col = document.createElement("div");
+      col.className = "col-md-4 position-relative";
 
-          btn.onclick = () => addProduct({ id: p.id, name: p.name, price: money(p.price) });
+      const btn = document.createElement("button");
+      btn.type = "button";
+      btn.className = "btn btn-primary w-100 product-btn";
+      btn.style.height = "120px";
+      btn.style.fontSize = "22px";
+      btn.innerText = `${p.name}\n$${money(p.price)}`;
+      btn.dataset.id = p.id;
+      btn.dataset.trackStock = p.track_stock ? "1" : "0";
 
-          col.appendChild(btn);
-          productsEl.appendChild(col);
-        });
+      btn.onclick = () => addProduct({ id: p.id, name: p.name, price: money(p.price) });
+
+      col.appendChild(btn);
+      productsEl.appendChild(col);
+    });
 
-        updateProductButtons();
+    updateProductButtons();
+    renderStock();
+    loadStock();
+  }
+
+  /* ================== STOCK (liviano, separado del catálogo) ================== */
+  function loadStock() {
+    const url = stockAsOf ? `/pos/products/stock?since=${encodeURIComponent(stockAsOf)}` : "/pos/products/stock";
+
+    return fetch(url)
+      .then((r) => r.json())
+      .then((data) => {
+        if (!data?.ok) return;
+        (data.items || []).forEach((it) => stockById.set(String(it.id), Number(it.stock_qty || 0)));
+        stockAsOf = data.as_of || stockAsOf;
+        renderStock();
       })
-      .catch((e) => console.error("Error productos:", e));
+      .catch(() => {}); // sin conexión: se mantiene el último stock conocido
+  }
+
+  function renderStock() {
+    document.querySelectorAll(".product-btn").forEach((btn) => {
+      if (btn.dataset.trackStock !== "1") return;
+
+      const qty = stockById.get(String(btn.dataset.id));
+      const soldOut = qty !== undefined && qty <= 0;
+      btn.disabled = soldOut;
+      btn.classList.toggle("btn-secondary", soldOut);
+      btn.classList.toggle("btn-primary", !soldOut);
+
+      let tag = btn.parentElement.querySelector(".product-soldout");
+      if (soldOut && !tag) {
+        tag = document.createElement("div");
+        tag.className = "product-soldout badge bg-danger position-absolute top-0 start-0 m-2";
+        tag.innerText = "Agotado";
+        btn.parentElement.appendChild(tag);
+      } else if (!soldOut && tag) {
+        tag.remove();
+      }
+    });
   }
 
   /* ================== COBRAR Y ENVIAR ================== */
@@ -333,23 +413,107 @@
       },
     };
 
-    fetch("/pos/orders", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify(payload),
-    })
-      .then(async (r) => {
-        const data = await r.json().catch(() => ({}));
-        if (!r.ok || !data.ok) throw new Error(data.error || "No se pudo guardar el pedido");
-        return data;
-      })
-      .then(() => {
-        try { successSound?.play(); } catch {}
-        resetCurrentOrderUI();
-        cargarHistorial();
-        referenceNameEl?.focus();
-      })
-      .catch((e) => alert(e.message || "Error al cobrar"));
+    // misma key mientras no haya respuesta del servidor (evita venta duplicada si se corta el Wi-Fi)
+    if (!pendingOrderKey) pendingOrderKey = newIdempotencyKey();
+
+    if (!navigator.onLine) {
+      enqueueOrder(pendingOrderKey, payload);
+      onOrderSaved();
+      return;
+    }
+
+    postJSON("/pos/orders", payload, pendingOrderKey)
+      .then(() => onOrderSaved())
+      .catch((e) => {
+        // error de red (TypeError): queda en cola con la MISMA key; si el servidor
+        // alcanzó a guardarla, el sync devuelve esa venta en vez de duplicarla
+        if (e instanceof TypeError) {
+          enqueueOrder(pendingOrderKey, payload);
+          onOrderSaved();
+          return;
+        }
+        pendingOrderKey = null;
+        alert(e.message || "Error al cobrar");
+      });
+  }
+
+  function onOrderSaved() {
+    pendingOrderKey = null;
+    try { successSound?.play(); } catch {}
+    resetCurrentOrderUI();
+    cargarHistorial();
+    loadStock();
+    referenceNameEl?.focus();
+  }
+
+  /* ================== COLA OFFLINE + SYNC ================== */
+  function readQueue() {
+    try {
+      return JSON.parse(localStorage.getItem(OFFLINE_QUEUE_KEY) || "[]");
+    } catch {
+      return [];
+    }
+  }
+
+  function writeQueue(queue) {
+    localStorage.setItem(OFFLINE_QUEUE_KEY, JSON.stringify(queue));
+    renderQueueBadge(queue);
+  }
+
+  function enqueueOrder(clientId, payload) {
+    const queue = readQueue();
+    if (!queue.some((o) => o.client_id === clientId)) {
+      queue.push({ ...payload, client_id: clientId, created_at: new Date().toISOString() });
+    }
+    writeQueue(queue);
+  }
+
+  function renderQueueBadge(queue = readQueue()) {
+    if (!offlineQueueBadge) return;
+    const rejected = queue.filter((o) => o.error);
+
+    offlineQueueBadge.className = rejected.length ? "badge bg-danger ms-2" : "badge bg-warning text-dark ms-2";
+    offlineQueueBadge.classList.toggle("d-none", queue.length === 0);
+    offlineQueueBadge.innerText = rejected.length
+      ? `📡 ${queue.length} sin enviar (${rejected.length} con error)`
+      : `📡 ${queue.length} sin enviar`;
+    offlineQueueBadge.title = rejected.map((o) => `${o.reference_name}: ${o.error}`).join("\n");
+  }
+
+  async function flushQueue() {
+    if (syncing || !navigator.onLine) return;
+
+    const queue = readQueue();
+    if (queue.length === 0) return;
+
+    // primero las que nunca fallaron (las rechazadas no deben tapar a las nuevas)
+    const batch = [...queue.filter((o) => !o.error), ...queue.filter((o) => o.error)].slice(0, SYNC_BATCH);
+
+    syncing = true;
+    try {
+      const data = await postJSON("/pos/orders/sync", {
+        orders: batch.map(({ error, ...o }) => o),
+      });
+
+      const results = new Map((data.results || []).map((r) => [r.client_id, r]));
+      const rest = readQueue().filter((o) => {
+        const r = results.get(o.client_id);
+        if (!r) return true;
+        if (r.ok) return false;
+        o.error = r.error || "Error";
+        return true;
+      });
+      writeQueue(rest);
+      cargarHistorial();
+      loadStock();
+
+      const sentOk = batch.length - rest.filter((o) => results.has(o.client_id)).length;
+      if (sentOk > 0 && rest.some((o) => !o.error)) setTimeout(flushQueue, 0);
+    } catch (err) {
+      console.warn("Sync offline pendiente:", err.message || err);
+    } finally {
+      syncing = false;
+    }
   }
 
   submitOrderBtn?.addEventListener("click", (e) => {
@@ -358,15 +522,46 @@
   });
 
   /* ================== HISTORIAL ================== */
+  // Paginado por cursor: before_id = id del último pedido mostrado.
+  // Al terminar los pedidos de la caja abierta sigue con turnos anteriores (all=1).
+  const HISTORY_PAGE = 50;
+  const historyScrollEl = historialBody?.closest(".table-responsive");
+  let historyBeforeId = null;
+  let historyAll = false;
+  let historyDone = false;
+  let historyLoading = false;
+  let historyReq = 0;
+
   function cargarHistorial() {
     if (!historialBody) return;
 
-    fetch("/pos/orders/history")
+    historyBeforeId = null;
+    historyAll = false;
+    historyDone = false;
+    historyLoading = false;
+    historialBody.innerHTML = "";
+    if (historyScrollEl) historyScrollEl.scrollTop = 0;
+
+    cargarMasHistorial();
+  }
+
+  function cargarMasHistorial() {
+    if (!historialBody || historyLoading || historyDone) return;
+
+    const params = new URLSearchParams({ limit: String(HISTORY_PAGE) });
+    if (historyBeforeId) params.set("before_id", String(historyBeforeId));
+    if (historyAll) params.set("all", "1");
+
+    const req = ++historyReq;
+    historyLoading = true;
+
+    fetch(`/pos/orders/history?${params}`)
       .then((res) => res.json())
       .then((data) => {
-        historialBody.innerHTML = "";
+        if (req !== historyReq) return; // llegó tarde (se recargó el historial)
+        data = Array.isArray(data) ? data : [];
 
-        (data || []).forEach((o) => {
+        data.forEach((o) => {
           const tr = document.createElement("tr");
           tr.style.cursor = "pointer";
 
@@ -389,10 +584,36 @@
           tr.onclick = () => mostrarDetallePedido(o.id);
           historialBody.appendChild(tr);
         });
+
+        if (data.length > 0) historyBeforeId = data[data.length - 1].id;
+
+        if (data.length < HISTORY_PAGE) {
+          if (!historyAll && historyBeforeId) {
+            historyAll = true; // fin de la caja abierta: seguimos con días anteriores
+          } else {
+            historyDone = true;
+          }
+        }
       })
-      .catch((err) => console.error("Error historial:", err));
+      .then(() => {
+        if (req !== historyReq) return;
+        historyLoading = false;
+        // si la página no alcanza a llenar el panel, pedimos la siguiente
+        if (historyScrollEl && !historyDone && historyScrollEl.scrollHeight <= historyScrollEl.clientHeight) {
+          cargarMasHistorial();
+        }
+      })
+      .catch((err) => {
+        if (req === historyReq) historyLoading = false;
+        console.error("Error historial:", err);
+      });
   }
 
+  historyScrollEl?.addEventListener("scroll", () => {
+    const el = historyScrollEl;
+    if (el.scrollTop + el.clientHeight >= el.scrollHeight - 40) cargarMasHistorial();
+  });
+
   /* ================== DETALLE PEDIDO ================== */
   function mostrarDetallePedido(orderId) {
     setModalOrderId(orderId);
@@ -456,17 +677,11 @@
       const reason = prompt("Motivo (opcional):", "") || "";
 
       try {
-        const res = await fetch(`/pos/orders/${id}/cancel`, {
-          method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify({ reason }),
-        });
-
-        const data = await res.json().catch(() => ({}));
-        if (!res.ok || !data.ok) throw new Error(data.error || "No se pudo anular");
+        await postJSON(`/pos/orders/${id}/cancel`, { reason }, newIdempotencyKey());
 
         setModalStatus("cancelled");
         cargarHistorial();
+        loadStock();
       } catch (err) {
         alert(err.message || "Error al anular");
       }
@@ -506,6 +721,8 @@
       const res = await fetch("/pos/cash/status");
       const data = await res.json();
 
+      try { localStorage.setItem(CASH_OPEN_KEY, data.open === true ? "1" : "0"); } catch {}
+
       if (data.open === true) {
         const cr = data.cash_register || {};
         const info = cr.opened_at
@@ -517,7 +734,12 @@
       }
     } catch (err) {
       console.error("Error consultando estado de caja:", err);
-      setCashUI(false, "No se pudo consultar caja");
+      // sin conexión con caja abierta conocida: se sigue vendiendo en cola offline
+      if (localStorage.getItem(CASH_OPEN_KEY) === "1") {
+        setCashUI(true, "Sin conexión: las ventas se guardan y se envían al volver");
+      } else {
+        setCashUI(false, "No se pudo consultar caja");
+      }
     }
   }
 
@@ -561,7 +783,7 @@
         notes,
         opening_counts,
         counts_open: opening_counts,
-      });
+      }, newIdempotencyKey());
 
       bootstrap.Modal.getInstance(openCashModal)?.hide();
 
@@ -620,7 +842,7 @@
         notes,
         closing_counts,
         counts_close: closing_counts,
-      });
+      }, newIdempotencyKey());
 
       bootstrap.Modal.getInstance(closeCashModal)?.hide();
 
@@ -645,11 +867,21 @@
   paidAmountEl?.addEventListener("input", updateChange);
   paymentMethodEl?.addEventListener("change", updateChange);
 
+  window.addEventListener("online", async () => {
+    await refreshCashStatus();
+    flushQueue();
+  });
+  window.addEventListener("offline", () => refreshCashStatus());
+
   /* ================== INIT ================== */
   loadProducts();
   cargarHistorial();
   refreshCashStatus();
   renderOrder();
+  renderQueueBadge();
+  flushQueue();
+  setInterval(flushQueue, 30000);
+  setInterval(loadStock, 20000); // ventas de otras cajas/tablets
 
   // Exponer por si el HTML los llama
   window.posRefreshHistory = cargarHistorial;
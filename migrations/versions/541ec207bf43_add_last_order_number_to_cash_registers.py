@@ -0,0 +1,38 @@
+"""add last_order_number to cash_registers
+
+Revision ID: 541ec207bf43
+Revises: 7f23278c91ea
+Create Date: 2026-10-17 09:12:40.118532
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '541ec207bf43'
+down_revision = '7f23278c91ea'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('cash_registers', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_order_number', sa.Integer(), server_default='0', nullable=False))
+
+    # backfill: la secuencia parte desde el último correlativo ya usado en cada caja
+    op.execute(
+        """
+        UPDATE cash_registers
+        SET last_order_number = COALESCE((
+            SELECT MAX(o.number_in_register)
+            FROM orders o
+            WHERE o.cash_register_id = cash_registers.id
+        ), 0)
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('cash_registers', schema=None) as batch_op:
+        batch_op.drop_column('last_order_number')
@@ -0,0 +1,31 @@
+"""reset sales rollups (days now bucketed in Config.TIMEZONE)
+
+Revision ID: c9e1a4f7b258
+Revises: b2f4c6e8d013
+Create Date: 2026-10-17 17:58:43.206519
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9e1a4f7b258'
+down_revision = 'b2f4c6e8d013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # los rollups existentes tienen días UTC: se descartan y reportes lee orders
+    # hasta volver a correr `flask rollup-sales`
+    op.execute("DELETE FROM sales_daily_products")
+    op.execute("DELETE FROM sales_daily_payments")
+    op.execute("DELETE FROM sales_daily")
+    op.execute("UPDATE cash_registers SET rollup_at = NULL")
+
+
+def downgrade():
+    op.execute("DELETE FROM sales_daily_products")
+    op.execute("DELETE FROM sales_daily_payments")
+    op.execute("DELETE FROM sales_daily")
+    op.execute("UPDATE cash_registers SET rollup_at = NULL")
@@ -0,0 +1,223 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+# Config lee DATABASE_URL al importar: base SQLite en archivo (los tests de concurrencia
+# usan varias conexiones) y días en UTC para que los rangos no dependan de la zona.
+_TMP_DIR = tempfile.mkdtemp(prefix="pos-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TMP_DIR, 'test.db')}"
+os.environ["TIMEZONE"] = "UTC"
+
+from app import create_app  # noqa: E402
+from app.extensions import db  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def app():
+    app = create_app()
+    app.config["TESTING"] = True
+    return app
+
+
+def _clear_process_caches():
+    from types import MappingProxyType
+
+    from app import cash, idempotency, principal, reports, settings
+    from app.pos import routes as pos_routes
+
+    cash.invalidate_open_cash_register()
+    idempotency._replay_cache.clear()
+    principal._principal_cache.clear()
+    principal._users_version = (None, 0.0)
+    reports._summary_cache.clear()
+    reports._opened_day_cache.clear()
+    settings._snapshot, settings._checked_at = (None, MappingProxyType({})), 0.0
+    pos_routes._catalog_cache.clear()
+
+
+@pytest.fixture
+def database(app):
+    """Esquema nuevo por test (create_all) + usuario admin/admin."""
+    from app.models import User
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        _clear_process_caches()
+
+        u = User(username="admin", role="admin", is_active=True)
+        u.set_password("admin")
+        db.session.add(u)
+        db.session.commit()
+
+    yield db
+
+    with app.app_context():
+        db.session.remove()
+
+
+def login(app, username="admin", password="admin"):
+    client = app.test_client()
+    resp = client.post("/auth/login", data={"username": username, "password": password})
+    assert resp.status_code == 302, resp.data
+    return client
+
+
+@pytest.fixture
+def client(app, database):
+    return login(app)
+
+
+@pytest.fixture
+def open_register(client):
+    resp = client.post("/pos/cash/open", json={})
+    assert resp.status_code == 201, resp.json
+    return resp.json["cash_register_id"]
+
+
+def add_products(app, *products):
+    """products: dicts de Product (name, price, stock_qty, ...). Retorna los ids."""
+    from app.models import Product
+
+    with app.app_context():
+        rows = [Product(**{"avg_cost": 0, "track_stock": True, **p}) for p in products]
+        db.session.add_all(rows)
+        db.session.commit()
+        return [p.id for p in rows]
+
+
+def sale(product_id, qty, price):
+    return {
+        "reference_name": "test",
+        "items": [{"product_id": product_id, "qty": qty}],
+        "payment": {"method": "cash", "amount": price * qty},
+    }
+
+
+def add_user(app, username, role, password="1234"):
+    from app.models import User
+
+    with app.app_context():
+        u = User(username=username, role=role, is_active=True)
+        u.set_password(password)
+        db.session.add(u)
+        db.session.commit()
+        return u.id
+
+
+@contextmanager
+def count_selects(app):
+    """Junta los SELECT que llegan al motor mientras dura el bloque."""
+    with app.app_context():
+        engine = db.engine
+    selects = []
+
+    def _on_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            selects.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _on_execute)
+    try:
+        yield selects
+    finally:
+        event.remove(engine, "before_cursor_execute", _on_execute)
+
+
+PRODUCT_NAMES = ["Empanada pino", "Empanada queso", "Churro", "Sopaipilla", "Bebida", "Café", "Té", "Jugo"]
+
+
+def seed_sales(app, orders, days=10, registers=4, cashiers=2, seed=7):
+    """
+    Historia de ventas con inserts en lote: registers-1 cajas cerradas (con rollup) que cubren
+    los días anteriores y una caja abierta hace 36 h (cruza ayer y hoy). Pedidos con 1-3 líneas
+    y pagos en efectivo, transferencia, mixtos, tarjeta o sin pago; ~85 % 'closed'.
+    Retorna {"users", "closed", "open"} (ids).
+    """
+    import random
+    from datetime import datetime, timedelta
+    from decimal import Decimal
+
+    from app.cash import invalidate_open_cash_register
+    from app.models import CashRegister, Order, OrderItem, Payment, Product, User
+    from app.rollups import build_register_rollup
+
+    rnd = random.Random(seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    open_since = now - timedelta(hours=36)
+    start = now - timedelta(days=days)
+    span = (open_since - start) / (registers - 1)
+
+    with app.app_context():
+        users = [User.query.filter_by(username="admin").one().id]
+        for n in range(cashiers):
+            u = User(username=f"cajero{n + 1}", role="cashier", is_active=True)
+            u.set_password("1234")
+            db.session.add(u)
+            db.session.flush()
+            users.append(u.id)
+
+        regs = []
+        for n in range(registers):
+            is_open = n == registers - 1
+            opened = open_since if is_open else start + span * n
+            cr = CashRegister(status="open" if is_open else "closed", opened_at=opened, opened_by_id=users[0],
+                              closed_at=None if is_open else opened + span)
+            db.session.add(cr)
+            db.session.flush()
+            regs.append(cr.id)
+
+        product = Product(name="Genérico", price=0, avg_cost=0, stock_qty=0, track_stock=False)
+        db.session.add(product)
+        db.session.flush()
+        product_id = product.id
+
+        first = (db.session.query(db.func.max(Order.id)).scalar() or 0) + 1
+        order_rows, item_rows, pay_rows = [], [], []
+        numbers = {}
+        for oid in range(first, first + orders):
+            created = start + timedelta(seconds=rnd.randint(0, int((now - start).total_seconds())))
+            reg = regs[-1] if created >= open_since else regs[min(int((created - start) / span), registers - 2)]
+            numbers[reg] = numbers.get(reg, 0) + 1
+
+            total, units = Decimal("0"), 0
+            for _ in range(rnd.randint(1, 3)):
+                p = rnd.randrange(len(PRODUCT_NAMES))
+                qty, price = rnd.randint(1, 4), Decimal(1000 + 250 * p)
+                item_rows.append(dict(order_id=oid, product_id=product_id, product_name=PRODUCT_NAMES[p],
+                                      unit_price=price, quantity=qty))
+                total += price * qty
+                units += qty
+
+            r = rnd.random()
+            if r < 0.5:
+                pays = [("cash", total)]
+            elif r < 0.8:
+                pays = [("transfer", total)]
+            elif r < 0.92:
+                pays = [("cash", total - 500), ("transfer", Decimal("500"))]
+            elif r < 0.97:
+                pays = [("card", total)]
+            else:
+                pays = []
+            pay_rows += [dict(order_id=oid, method=m, amount=a, created_at=created) for m, a in pays]
+
+            status = rnd.choices(["closed", "cancelled", "ready"], weights=[85, 10, 5])[0]
+            order_rows.append(dict(
+                id=oid, reference_name=f"p{oid}", status=status, cash_register_id=reg,
+                number_in_register=numbers[reg], created_by_id=rnd.choice(users),
+                created_at=created, updated_at=created, total_amount=total, items_count=units,
+            ))
+
+        for model, rows in ((Order, order_rows), (OrderItem, item_rows), (Payment, pay_rows)):
+            for i in range(0, len(rows), 20000):
+                db.session.execute(db.insert(model), rows[i:i + 20000])
+        for cr_id in regs[:-1]:
+            build_register_rollup(cr_id)
+        db.session.commit()
+        invalidate_open_cash_register()
+
+    return {"users": users, "closed": regs[:-1], "open": regs[-1]}
@@ -0,0 +1,180 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from conftest import add_products
+
+from app.extensions import db
+
+STATUSES = ["prep", "ready", "delivered", "closed", "cancelled"]
+
+
+def _dec(v):
+    return Decimal(str(v if v is not None else 0))
+
+
+def seed_register(cr_id, orders, other_cr_id=None):
+    """Pedidos con pagos (efectivo, transferencia, mixtos), ventas de stock con costo y compras de la caja."""
+    from app.models import Order, Payment, Purchase, StockMove, User
+
+    user_id = User.query.first().id
+    rows, pays, moves = [], [], []
+    for n in range(1, orders + 1):
+        rows.append(dict(
+            id=n, reference_name=f"p{n}", status=STATUSES[n % len(STATUSES)], cash_register_id=cr_id,
+            number_in_register=n, created_by_id=user_id, total_amount=0, items_count=1,
+        ))
+        cents = Decimal(n % 97) / 100
+        if n % 3 == 0:
+            pays += [dict(order_id=n, method="cash", amount=Decimal("1000") + cents),
+                     dict(order_id=n, method="transfer", amount=Decimal("250.05"))]
+        elif n % 11 == 0:
+            pays.append(dict(order_id=n, method="credit", amount=Decimal("99.99")))
+        else:
+            pays.append(dict(order_id=n, method="cash" if n % 2 else "transfer", amount=Decimal("1234") + cents))
+        moves.append(dict(
+            product_id=1, move_type="sale", qty_delta=-(Decimal(n % 7 + 1) / 4),
+            unit_cost=None if n % 13 == 0 else Decimal("123.4567") + Decimal(n % 5) / 10000,
+            ref_table="orders", ref_id=n, cash_register_id=cr_id, created_at=datetime.utcnow(),
+        ))
+    db.session.execute(db.insert(Order), rows)
+    db.session.execute(db.insert(Payment), pays)
+    db.session.execute(db.insert(StockMove), moves + [
+        # no cuentan para COGS: entrada con tipo SALE, compra, otra caja
+        dict(product_id=1, move_type="sale", qty_delta=Decimal("2"), unit_cost=Decimal("10"), cash_register_id=cr_id),
+        dict(product_id=1, move_type="purchase", qty_delta=Decimal("-3"), unit_cost=Decimal("10"), cash_register_id=cr_id),
+        dict(product_id=1, move_type="sale", qty_delta=Decimal("-5"), unit_cost=Decimal("10"), cash_register_id=other_cr_id),
+    ])
+    db.session.add_all([
+        Purchase(cash_register_id=cr_id, total_amount=Decimal("15000.55")),
+        Purchase(cash_register_id=cr_id, total_amount=Decimal("0.45")),
+        Purchase(cash_register_id=other_cr_id, total_amount=Decimal("777")),
+    ])
+    db.session.commit()
+
+
+def old_close_summary(cr_id):
+    """Los loops en Python que usaba cash_close antes de pasar a agregados SQL (referencia)."""
+    from app.models import Order, Product, Purchase, StockMove
+
+    orders_q = Order.query.filter_by(cash_register_id=cr_id)
+    orders_ok = orders_q.filter(Order.status != "cancelled").all()
+    total_cash = total_transfer = total_sales = Decimal("0")
+    for o in orders_ok:
+        for pay in o.payments:
+            amt = _dec(pay.amount)
+            if pay.method == "cash":
+                total_cash += amt
+            elif pay.method == "transfer":
+                total_transfer += amt
+            total_sales += amt
+
+    cogs = Decimal("0")
+    for mv in StockMove.query.filter(StockMove.cash_register_id == cr_id, StockMove.move_type == "sale").all():
+        q = _dec(mv.qty_delta)
+        if q < 0:
+            cogs += q.copy_abs() * _dec(mv.unit_cost)
+
+    purchases_total = sum((_dec(p.total_amount) for p in Purchase.query.filter_by(cash_register_id=cr_id)),
+                          Decimal("0"))
+
+    inventory_value = Decimal("0")
+    snapshot = {}
+    harina_stock_final = None
+    for p in Product.query.order_by(Product.category.asc(), Product.name.asc()).all():
+        qty, avg_cost = _dec(p.stock_qty), _dec(p.avg_cost)
+        inventory_value += qty * avg_cost
+        snapshot[p.id] = (qty, avg_cost)
+        if (p.name or "").strip().lower() == "harina":
+            harina_stock_final = float(qty)
+
+    return {
+        "total_cash": total_cash, "total_transfer": total_transfer, "total_sales": total_sales,
+        "total_orders": len(orders_ok), "total_cancelled": orders_q.filter(Order.status == "cancelled").count(),
+        "cogs": cogs, "purchases_total": purchases_total, "inventory_value": inventory_value,
+        "snapshot": snapshot, "harina_stock_final": harina_stock_final,
+    }
+
+
+@pytest.fixture
+def products(app, database):
+    return add_products(
+        app,
+        {"name": "Empanada", "price": 1500, "stock_qty": Decimal("12.345"), "avg_cost": Decimal("1234.5678"),
+         "category": "empanadas"},
+        {"name": "Harina", "price": 0, "stock_qty": Decimal("25.5"), "avg_cost": Decimal("0.8765"),
+         "category": "insumos", "product_type": "supply", "unit": "KG"},
+        {"name": " harina ", "price": 0, "stock_qty": Decimal("3"), "avg_cost": Decimal("1.1111"),
+         "category": None, "product_type": "supply", "unit": "KG"},
+        {"name": "Aceite", "price": 0, "stock_qty": Decimal("4.25"), "avg_cost": Decimal("3.3333"),
+         "category": "insumos", "product_type": "supply", "unit": "LT"},
+        {"name": "Bebida", "price": 1000, "stock_qty": 0, "track_stock": False, "category": "bebidas"},
+    )
+
+
+def test_close_matches_the_old_python_loops(app, client, products, open_register):
+    from app.models import CashRegister, CashRegisterInventorySnapshot, CashRegisterStockCount
+    from app.pos.routes import _snapshot_inventory
+
+    empanada, harina, _, aceite, bebida = products
+    with app.app_context():
+        seed_register(open_register, orders=250)
+
+    resp = client.post("/pos/cash/close", json={
+        "closing_amount": "1000",
+        "consumptions": [{"product_id": harina, "qty": "2.25"}, {"product_id": harina, "qty": 1},
+                         {"product_id": aceite, "qty": "0.5"}, {"product_id": empanada, "qty": 1}],
+        "counts_close": [{"product_id": harina, "qty": "22.25"}, {"product_id": bebida, "qty": 3}],
+    })
+    assert resp.status_code == 200, resp.json
+    pro = resp.json["resume_pro"]
+
+    with app.app_context():
+        old = old_close_summary(open_register)
+        cr = db.session.get(CashRegister, open_register)
+
+        # mismos Decimal que los loops viejos
+        for col in ("total_cash", "total_transfer", "total_sales", "total_orders", "total_cancelled"):
+            assert getattr(cr, col) == old[col], col
+        assert pro == {
+            "total_sales": float(old["total_sales"]),
+            "cogs": float(old["cogs"]),
+            "profit_est": float(old["total_sales"] - old["cogs"]),
+            "purchases_total": float(old["purchases_total"]),
+            "inventory_value": float(old["inventory_value"]),
+            "harina_consumed_qty": 3.25,
+            "harina_consumed_cost": float(Decimal("3.25") * Decimal("0.8765")),
+            "harina_stock_final": old["harina_stock_final"],
+        }
+        assert old["harina_stock_final"] == 22.25  # "Harina" (insumos) gana a " harina " (sin categoría)
+
+        snap = {s.product_id: (s.qty, s.avg_cost)
+                for s in CashRegisterInventorySnapshot.query.filter_by(cash_register_id=open_register)}
+        assert snap == old["snapshot"]
+        counts = {c.product_id: c.qty for c in CashRegisterStockCount.query.filter_by(cash_register_id=open_register)}
+        assert counts == {harina: Decimal("22.25")}
+
+        # el valor de inventario en Decimal exacto (la respuesta lo entrega como float)
+        CashRegisterInventorySnapshot.query.filter_by(cash_register_id=open_register).delete()
+        assert _snapshot_inventory(open_register) == old["inventory_value"]
+        db.session.rollback()
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize("orders", [100, 10_000, 100_000])
+def test_bench_close_latency(app, client, products, open_register, orders):
+    import time
+
+    with app.app_context():
+        seed_register(open_register, orders=orders)
+        t0 = time.perf_counter()
+        old_close_summary(open_register)
+        old_ms = (time.perf_counter() - t0) * 1000
+        db.session.rollback()
+
+    t0 = time.perf_counter()
+    resp = client.post("/pos/cash/close", json={"closing_amount": "0"})
+    new_ms = (time.perf_counter() - t0) * 1000
+    assert resp.status_code == 200, resp.json
+
+    print(f"\ncierre con {orders} pedidos: {new_ms:.0f} ms (loops en Python: {old_ms:.0f} ms)")
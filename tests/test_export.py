@@ -0,0 +1,169 @@
+import csv
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import zipfile
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import openpyxl
+import pytest
+from conftest import seed_sales
+from sqlalchemy import func, select
+
+from app.extensions import db
+from app.reports import EXPORT_SHEETS, ReportFilters, order_conditions, report_rows_select
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# crecimiento máximo del pico de RSS al exportar todo (el proceso ya cargó app + drivers);
+# con 50k pedidos, leer las filas con .all() en vez de yield_per ya lo supera
+EXPORT_RSS_BOUND_MB = 8
+
+
+def _params(f: ReportFilters, **extra) -> dict:
+    params = {"from": f.day_from.isoformat(), "to": f.day_to.isoformat(), **extra}
+    if f.payment_method:
+        params["payment_method"] = f.payment_method
+    if f.user_id is not None:
+        params["user_id"] = f.user_id
+    return params
+
+
+def _expected(f: ReportFilters) -> dict:
+    """{hoja: (filas, suma de la última columna)} leídos directo con las mismas condiciones."""
+    from app.models import Order, OrderItem, Payment
+
+    orders = report_rows_select(f).subquery()
+    lines = select(OrderItem.quantity, OrderItem.unit_price).join(Order, Order.id == OrderItem.order_id) \
+        .where(*order_conditions(f)).subquery()
+    pays = select(Payment.amount).join(Order, Order.id == Payment.order_id).where(*order_conditions(f)).subquery()
+    return {
+        "pedidos": db.session.execute(select(func.count(), func.sum(orders.c.total_amount))).one(),
+        "lineas": db.session.execute(select(func.count(), func.sum(lines.c.quantity * lines.c.unit_price))).one(),
+        "pagos": db.session.execute(select(func.count(), func.sum(pays.c.amount))).one(),
+    }
+
+
+def _stream(client, url, params) -> bytes:
+    with client.get(url, query_string=params) as resp:
+        assert resp.status_code == 200
+        assert resp.is_streamed
+        return b"".join(resp.response)
+
+
+@pytest.mark.parametrize("extra", [{}, {"payment_method": "transfer"}])
+def test_export_sheets_match_the_queries(app, client, extra):
+    seed_sales(app, orders=3000)
+    today = datetime.utcnow().date()
+    f = ReportFilters(day_from=today - timedelta(days=12), day_to=today)._replace(**extra)
+
+    with app.app_context():
+        expected = _expected(f)
+    assert expected["pedidos"][0] > 0
+
+    # --- XLSX: zip válido, se abre con openpyxl, una fila por pedido / línea / pago ---
+    data = _stream(client, "/admin/reportes/export.xlsx", _params(f))
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        for n, sheet in enumerate(EXPORT_SHEETS, start=1):
+            xml = zf.read(f"xl/worksheets/sheet{n}.xml").decode("utf-8")
+            assert len(re.findall(r"<row ", xml)) == expected[sheet][0] + 1, sheet
+
+    wb = openpyxl.load_workbook(io.BytesIO(data), read_only=True)
+    assert wb.sheetnames == ["Pedidos", "Líneas", "Pagos"]
+    for ws, sheet in zip(wb.worksheets, EXPORT_SHEETS):
+        rows = list(ws.iter_rows(values_only=True))
+        assert list(rows[0]) == EXPORT_SHEETS[sheet]
+        assert len(rows) - 1 == expected[sheet][0], sheet
+        assert sum(Decimal(str(r[-1])) for r in rows[1:]) == Decimal(str(expected[sheet][1])), sheet
+
+    # --- CSV: BOM UTF-8 y mismas filas ---
+    for sheet in EXPORT_SHEETS:
+        data = _stream(client, "/admin/reportes/export.csv", _params(f, sheet=sheet))
+        assert data.startswith(b"\xef\xbb\xbf")
+        rows = list(csv.reader(io.StringIO(data.decode("utf-8-sig"))))
+        assert rows[0] == EXPORT_SHEETS[sheet]
+        assert len(rows) - 1 == expected[sheet][0], sheet
+        assert sum(Decimal(r[-1]) for r in rows[1:]) == Decimal(str(expected[sheet][1])), sheet
+
+
+def test_export_rejects_bad_input(client):
+    assert client.get("/admin/reportes/export.csv", query_string={"sheet": "x"}).status_code == 400
+    assert client.get("/admin/reportes/export.xlsx", query_string={"cash_register_id": "x"}).status_code == 400
+
+
+# Se corre en otro proceso: el pico de RSS del proceso de pytest ya incluye la siembra.
+# VmHWM (Linux) y no ru_maxrss, que se hereda del padre a través de exec.
+# Primero un export de un día vacío (imports, conexión), después todo el rango.
+_RSS_SCRIPT = """
+import json, sys
+from app import create_app
+
+app = create_app()
+client = app.test_client()
+assert client.post("/auth/login", data={"username": "admin", "password": "admin"}).status_code == 302
+
+def peak_mb():
+    with open("/proc/self/status") as fh:
+        line = next(line for line in fh if line.startswith("VmHWM:"))
+    return int(line.split()[1]) / 1024
+
+def drain(url, params):
+    with client.get(url, query_string=params) as resp:
+        assert resp.status_code == 200
+        return sum(len(chunk) for chunk in resp.response)
+
+full, empty = json.loads(sys.argv[1]), json.loads(sys.argv[2])
+for url in ("/admin/reportes/export.xlsx", "/admin/reportes/export.csv"):
+    drain(url, {**empty, "sheet": "lineas"})
+base = peak_mb()
+
+sizes = {"xlsx": drain("/admin/reportes/export.xlsx", full)}
+for sheet in ("pedidos", "lineas", "pagos"):
+    sizes[sheet] = drain("/admin/reportes/export.csv", {**full, "sheet": sheet})
+print(json.dumps({"growth_mb": peak_mb() - base, "sizes": sizes}))
+"""
+
+
+def _export_rss(app, days):
+    today = datetime.utcnow().date()
+    full = {"from": (today - timedelta(days=days + 1)).isoformat(), "to": today.isoformat()}
+    empty = {"from": "2000-01-01", "to": "2000-01-01"}
+
+    out = subprocess.run(
+        [sys.executable, "-c", _RSS_SCRIPT, json.dumps(full), json.dumps(empty)],
+        cwd=ROOT, env={**os.environ, "PYTHONPATH": ROOT}, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="VmHWM solo en Linux")
+def test_export_memory_stays_flat(app, database):
+    seed_sales(app, orders=50000)
+    result = _export_rss(app, days=10)
+
+    assert result["sizes"]["xlsx"] > 1_000_000
+    assert result["growth_mb"] < EXPORT_RSS_BOUND_MB, result
+
+
+@pytest.mark.bench
+def test_bench_export_million_rows(app, database):
+    """pytest -m bench -s: ~1M filas entre las 3 hojas (pedidos + líneas + pagos)."""
+    import time
+
+    seed_sales(app, orders=300_000, days=30)
+    with app.app_context():
+        from app.models import Order, OrderItem, Payment
+        total_rows = sum(db.session.query(func.count(m.id)).scalar() for m in (Order, OrderItem, Payment))
+
+    t0 = time.perf_counter()
+    result = _export_rss(app, days=30)
+    elapsed = time.perf_counter() - t0
+
+    print(f"\n{total_rows} filas en la base: xlsx {result['sizes']['xlsx'] / 1e6:.1f} MB + 3 csv, "
+          f"{elapsed:.1f} s, pico de RSS +{result['growth_mb']:.1f} MB")
+    assert result["growth_mb"] < EXPORT_RSS_BOUND_MB, result
@@ -0,0 +1,146 @@
+import threading
+from datetime import datetime
+
+import pytest
+from conftest import add_products, add_user, login, sale
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import idempotency
+from app.extensions import db
+
+
+def _counts(app):
+    from app.models import IdempotencyKey, Order, StockMove
+
+    with app.app_context():
+        return Order.query.count(), StockMove.query.count(), {
+            k.key: k.status_code for k in IdempotencyKey.query.all()
+        }
+
+
+@pytest.fixture
+def product(app, open_register):
+    (pid,) = add_products(app, {"name": "Empanada", "price": 1000, "stock_qty": 10})
+    return pid
+
+
+@pytest.fixture
+def fail_next_commit():
+    """El próximo commit de la sesión falla antes de confirmar (y la transacción se descarta)."""
+    def _boom(session):
+        event.remove(Session, "before_commit", _boom)
+        raise RuntimeError("falla en el commit")
+
+    event.listen(Session, "before_commit", _boom)
+    yield
+    if event.contains(Session, "before_commit", _boom):
+        event.remove(Session, "before_commit", _boom)
+
+
+def test_retry_replays_the_stored_response(app, client, product):
+    headers = {"Idempotency-Key": "k-1"}
+    first = client.post("/pos/orders", json=sale(product, 2, 1000), headers=headers)
+    assert first.status_code == 200 and "Idempotent-Replayed" not in first.headers
+
+    again = client.post("/pos/orders", json=sale(product, 2, 1000), headers=headers)
+    idempotency._replay_cache.clear()  # otro worker: sale de la tabla, no del cache
+    other = client.post("/pos/orders", json=sale(product, 2, 1000), headers=headers)
+
+    for resp in (again, other):
+        assert resp.status_code == 200
+        assert resp.headers["Idempotent-Replayed"] == "true"
+        assert resp.json == first.json
+    assert _counts(app) == (1, 1, {"k-1": 200})
+
+
+def test_in_flight_key_answers_409(app, client, product):
+    from app.models import IdempotencyKey, User
+
+    with app.app_context():
+        admin = User.query.filter_by(username="admin").one()
+        db.session.add(IdempotencyKey(key="k-1", endpoint="pos.create_order", user_id=admin.id,
+                                      created_at=datetime.utcnow()))
+        db.session.commit()
+
+    resp = client.post("/pos/orders", json=sale(product, 1, 1000), headers={"Idempotency-Key": "k-1"})
+    assert resp.status_code == 409
+    assert _counts(app) == (0, 0, {"k-1": None})
+
+
+def test_concurrent_requests_with_one_key_sell_once(app, product):
+    clients = [login(app) for _ in range(6)]
+    start = threading.Barrier(len(clients))
+    results = []
+    lock = threading.Lock()
+
+    def worker(c):
+        start.wait()
+        resp = c.post("/pos/orders", json=sale(product, 1, 1000), headers={"Idempotency-Key": "k-1"})
+        with lock:
+            results.append((resp.status_code, resp.headers.get("Idempotent-Replayed"), resp.get_json()))
+
+    threads = [threading.Thread(target=worker, args=(c,)) for c in clients]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    executed = [body for status, replayed, body in results if status == 200 and not replayed]
+    assert len(executed) == 1
+    for status, replayed, body in results:
+        assert status == 409 or (status == 200 and body == executed[0]), (status, body)
+    assert _counts(app) == (1, 1, {"k-1": 200})
+
+
+def test_key_reused_on_another_endpoint_or_user_is_422(app, client, product):
+    order = client.post("/pos/orders", json=sale(product, 1, 1000), headers={"Idempotency-Key": "k-1"}).json
+
+    resp = client.post(f"/pos/orders/{order['order_id']}/cancel", json={}, headers={"Idempotency-Key": "k-1"})
+    assert resp.status_code == 422
+
+    add_user(app, "caja1", "cashier")
+    cashier = login(app, "caja1", "1234")
+    idempotency._replay_cache.clear()
+    resp = cashier.post("/pos/orders", json=sale(product, 1, 1000), headers={"Idempotency-Key": "k-1"})
+    assert resp.status_code == 422
+    assert _counts(app) == (1, 1, {"k-1": 200})
+
+
+def test_key_is_released_after_an_error_response(app, client, product):
+    headers = {"Idempotency-Key": "k-1"}
+    resp = client.post("/pos/orders", json=sale(product, 99, 1000), headers=headers)
+    assert resp.status_code == 400
+    assert _counts(app) == (0, 0, {})
+
+    resp = client.post("/pos/orders", json=sale(product, 1, 1000), headers=headers)
+    assert resp.status_code == 200 and "Idempotent-Replayed" not in resp.headers
+    assert _counts(app) == (1, 1, {"k-1": 200})
+
+
+def test_failed_commit_keeps_neither_sale_nor_response(app, client, product, fail_next_commit):
+    headers = {"Idempotency-Key": "k-1"}
+    with pytest.raises(RuntimeError):
+        client.post("/pos/orders", json=sale(product, 1, 1000), headers=headers)
+    assert _counts(app) == (0, 0, {})  # ni venta ni key: se puede reintentar
+
+    resp = client.post("/pos/orders", json=sale(product, 1, 1000), headers=headers)
+    assert resp.status_code == 200 and "Idempotent-Replayed" not in resp.headers
+    assert _counts(app) == (1, 1, {"k-1": 200})
+
+
+def test_error_after_commit_still_replays_the_sale(app, client, product, monkeypatch):
+    def _boom(rv):
+        raise RuntimeError("falla después del commit")
+
+    headers = {"Idempotency-Key": "k-1"}
+    monkeypatch.setattr(idempotency, "make_response", _boom)
+    with pytest.raises(RuntimeError):
+        client.post("/pos/orders", json=sale(product, 1, 1000), headers=headers)
+    monkeypatch.undo()
+    assert _counts(app) == (1, 1, {"k-1": 200})  # venta y respuesta confirmadas juntas
+
+    resp = client.post("/pos/orders", json=sale(product, 1, 1000), headers=headers)
+    assert resp.status_code == 200 and resp.headers["Idempotent-Replayed"] == "true"
+    assert resp.json["order_number"] == 1
+    assert _counts(app)[:2] == (1, 1)
@@ -0,0 +1,242 @@
+import json
+from datetime import datetime, timedelta
+
+from conftest import add_products
+from sqlalchemy import update
+
+from app import events
+from app.cocina import routes as cocina_routes
+from app.cocina.routes import PEDIDOS_SINCE_MARGIN_SECONDS, _make_cursor, _parse_cursor
+from app.extensions import db
+
+
+def _order(*lines):
+    return {
+        "reference_name": "mesa",
+        "items": [{"product_id": pid, "qty": qty} for pid, qty in lines],
+        "payment": {"method": "cash", "amount": sum(qty * 1000 for _, qty in lines)},
+    }
+
+
+def test_resumen_counts_only_prep_orders_of_the_open_register(app, client, open_register):
+    a, b = add_products(
+        app,
+        {"name": "Empanada", "price": 1000, "stock_qty": 100},
+        {"name": "Bebida", "price": 1000, "stock_qty": 100},
+    )
+    ids = [client.post("/pos/orders", json=body).json["order_id"]
+           for body in (_order((a, 3), (b, 1)), _order((a, 2)), _order((b, 5)))]
+
+    resp = client.post(f"/cocina/api/pedidos/{ids[2]}/estado", json={"estado": "LISTO"})
+    assert resp.status_code == 200, resp.json
+    resp = client.post(f"/pos/orders/{ids[1]}/cancel", json={"reason": "test"})
+    assert resp.status_code == 200, resp.json
+
+    resumen = client.get("/cocina/api/resumen").json
+    assert resumen["items"] == [{"producto": "Empanada", "qty": 3}, {"producto": "Bebida", "qty": 1}]
+    assert resumen["total_unidades"] == 4
+
+    # vuelve a preparación: entra de nuevo al resumen
+    client.post(f"/cocina/api/pedidos/{ids[2]}/estado", json={"estado": "EN_PREPARACION"})
+    assert client.get("/cocina/api/resumen").json["items"] == [
+        {"producto": "Bebida", "qty": 6}, {"producto": "Empanada", "qty": 3},
+    ]
+
+
+
+def _pedidos(client, since=None):
+    resp = client.get("/cocina/api/pedidos", query_string={"since": since} if since else {})
+    assert resp.status_code == 200, resp.json
+    return resp.json
+
+
+def test_delta_cursor_keeps_late_commits_and_resets_on_another_register(app, client, open_register):
+    from app.models import Order
+
+    (a,) = add_products(app, {"name": "Empanada", "price": 1000, "stock_qty": 100})
+    first = client.post("/pos/orders", json=_order((a, 1))).json["order_id"]
+    with app.app_context():  # fuera del margen: no se repite en el primer delta
+        db.session.execute(update(Order).values(updated_at=datetime.utcnow() - timedelta(minutes=1)))
+        db.session.commit()
+
+    full = _pedidos(client)
+    assert full["full"] is True
+    assert [p["id"] for p in full["pedidos"]] == [first]
+
+    second = client.post("/pos/orders", json=_order((a, 2))).json["order_id"]
+    delta = _pedidos(client, since=full["cursor"])
+    assert delta["full"] is False
+    assert [p["id"] for p in delta["pedidos"]] == [second]
+    cursor = delta["cursor"]
+
+    # transacción lenta: marcó updated_at antes del cursor y confirmó después -> igual llega
+    _, cursor_ts, _ = _parse_cursor(cursor)
+    with app.app_context():
+        db.session.execute(
+            update(Order).where(Order.id == first)
+            .values(status="ready", updated_at=cursor_ts - timedelta(seconds=PEDIDOS_SINCE_MARGIN_SECONDS - 1))
+        )
+        db.session.commit()
+    delta = _pedidos(client, since=cursor)
+    assert delta["removed"] == [first]
+    assert delta["cursor"] >= cursor
+
+    # fuera del margen ya no se vuelve a mirar
+    with app.app_context():
+        db.session.execute(
+            update(Order).where(Order.id == second)
+            .values(updated_at=cursor_ts - timedelta(seconds=PEDIDOS_SINCE_MARGIN_SECONDS + 60))
+        )
+        db.session.commit()
+    assert second not in [p["id"] for p in _pedidos(client, since=cursor)["pedidos"]]
+
+    # cursor de otra caja (la pantalla quedó de antes del cierre) o inválido: lista completa
+    for stale in (_make_cursor(open_register + 1, cursor_ts, second), "basura"):
+        resp = _pedidos(client, since=stale)
+        assert resp["full"] is True
+        assert [p["id"] for p in resp["pedidos"]] == [second]
+
+    # cierre y nueva apertura: el cursor viejo trae la lista completa de la caja nueva
+    assert client.post("/pos/cash/close", json={}).status_code == 200
+    new_register = client.post("/pos/cash/open", json={}).json["cash_register_id"]
+    third = client.post("/pos/orders", json=_order((a, 1))).json["order_id"]
+    resp = _pedidos(client, since=cursor)
+    assert resp["full"] is True
+    assert [p["id"] for p in resp["pedidos"]] == [third]
+    assert _parse_cursor(resp["cursor"])[0] == new_register
+
+
+def _events(chunks, n):
+    """Siguientes n eventos SSE (sin comentarios ni retry) como [(event, data)]."""
+    out = []
+    while len(out) < n:
+        chunk = next(chunks)
+        chunk = chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk
+        if chunk.startswith("event: "):
+            head, data = chunk.strip().split("\n")
+            out.append((head[len("event: "):], json.loads(data[len("data: "):])))
+    return out
+
+
+def test_stream_sends_changes_after_the_snapshot_and_resyncs_on_close(app, client, open_register, monkeypatch):
+    monkeypatch.setattr(cocina_routes, "STREAM_HEARTBEAT_SECONDS", 0.2)
+    (a,) = add_products(app, {"name": "Empanada", "price": 1000, "stock_qty": 100})
+    first = client.post("/pos/orders", json=_order((a, 1))).json["order_id"]
+
+    resp = client.get("/cocina/api/stream")
+    assert resp.mimetype == "text/event-stream"
+    chunks = iter(resp.response)
+    try:
+        ((event, snapshot),) = _events(chunks, 1)
+        assert event == "snapshot"
+        assert [p["id"] for p in snapshot["pedidos"]] == [first]
+
+        # confirmado después de leer el snapshot: llega como evento (suscripción previa)
+        second = client.post("/pos/orders", json=_order((a, 2))).json["order_id"]
+        # evento de otra caja: no se manda
+        events._publish_local({"type": "order_status", "data": {"id": 999, "status": "prep",
+                                                                "cash_register_id": open_register + 1}})
+        client.post(f"/cocina/api/pedidos/{first}/estado", json={"estado": "LISTO"})
+
+        (upsert, card), (remove, gone) = _events(chunks, 2)
+        assert (upsert, card["id"], card["items"]) == ("upsert", second, [{"producto": "Empanada", "qty": 2}])
+        assert (remove, gone) == ("remove", {"id": first})
+
+        # cierre de caja: la pantalla recarga todo y el stream termina
+        assert client.post("/pos/cash/close", json={}).status_code == 200
+        assert _events(chunks, 1) == [("resync", {})]
+        assert list(chunks) == []
+    finally:
+        resp.close()
+    assert not events._subscribers
+
+
+COUNTER_COLUMNS = ("orders_prep", "orders_ready", "orders_delivered", "orders_cancelled", "orders_closed",
+                   "total_cash", "total_transfer", "total_sales")
+
+
+def _counters(app, cr_id):
+    from app.models import CashRegister
+
+    with app.app_context():
+        cr = db.session.get(CashRegister, cr_id)
+        return {col: getattr(cr, col) or 0 for col in COUNTER_COLUMNS}
+
+
+def _delta(after, before):
+    return {col: after[col] - before[col] for col in COUNTER_COLUMNS}
+
+
+def _bulk(client, ids, estado):
+    resp = client.post("/cocina/api/pedidos/estado", json={"ids": ids, "estado": estado})
+    assert resp.status_code == 200, resp.json
+    return resp.json
+
+
+def test_bulk_status_matches_single_calls(app, client, open_register):
+    from app.cash import reconcile_register_totals
+    from app.counters import REPORTS_COUNTER, get_counter
+    from app.models import CashRegister, Order
+
+    (a,) = add_products(app, {"name": "Empanada", "price": 1000, "stock_qty": 100})
+    ids = [client.post("/pos/orders", json=_order((a, n + 1))).json["order_id"] for n in range(6)]
+    bulk_ids, single_ids = ids[:3], ids[3:]
+
+    with app.app_context():  # pedido en preparación de otra caja (cerrada)
+        other = CashRegister(status="closed", opened_at=datetime.utcnow(), opened_by_id=1)
+        db.session.add(other)
+        db.session.flush()
+        foreign = Order(reference_name="otra", status="prep", cash_register_id=other.id, number_in_register=1,
+                        created_by_id=1, total_amount=1000, items_count=1)
+        db.session.add(foreign)
+        db.session.commit()
+        foreign = foreign.id
+
+    # --- EN_PREPARACION -> LISTO: lote vs uno por uno ---
+    before = _counters(app, open_register)
+    out = _bulk(client, bulk_ids + [foreign, 99999, bulk_ids[0]], "LISTO")
+    assert out["moved"] == 3
+    assert [r["id"] for r in out["results"]] == bulk_ids + [foreign, 99999]
+    assert all(r["ok"] and r["estado"] == "LISTO" for r in out["results"][:3])
+    for r in out["results"][3:]:
+        assert r == {"id": r["id"], "ok": False, "error": "Pedido no encontrado en la caja abierta"}
+    after_bulk = _counters(app, open_register)
+
+    for oid in single_ids:
+        assert client.post(f"/cocina/api/pedidos/{oid}/estado", json={"estado": "LISTO"}).json["ok"]
+    after_single = _counters(app, open_register)
+    assert _delta(after_bulk, before) == _delta(after_single, after_bulk)
+    assert after_bulk["orders_ready"] - before["orders_ready"] == 3
+
+    # transición no permitida para su estado actual: se salta y se informa el estado
+    out = _bulk(client, [bulk_ids[0], single_ids[0]], "LISTO")
+    assert out["moved"] == 0
+    assert [(r["ok"], r["estado"]) for r in out["results"]] == [(False, "LISTO"), (False, "LISTO")]
+    assert "no se puede pasar a LISTO" in out["results"][0]["error"]
+    assert _counters(app, open_register) == after_single
+
+    # --- LISTO -> ENTREGADO: entran ventas cerradas (reportes se invalidan en ambos caminos) ---
+    with app.app_context():
+        reports_before = get_counter(REPORTS_COUNTER)
+    before = _counters(app, open_register)
+    assert _bulk(client, bulk_ids, "ENTREGADO")["moved"] == 3
+    after_bulk = _counters(app, open_register)
+    with app.app_context():
+        reports_after_bulk = get_counter(REPORTS_COUNTER)
+
+    for oid in single_ids:
+        assert client.post(f"/cocina/api/pedidos/{oid}/estado", json={"estado": "ENTREGADO"}).json["ok"]
+    after_single = _counters(app, open_register)
+    assert _delta(after_bulk, before) == _delta(after_single, after_bulk)
+    assert after_bulk["orders_closed"] - before["orders_closed"] == 3
+    with app.app_context():
+        assert reports_before < reports_after_bulk < get_counter(REPORTS_COUNTER)
+
+        # contadores en vivo == recontados desde orders/payments
+        recount = reconcile_register_totals(open_register)
+        db.session.rollback()
+        assert after_single == {col: recount[col] for col in COUNTER_COLUMNS}
+
+        assert db.session.get(Order, foreign).status == "prep"
+
+    assert client.get("/cocina/api/resumen").json["items"] == []
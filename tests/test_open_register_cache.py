@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+
+from conftest import count_selects
+
+from app import cache, cash
+from app.cash import (
+    OPEN_REGISTER_TTL_SECONDS, get_open_cash_register, get_open_cash_register_id, lock_open_register,
+)
+
+
+def _fake_clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def _worker_state():
+    return dict(cash._open_register_cache._data)
+
+
+def _as_worker(state):
+    """Deja el cache de este proceso como lo tenía otro worker."""
+    cash._open_register_cache._data.clear()
+    cash._open_register_cache._data.update(state)
+
+
+def test_open_and_close_update_this_worker_at_once(app, client, monkeypatch):
+    _fake_clock(monkeypatch)
+    with app.app_context():
+        assert get_open_cash_register_id() is None
+
+    cr_id = client.post("/pos/cash/open", json={}).json["cash_register_id"]
+    with app.app_context(), count_selects(app) as selects:
+        assert get_open_cash_register_id() == cr_id
+    assert selects == []
+
+    assert client.post("/pos/cash/close", json={}).status_code == 200
+    with app.app_context(), count_selects(app) as selects:
+        assert get_open_cash_register_id() is None
+    assert selects == []
+
+    # abrir otra vez no se fía del cache ("sin caja"): consulta la BD y crea una nueva
+    new_id = client.post("/pos/cash/open", json={}).json["cash_register_id"]
+    assert new_id != cr_id
+    assert client.post("/pos/cash/open", json={}).status_code == 400
+
+
+def test_other_worker_sees_open_and_close_within_ttl(app, client, monkeypatch):
+    now = _fake_clock(monkeypatch)
+
+    # worker B ya cacheó "sin caja"; worker A abre
+    with app.app_context():
+        assert get_open_cash_register_id() is None
+    worker_b = _worker_state()
+    cr_id = client.post("/pos/cash/open", json={}).json["cash_register_id"]
+
+    _as_worker(worker_b)
+    with app.app_context():
+        now[0] += OPEN_REGISTER_TTL_SECONDS - 1
+        assert get_open_cash_register_id() is None  # dentro del TTL: dato viejo
+        now[0] += 2
+        assert get_open_cash_register_id() == cr_id
+    worker_b = _worker_state()
+
+    # worker A cierra; B sigue con la caja en cache
+    assert client.post("/pos/cash/close", json={}).status_code == 200
+    _as_worker(worker_b)
+    with app.app_context():
+        assert get_open_cash_register_id() == cr_id
+        # lecturas/escrituras que confirman en BD no usan el dato viejo y limpian el cache
+        assert get_open_cash_register() is None
+        assert get_open_cash_register_id() is None
+
+    _as_worker(worker_b)
+    with app.app_context():
+        assert lock_open_register(cr_id) is False
+        assert get_open_cash_register_id() is None
+
+    # sin confirmación en BD, el TTL es el límite
+    _as_worker(worker_b)
+    with app.app_context():
+        now[0] += OPEN_REGISTER_TTL_SECONDS + 1
+        assert get_open_cash_register_id() is None
@@ -0,0 +1,94 @@
+import threading
+import time
+
+from conftest import add_products, login, sale
+
+from app.extensions import db
+
+WRITERS = 8
+ORDERS_PER_WRITER = 10
+
+
+def _run(workers):
+    start = threading.Barrier(len(workers))
+    errors = []
+
+    def wrap(fn):
+        def run():
+            start.wait()
+            try:
+                fn()
+            except Exception as e:  # el assert va en el hilo principal
+                errors.append(e)
+        return run
+
+    threads = [threading.Thread(target=wrap(fn)) for fn in workers]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors, errors
+    return time.perf_counter() - t0
+
+
+def _last_number(app, cr_id):
+    from app.models import CashRegister, Order
+
+    with app.app_context():
+        numbers = sorted(n for (n,) in db.session.query(Order.number_in_register)
+                         .filter(Order.cash_register_id == cr_id))
+        return numbers, db.session.get(CashRegister, cr_id).last_order_number
+
+
+def test_concurrent_writers_get_unique_gap_free_numbers(app, database, open_register):
+    (pid,) = add_products(app, {"name": "Bebida", "price": 1000, "stock_qty": 0, "track_stock": False})
+    clients = [login(app) for _ in range(WRITERS)]
+    got = []
+
+    def writer(client):
+        def run():
+            for _ in range(ORDERS_PER_WRITER):
+                resp = client.post("/pos/orders", json=sale(pid, 1, 1000))
+                assert resp.status_code == 200, resp.json
+                got.append(resp.json["order_number"])
+        return run
+
+    elapsed = _run([writer(c) for c in clients])
+    total = WRITERS * ORDERS_PER_WRITER
+
+    assert sorted(got) == list(range(1, total + 1))
+    assert _last_number(app, open_register) == (list(range(1, total + 1)), total)
+    print(f"\n{total} pedidos con {WRITERS} escritores: {total / elapsed:.0f} pedidos/s")
+
+
+def test_sync_blocks_and_online_orders_share_one_sequence(app, database, open_register):
+    (pid,) = add_products(app, {"name": "Bebida", "price": 1000, "stock_qty": 0, "track_stock": False})
+    clients = [login(app) for _ in range(WRITERS)]
+    online, blocks = [], []
+
+    def online_writer(client):
+        def run():
+            for _ in range(ORDERS_PER_WRITER):
+                resp = client.post("/pos/orders", json=sale(pid, 1, 1000))
+                assert resp.status_code == 200, resp.json
+                online.append(resp.json["order_number"])
+        return run
+
+    def sync_writer(client, w):
+        def run():
+            for b in range(ORDERS_PER_WRITER // 5):
+                orders = [{"client_id": f"w{w}-b{b}-{i}", **sale(pid, 1, 1000)} for i in range(5)]
+                resp = client.post("/pos/orders/sync", json={"orders": orders})
+                assert resp.status_code == 200, resp.json
+                blocks.append([r["order_number"] for r in resp.json["results"]])
+        return run
+
+    _run([online_writer(c) if w % 2 else sync_writer(c, w) for w, c in enumerate(clients)])
+    total = WRITERS * ORDERS_PER_WRITER
+
+    # cada lote sync reserva un bloque consecutivo; entre todos cubren 1..N sin huecos
+    assert all(block == list(range(block[0], block[0] + len(block))) for block in blocks)
+    numbers = online + [n for block in blocks for n in block]
+    assert sorted(numbers) == list(range(1, total + 1))
+    assert _last_number(app, open_register) == (list(range(1, total + 1)), total)
@@ -0,0 +1,28 @@
+from conftest import add_products, count_selects
+
+
+def _order(product_ids):
+    return {
+        "reference_name": "mesa 4",
+        "items": [{"product_id": pid, "qty": 2} for pid in product_ids],
+        "payment": {"method": "cash", "amount": 2000 * len(product_ids)},
+    }
+
+
+def test_create_order_selects_do_not_grow_with_lines(app, client, open_register):
+    pids = add_products(app, *[
+        {"name": f"Producto {i}", "price": 1000, "stock_qty": 100, "track_stock": i % 2 == 0}
+        for i in range(12)
+    ])
+
+    # calienta caches del proceso (usuario, caja abierta) para medir solo la venta
+    assert client.post("/pos/orders", json=_order(pids[:1])).json["ok"]
+
+    counts = {}
+    for n in (1, 12):
+        with count_selects(app) as selects:
+            resp = client.post("/pos/orders", json=_order(pids[:n]))
+        assert resp.status_code == 200 and resp.json["ok"], resp.json
+        counts[n] = len(selects)
+
+    assert counts[1] == counts[12], counts
@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+
+from conftest import add_products, sale
+
+from app.extensions import db
+
+
+def _row(cid, product_id, qty, price=1000, **extra):
+    return {"client_id": cid, **sale(product_id, qty, price), **extra}
+
+
+def _sale_moves(app):
+    from app.models import StockMove, StockMoveType
+
+    with app.app_context():
+        return [
+            (m.ref_table, m.ref_id, float(m.qty_delta))
+            for m in StockMove.query.filter_by(move_type=StockMoveType.SALE.value).order_by(StockMove.id).all()
+        ]
+
+
+def _stock(app, pid):
+    from app.models import Product
+
+    with app.app_context():
+        return float(db.session.get(Product, pid).stock_qty)
+
+
+def test_sync_returns_per_order_results(app, client, open_register):
+    a, b = add_products(
+        app,
+        {"name": "Empanada", "price": 1000, "stock_qty": 10},
+        {"name": "Bebida", "price": 1000, "stock_qty": 1},
+    )
+    resp = client.post("/pos/orders/sync", json={"orders": [
+        _row("c-1", a, 2),
+        _row("c-2", b, 5),                      # stock insuficiente
+        _row("", a, 1),                         # sin client_id
+        _row("c-3", a, 1, payment={"method": "cash", "amount": 1}),
+        _row("c-1", a, 1),                      # repetida en el lote
+        _row("c-4", b, 1),
+    ]})
+    assert resp.status_code == 200, resp.json
+    results = resp.json["results"]
+
+    assert [r["ok"] for r in results] == [True, False, False, False, False, True]
+    assert results[1]["error"].startswith("Stock insuficiente: Bebida")
+    assert results[2]["error"] == "client_id inválido"
+    assert results[3]["error"] == "Monto incorrecto"
+    assert results[4]["error"] == "client_id duplicado en el lote"
+    assert [results[0]["order_number"], results[5]["order_number"]] == [1, 2]
+
+    assert _stock(app, a) == 8 and _stock(app, b) == 0
+    assert _sale_moves(app) == [
+        ("orders", results[0]["order_id"], -2.0),
+        ("orders", results[5]["order_id"], -1.0),
+    ]
+
+
+def test_sync_replays_already_synced_client_ids(app, client, open_register):
+    (a,) = add_products(app, {"name": "Empanada", "price": 1000, "stock_qty": 10})
+
+    first = client.post("/pos/orders/sync", json={"orders": [_row("c-1", a, 2)]}).json["results"][0]
+    online = client.post("/pos/orders", json=sale(a, 1, 1000), headers={"Idempotency-Key": "c-2"}).json
+
+    resp = client.post("/pos/orders/sync", json={"orders": [
+        _row("c-1", a, 2), _row("c-2", a, 1), _row("c-3", a, 1),
+    ]})
+    results = resp.json["results"]
+
+    assert results[0] == {**first, "replayed": True}
+    assert results[1] == {
+        "client_id": "c-2", "ok": True, "replayed": True,
+        "order_id": online["order_id"], "order_number": online["order_number"],
+    }
+    assert results[2]["ok"] and "replayed" not in results[2]
+    assert results[2]["order_number"] == 3
+    assert _stock(app, a) == 6  # 2 + 1 + 1: los reenvíos no descuentan de nuevo
+
+
+def test_sync_rejects_bad_quantities_without_failing_the_batch(app, client, open_register):
+    (a,) = add_products(app, {"name": "Empanada", "price": 1000, "stock_qty": 10})
+    bad = ["2x", 1.5, -1, 0, None, "abc", "NaN", "1e400", 10001, [1]]
+
+    orders = [_row(f"bad-{i}", a, 1) for i in range(len(bad))]
+    for row, qty in zip(orders, bad):
+        row["items"][0]["qty"] = qty
+    orders.append(_row("ok", a, "3", price=1000))
+    orders[-1]["payment"]["amount"] = 3000
+    orders.append({"client_id": "items-raros", "reference_name": "x", "items": ["a"], "payment": "cash"})
+
+    resp = client.post("/pos/orders/sync", json={"orders": orders})
+    assert resp.status_code == 200, resp.json
+    results = resp.json["results"]
+
+    assert all(r["error"] == "Cantidad inválida: Empanada" for r in results[:len(bad)]), results
+    assert results[len(bad)]["ok"]
+    assert results[-1] == {"client_id": "items-raros", "ok": False, "error": "payment.method inválido"}
+    assert _stock(app, a) == 7
+
+
+def test_online_and_offline_sales_link_the_kardex_to_the_order(app, client, open_register):
+    (a,) = add_products(app, {"name": "Empanada", "price": 1000, "stock_qty": 10})
+
+    online = client.post("/pos/orders", json=sale(a, 1, 1000)).json
+    offline = client.post("/pos/orders/sync", json={"orders": [_row("c-1", a, 2)]}).json["results"][0]
+
+    assert _sale_moves(app) == [
+        ("orders", online["order_id"], -1.0),
+        ("orders", offline["order_id"], -2.0),
+    ]
+
+
+def test_sync_keeps_the_sale_time_of_orders_older_than_the_register(app, client, open_register):
+    from app.models import CashRegister, Order
+
+    (a,) = add_products(app, {"name": "Empanada", "price": 1000, "stock_qty": 10})
+    with app.app_context():
+        opened_at = db.session.get(CashRegister, open_register).opened_at
+
+    before = (opened_at - timedelta(hours=3)).replace(microsecond=0)
+    inside = datetime.utcnow()
+    resp = client.post("/pos/orders/sync", json={"orders": [
+        _row("viejo", a, 1, created_at=before.isoformat() + "Z"),
+        _row("nuevo", a, 1, created_at=inside.isoformat() + "Z"),
+    ]})
+    old_id, new_id = (r["order_id"] for r in resp.json["results"])
+
+    with app.app_context():
+        old, new = db.session.get(Order, old_id), db.session.get(Order, new_id)
+        # la venta vieja cuenta en la caja/día en que se sincroniza, con la hora original en notes
+        assert old.created_at >= opened_at
+        assert old.notes == f"[OFFLINE] hora de venta: {before.isoformat()} UTC"
+        assert new.created_at == inside and new.notes is None
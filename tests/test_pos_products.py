@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+
+from conftest import add_products, sale
+from sqlalchemy import update
+
+from app.extensions import db
+from app.pos.routes import STOCK_SINCE_MARGIN_SECONDS
+
+
+def _age_products(app, minutes=10):
+    """updated_at en el pasado: fuera del margen de cualquier cursor de ahora."""
+    from app.models import Product
+
+    with app.app_context():
+        db.session.execute(update(Product).values(updated_at=datetime.utcnow() - timedelta(minutes=minutes)))
+        db.session.commit()
+
+
+def _stock(client, since=None):
+    resp = client.get("/pos/products/stock", query_string={"since": since} if since else {})
+    assert resp.status_code == 200, resp.json
+    return resp.json["as_of"], {it["id"]: it["stock_qty"] for it in resp.json["items"]}
+
+
+def test_stock_feed_only_returns_products_changed_since_the_cursor(app, client, open_register):
+    empanada, churro, bebida = add_products(
+        app,
+        {"name": "Empanada", "price": 1000, "stock_qty": 10},
+        {"name": "Churro", "price": 500, "stock_qty": 20},
+        {"name": "Bebida", "price": 800, "stock_qty": 0, "track_stock": False},
+    )
+    _age_products(app)
+
+    as_of, full = _stock(client)
+    assert full == {empanada: 10.0, churro: 20.0}  # sin track_stock no viaja
+
+    assert _stock(client, since=as_of)[1] == {}
+
+    assert client.post("/pos/orders", json=sale(empanada, 3, 1000)).json["ok"]
+    as_of2, delta = _stock(client, since=as_of)
+    assert delta == {empanada: 7.0}
+
+    # cambio confirmado con updated_at algo anterior al cursor (transacción lenta): igual llega
+    from app.models import Product
+    with app.app_context():
+        db.session.execute(
+            update(Product).where(Product.id == churro)
+            .values(stock_qty=19, updated_at=datetime.fromisoformat(as_of2) - timedelta(seconds=STOCK_SINCE_MARGIN_SECONDS - 2))
+        )
+        db.session.commit()
+    assert _stock(client, since=as_of2)[1][churro] == 19.0
+
+    # cursor inválido -> lista completa
+    assert _stock(client, since="ayer")[1] == {empanada: 7.0, churro: 19.0}
+
+
+def test_catalog_etag_survives_stock_only_changes(app, client, open_register):
+    (empanada,) = add_products(app, {"name": "Empanada", "price": 1000, "stock_qty": 10})
+
+    resp = client.get("/pos/products")
+    etag = resp.headers["ETag"]
+    assert resp.status_code == 200
+    assert [p["name"] for p in resp.json] == ["Empanada"]
+    assert "stock_qty" not in resp.json[0]
+
+    # una venta solo mueve stock: el catálogo sigue igual
+    assert client.post("/pos/orders", json=sale(empanada, 2, 1000)).json["ok"]
+    resp = client.get("/pos/products", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.data == b""
+
+    # un cambio de precio sí invalida
+    assert client.put(f"/admin/products/{empanada}", json={"price": 1200}).json["ok"]
+    resp = client.get("/pos/products", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] != etag
+    assert resp.json[0]["price"] == 1200.0
+
+
+def _catalog(client, etag=None, url="/pos/products"):
+    resp = client.get(url, headers={"If-None-Match": etag} if etag else {})
+    assert resp.status_code in (200, 304)
+    return resp
+
+
+def test_admin_product_edits_invalidate_the_catalog(app, client):
+    resp = _catalog(client)
+    etag, ui_etag = resp.headers["ETag"], _catalog(client, url="/pos/ui").headers["ETag"]
+    assert resp.json == []
+
+    # alta
+    created = client.post("/admin/products", json={"name": "Churro", "price": 500, "category": "Dulces"})
+    assert created.json["ok"], created.json
+    resp = _catalog(client, etag)
+    assert resp.status_code == 200
+    assert [(p["name"], p["price"]) for p in resp.json] == [("Churro", 500.0)]
+    etag = resp.headers["ETag"]
+    pid = resp.json[0]["id"]
+
+    resp = _catalog(client, ui_etag, url="/pos/ui")
+    assert resp.status_code == 200
+    assert "Churro" in resp.get_data(as_text=True)
+    ui_etag = resp.headers["ETag"]
+
+    # sin cambios: 304 en las dos
+    assert _catalog(client, etag).status_code == 304
+    assert _catalog(client, ui_etag, url="/pos/ui").status_code == 304
+
+    # edición rechazada: no sube la versión
+    assert client.put(f"/admin/products/{pid}", json={"name": ""}).status_code == 400
+    assert _catalog(client, etag).status_code == 304
+
+    # renombrar / ocultar del POS / desactivar: cada uno invalida
+    for change, expected in (({"name": "Churro relleno"}, ["Churro relleno"]),
+                             ({"show_in_pos": False}, []),
+                             ({"show_in_pos": True}, ["Churro relleno"]),
+                             ({"active": False}, [])):
+        assert client.put(f"/admin/products/{pid}", json=change).json["ok"]
+        resp = _catalog(client, etag)
+        assert resp.status_code == 200, change
+        assert [p["name"] for p in resp.json] == expected, change
+        assert resp.headers["ETag"] != etag
+        etag = resp.headers["ETag"]
+        resp = _catalog(client, ui_etag, url="/pos/ui")
+        assert resp.status_code == 200, change
+        ui_etag = resp.headers["ETag"]
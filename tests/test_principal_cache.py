@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+from conftest import add_user, count_selects
+
+from app import principal
+from app.principal import PRINCIPAL_RECHECK_SECONDS, load_principal
+
+
+def _fake_clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(principal, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_cached_principal_needs_no_query_inside_window(app, database, monkeypatch):
+    uid = add_user(app, "caja1", "cashier")
+    now = _fake_clock(monkeypatch)
+
+    with app.app_context():
+        assert load_principal(uid).role == "cashier"
+        now[0] += PRINCIPAL_RECHECK_SECONDS - 1
+        with count_selects(app) as selects:
+            assert load_principal(uid).role == "cashier"
+        assert selects == []
+
+        # pasada la ventana: solo se relee el contador (el usuario sigue en cache)
+        now[0] += 2
+        with count_selects(app) as selects:
+            assert load_principal(uid).role == "cashier"
+        assert len(selects) == 1 and "app_counters" in selects[0]
+
+
+def test_user_edit_reaches_other_worker_within_window(app, client, monkeypatch):
+    uid = add_user(app, "caja1", "cashier")
+    now = _fake_clock(monkeypatch)
+
+    # "worker B" ya tiene al usuario en cache
+    with app.app_context():
+        assert load_principal(uid).role == "cashier"
+        worker_b = (principal._principal_cache.get(uid), principal._users_version)
+
+    # "worker A" (este proceso) edita desde admin: lo ve al instante
+    resp = client.put(f"/admin/users/{uid}", json={"role": "kitchen", "is_active": False})
+    assert resp.status_code == 200, resp.json
+    with app.app_context():
+        assert load_principal(uid) is None
+
+        # se restaura el estado de worker B: sigue viendo el dato viejo solo dentro de la ventana
+        principal._principal_cache.set(uid, worker_b[0])
+        principal._users_version = worker_b[1]
+        now[0] += PRINCIPAL_RECHECK_SECONDS - 1
+        assert load_principal(uid).role == "cashier"
+
+        now[0] += 2
+        assert load_principal(uid) is None
+
+    resp = client.put(f"/admin/users/{uid}", json={"is_active": True})
+    assert resp.status_code == 200, resp.json
+    with app.app_context():
+        assert load_principal(uid).role == "kitchen"
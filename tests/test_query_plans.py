@@ -0,0 +1,76 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, text
+
+from app.extensions import db
+from app.query_plans import check_query_plans
+
+ORDERS = 20000
+REGISTERS = 5
+
+
+@pytest.fixture
+def seeded(app, database):
+    """Varias cajas con pedidos de los últimos 30 días (+ ANALYZE para que el planner use estadísticas)."""
+    from app.models import CashRegister, Order, OrderItem, Payment, Product, StockMove, User
+
+    rnd = random.Random(7)
+    now = datetime.utcnow()
+
+    with app.app_context():
+        user_id = User.query.first().id
+        db.session.add_all([Product(name=f"P{i}", price=1000, stock_qty=1000, avg_cost=300) for i in range(10)])
+        db.session.add_all([
+            CashRegister(status="closed" if i < REGISTERS else "open", opened_at=now - timedelta(days=30), opened_by_id=user_id)
+            for i in range(1, REGISTERS + 1)
+        ])
+        db.session.flush()
+
+        orders, items, payments, moves = [], [], [], []
+        for oid in range(1, ORDERS + 1):
+            cr_id = rnd.randint(1, REGISTERS)
+            created = now - timedelta(seconds=rnd.randint(0, 30 * 86400))
+            status = "closed" if cr_id < REGISTERS else rnd.choice(["prep", "ready", "closed", "cancelled"])
+            orders.append(dict(
+                id=oid, reference_name="x", status=status, cash_register_id=cr_id, number_in_register=oid,
+                created_by_id=user_id, created_at=created, updated_at=created, total_amount=2000, items_count=2,
+            ))
+            pid = rnd.randint(1, 10)
+            items.append(dict(order_id=oid, product_id=pid, product_name=f"P{pid}", unit_price=1000, quantity=2))
+            payments.append(dict(order_id=oid, method=rnd.choice(["cash", "transfer"]), amount=2000, created_at=created))
+            moves.append(dict(
+                product_id=pid, move_type=rnd.choice(["sale", "sale", "purchase", "adjust"]), qty_delta=-2,
+                unit_cost=300, ref_table="orders", ref_id=oid, cash_register_id=cr_id, created_at=created,
+            ))
+
+        for model, rows in ((Order, orders), (OrderItem, items), (Payment, payments), (StockMove, moves)):
+            db.session.execute(insert(model), rows)
+        db.session.commit()
+        db.session.execute(text("ANALYZE"))
+        db.session.commit()
+
+    return REGISTERS  # caja abierta
+
+
+def test_hot_queries_use_indexes(app, seeded):
+    with app.app_context():
+        results = check_query_plans(seeded)
+
+    assert results
+    full_scans = {name: (scans, plan) for name, scans, plan in results if scans}
+    assert not full_scans, "\n\n".join(f"{name}: {scans}\n{plan}" for name, (scans, plan) in full_scans.items())
+
+
+def test_check_flags_a_missing_index(app, seeded):
+    with app.app_context():
+        # sin ningún índice que sirva para (cash_register_id, move_type)
+        for name in ("ix_stock_moves_register_type", "ix_stock_moves_cash_register_id", "ix_stock_moves_move_type"):
+            db.session.execute(text(f"DROP INDEX {name}"))
+        db.session.commit()
+        db.engine.dispose()  # otras conexiones del pool (tests con varios clientes) pueden tener el esquema viejo
+
+        results = {name: scans for name, scans, _ in check_query_plans(seeded)}
+
+    assert results["cierre: COGS de la caja"] == ["stock_moves"]
@@ -0,0 +1,294 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from conftest import seed_sales
+from sqlalchemy import update
+
+from app import reports
+from app.extensions import db
+from app.reports import ReportFilters, TOP_PRODUCTS_LIMIT, local_day, payment_label
+
+TZ = "America/Santiago"  # días locales != días UTC
+
+
+@pytest.fixture
+def local_tz(app, monkeypatch):
+    monkeypatch.setitem(app.config, "TIMEZONE", TZ)
+
+
+def python_summary(f: ReportFilters, user_names: dict) -> dict:
+    """
+    Referencia: el recorrido en Python que hacía admin_api_reportes (pedidos ORM, pagos e
+    items por pedido), con días locales y cada pedido contado una vez aunque tenga 2 pagos.
+    """
+    from sqlalchemy.orm import selectinload
+
+    from app.models import Order
+
+    # un día de margen en UTC a cada lado; el día local exacto se filtra abajo
+    start = datetime.combine(f.day_from - timedelta(days=1), datetime.min.time())
+    end = datetime.combine(f.day_to + timedelta(days=2), datetime.min.time())
+    orders = (
+        Order.query.filter(Order.status == "closed", Order.created_at >= start, Order.created_at < end)
+        .options(selectinload(Order.payments), selectinload(Order.items))
+        .order_by(Order.id).all()
+    )
+
+    total_sales, orders_count = Decimal("0"), 0
+    by_day, by_payment, by_product, by_user = {}, {}, {}, {}
+    for o in orders:
+        day = local_day(o.created_at)
+        methods = [(p.method or "").lower().strip() for p in o.payments]
+        if not (f.day_from <= day <= f.day_to):
+            continue
+        if f.cash_register_id is not None and o.cash_register_id != f.cash_register_id:
+            continue
+        if f.user_id is not None and o.created_by_id != f.user_id:
+            continue
+        if f.payment_method and f.payment_method not in methods:
+            continue
+
+        total = Decimal(str(o.total_amount))
+        total_sales += total
+        orders_count += 1
+        by_day[day.isoformat()] = by_day.get(day.isoformat(), Decimal("0")) + total
+        if o.created_by_id:
+            by_user[o.created_by_id] = by_user.get(o.created_by_id, Decimal("0")) + total
+        for p in o.payments:
+            pm = (p.method or "").lower().strip()
+            if f.payment_method and pm != f.payment_method:
+                continue
+            by_payment[pm] = by_payment.get(pm, Decimal("0")) + Decimal(str(p.amount))
+        for it in o.items:
+            by_product[it.product_name or "—"] = by_product.get(it.product_name or "—", 0) + int(it.quantity)
+
+    top_user = {"name": "—", "detail": "—"}
+    if by_user:
+        uid = max(by_user, key=by_user.get)
+        top_user = {"name": user_names[uid], "detail": f"{float(by_user[uid]):,.0f} CLP"}
+
+    sales_by_payment = [{"label": payment_label(k), "value": float(by_payment[k])}
+                        for k in ("cash", "transfer") if k in by_payment]
+    sales_by_payment += [{"label": payment_label(k), "value": float(v)}
+                         for k, v in sorted(by_payment.items()) if k not in ("cash", "transfer")]
+    return {
+        "kpis": {
+            "total_sales": float(total_sales),
+            "orders_count": orders_count,
+            "avg_ticket": float(total_sales / orders_count) if orders_count else 0.0,
+            "top_user": top_user,
+        },
+        "series": {
+            "sales_by_day": [{"label": k, "value": float(v)} for k, v in sorted(by_day.items())],
+            "sales_by_payment": sales_by_payment,
+            "top_products": [{"label": k, "value": v} for k, v in
+                             sorted(by_product.items(), key=lambda kv: (-kv[1], kv[0]))[:TOP_PRODUCTS_LIMIT]],
+        },
+    }
+
+
+def _today(app):
+    with app.app_context():
+        return datetime.now(reports.report_tz()).date()
+
+
+def _raw_only_summary(f):
+    """_compute_summary leyendo todo desde orders (como si ninguna caja tuviera rollup)."""
+    from app.models import CashRegister
+
+    db.session.execute(update(CashRegister).values(rollup_at=None))
+    try:
+        return reports._compute_summary(f)
+    finally:
+        db.session.rollback()
+
+
+def _api(client, f: ReportFilters):
+    params = {"from": f.day_from.isoformat(), "to": f.day_to.isoformat()}
+    if f.payment_method:
+        params["payment_method"] = f.payment_method
+    if f.cash_register_id is not None:
+        params["cash_register_id"] = f.cash_register_id
+    if f.user_id is not None:
+        params["user_id"] = f.user_id
+    resp = client.get("/admin/api/reportes", query_string=params)
+    assert resp.status_code == 200, resp.json
+    return {"kpis": resp.json["kpis"], "series": resp.json["series"]}
+
+
+def test_rollup_and_raw_paths_give_the_same_report(app, client, local_tz):
+    seeded = seed_sales(app, orders=3000)
+    today = _today(app)
+    _, cajero1, cajero2 = seeded["users"]
+
+    straddle = ReportFilters(day_from=today - timedelta(days=3), day_to=today)  # cerradas + caja abierta
+    cases = [
+        straddle,
+        straddle._replace(payment_method="transfer"),
+        straddle._replace(payment_method="card"),
+        straddle._replace(user_id=cajero1),
+        straddle._replace(user_id=cajero2, payment_method="cash"),
+        straddle._replace(cash_register_id=seeded["open"]),
+        ReportFilters(day_from=today - timedelta(days=12), day_to=today - timedelta(days=2)),  # solo rollups
+        ReportFilters(day_from=today - timedelta(days=12), day_to=today,
+                      cash_register_id=seeded["closed"][1], payment_method="transfer"),
+        ReportFilters(day_from=today, day_to=today),
+        ReportFilters(day_from=today + timedelta(days=1), day_to=today + timedelta(days=2)),  # vacío
+    ]
+
+    with app.app_context():
+        from app.models import User
+        names = {u.id: u.username for u in User.query.all()}
+
+        for f in cases:
+            expected = python_summary(f, names)
+            assert _api(client, f) == expected, f
+
+            raw = _raw_only_summary(f)
+            via_rollups = reports._compute_summary(f)
+            assert raw == via_rollups, f
+
+    assert _api(client, straddle)["kpis"]["orders_count"] > 0
+
+
+def test_cached_summaries_are_refreshed_by_a_rollup_rebuild(app, client, local_tz):
+    from app.models import Order, User
+    from app.rollups import build_register_rollup
+
+    seeded = seed_sales(app, orders=600)
+    today = _today(app)
+    frozen = ReportFilters(day_from=today - timedelta(days=12), day_to=today - timedelta(days=3))
+    live = ReportFilters(day_from=today - timedelta(days=12), day_to=today)  # incluye la caja abierta
+
+    with app.app_context():
+        assert reports._summary_cache_key(frozen)[0] == "frozen"
+        assert reports._summary_cache_key(live)[0] == "v"
+
+    before = {f: _api(client, f) for f in (frozen, live)}
+    hits = reports.report_cache_stats()["hits"]
+    for f in (frozen, live):
+        assert _api(client, f) == before[f]
+    assert reports.report_cache_stats()["hits"] == hits + 2
+
+    # se corrige un pedido de una caja cerrada y se recalcula su rollup (flask rollup-sales --rebuild)
+    with app.app_context():
+        o = Order.query.filter_by(cash_register_id=seeded["closed"][0], status="closed").order_by(Order.id).first()
+        o.total_amount = Decimal(o.total_amount) + 1000
+        db.session.commit()
+
+        build_register_rollup(seeded["closed"][0])
+        db.session.commit()
+
+    with app.app_context():
+        names = {u.id: u.username for u in User.query.all()}
+        for f in (frozen, live):
+            after = _api(client, f)
+            assert after["kpis"]["total_sales"] == before[f]["kpis"]["total_sales"] + 1000, f
+            assert after == python_summary(f, names), f
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize("orders", [500_000])
+def test_bench_report_summary(app, database, local_tz, orders):
+    """pytest -m bench -s: recorrido en Python (antes) vs SQL agrupado + rollups (ahora)."""
+    import time
+
+    seed_sales(app, orders=orders, days=30)
+    today = _today(app)
+
+    with app.app_context():
+        from app.models import User
+        names = {u.id: u.username for u in User.query.all()}
+
+        for label, f in (("3 días", ReportFilters(day_from=today - timedelta(days=2), day_to=today)),
+                         ("7 días", ReportFilters(day_from=today - timedelta(days=6), day_to=today))):
+            t0 = time.perf_counter()
+            expected = python_summary(f, names)
+            t_old = time.perf_counter() - t0
+            db.session.expunge_all()
+
+            reports._summary_cache.clear()  # sin cache: se mide el cálculo
+            t0 = time.perf_counter()
+            summary = reports.report_summary(f, names)
+            t_new = time.perf_counter() - t0
+
+            assert summary == expected
+            print(f"\n{orders} pedidos, {label} ({expected['kpis']['orders_count']} cerrados): "
+                  f"python {t_old * 1000:.0f} ms, sql {t_new * 1000:.0f} ms, x{t_old / t_new:.1f}")
+
+
+def _walk(client, f: ReportFilters, sort: str, limit: int):
+    """Todas las páginas de /admin/api/reportes/rows -> [ids] (y cuántas páginas fueron)."""
+    params = {"from": f.day_from.isoformat(), "to": f.day_to.isoformat(), "sort": sort, "limit": limit}
+    ids, pages, cursor = [], 0, None
+    while True:
+        resp = client.get("/admin/api/reportes/rows", query_string={**params, **({"cursor": cursor} if cursor else {})})
+        assert resp.status_code == 200, resp.json
+        assert len(resp.json["rows"]) <= limit
+        ids += [r["id"] for r in resp.json["rows"]]
+        pages += 1
+        cursor = resp.json["next_cursor"]
+        if cursor is None:
+            return ids, pages
+
+
+def test_keyset_pages_are_ordered_and_stable_with_ties(app, client):
+    from sqlalchemy import insert
+
+    from app.models import CashRegister, Order
+
+    base = datetime.utcnow().replace(microsecond=0) - timedelta(hours=2)
+    stamps = [base, base + timedelta(minutes=1), base + timedelta(minutes=1, microseconds=500)]
+    totals = [Decimal("1500"), Decimal("2500.50"), Decimal("1500")]
+
+    with app.app_context():
+        cr = CashRegister(status="open", opened_at=base - timedelta(hours=1), opened_by_id=1)
+        db.session.add(cr)
+        db.session.flush()
+        cr_id = cr.id
+        rows = [dict(reference_name=f"p{n}", status="cancelled" if n % 7 == 0 else "closed",
+                     cash_register_id=cr_id, number_in_register=n + 1, created_by_id=1,
+                     created_at=stamps[n % 3], updated_at=stamps[n % 3], total_amount=totals[(n // 3) % 3],
+                     items_count=1)
+                for n in range(47)]
+        db.session.execute(insert(Order), rows)
+        db.session.commit()
+        closed = [(o.id, o.created_at, Decimal(str(o.total_amount)))
+                  for o in Order.query.filter_by(status="closed").all()]
+
+    today = datetime.utcnow().date()
+    f = ReportFilters(day_from=today - timedelta(days=1), day_to=today)
+    expected = {
+        "date": [oid for oid, _, _ in sorted(closed, key=lambda r: (r[1], r[0]))],
+        "total": [oid for oid, _, _ in sorted(closed, key=lambda r: (r[2], r[0]))],
+    }
+
+    for sort in ("-date", "date", "-total", "total"):
+        want = expected[sort.lstrip("-")]
+        if sort.startswith("-"):
+            want = want[::-1]
+        for limit in (1, 5, len(closed), 500):
+            ids, pages = _walk(client, f, sort, limit)
+            assert ids == want, (sort, limit)
+            assert pages == max(1, -(-len(closed) // limit)), (sort, limit)
+
+    # pedido nuevo mientras se pagina (-date): queda antes del cursor, no corre ni repite filas
+    first = client.get("/admin/api/reportes/rows", query_string={
+        "from": f.day_from.isoformat(), "to": f.day_to.isoformat(), "limit": 10}).json
+    with app.app_context():
+        db.session.add(Order(reference_name="nuevo", status="closed", cash_register_id=cr_id, number_in_register=99,
+                             created_by_id=1, total_amount=1500, items_count=1, created_at=datetime.utcnow()))
+        db.session.commit()
+    rest, cursor = [], first["next_cursor"]
+    while cursor:
+        page = client.get("/admin/api/reportes/rows", query_string={
+            "from": f.day_from.isoformat(), "to": f.day_to.isoformat(), "limit": 10, "cursor": cursor}).json
+        rest += [r["id"] for r in page["rows"]]
+        cursor = page["next_cursor"]
+    assert [r["id"] for r in first["rows"]] + rest == expected["date"][::-1]
+
+    # cursor de otro orden o basura: 400
+    for sort, cursor in (("-total", first["next_cursor"]), ("-date", "x_1"), ("date", "sin-id")):
+        resp = client.get("/admin/api/reportes/rows", query_string={"sort": sort, "cursor": cursor})
+        assert resp.status_code == 400, (sort, cursor)
@@ -0,0 +1,81 @@
+from conftest import seed_sales
+from sqlalchemy import func
+
+from app.counters import ROLLUPS_COUNTER, get_counter
+from app.extensions import db
+from app.rollups import build_register_rollup
+
+
+def _rollup_rows():
+    """{tabla: [filas sin id]} ordenadas: compara el contenido, no el orden de inserción."""
+    from app.models import SalesDaily, SalesDailyPayment, SalesDailyProduct
+
+    out = {}
+    for model in (SalesDaily, SalesDailyPayment, SalesDailyProduct):
+        cols = [c for c in model.__table__.columns if c.name != "id"]
+        out[model.__tablename__] = sorted(
+            (tuple(str(v) for v in row) for row in db.session.execute(db.select(*cols)).all())
+        )
+    return out
+
+
+def test_rebuild_is_idempotent(app, database):
+    from app.models import CashRegister, Order, SalesDaily
+
+    seeded = seed_sales(app, orders=800)
+
+    with app.app_context():
+        first = _rollup_rows()
+        assert all(first.values())
+        closed_orders = {
+            cr_id: Order.query.filter_by(cash_register_id=cr_id, status="closed").count()
+            for cr_id in seeded["closed"]
+        }
+        assert db.session.query(func.sum(SalesDaily.orders_count)).scalar() == sum(closed_orders.values())
+
+        # dos veces seguidas la misma caja y después todas: mismas filas, contador sube
+        version = get_counter(ROLLUPS_COUNTER)
+        for cr_id in [seeded["closed"][0]] + seeded["closed"]:
+            assert build_register_rollup(cr_id) == closed_orders[cr_id]
+        db.session.commit()
+        assert _rollup_rows() == first
+        assert get_counter(ROLLUPS_COUNTER) == version + len(seeded["closed"]) + 1
+
+        # la caja abierta no tiene rollup: sus pedidos se leen de orders
+        assert db.session.get(CashRegister, seeded["open"]).rollup_at is None
+        assert SalesDaily.query.filter_by(cash_register_id=seeded["open"]).count() == 0
+
+    # CLI: sin --rebuild no toca cajas ya agregadas; con --rebuild deja lo mismo
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=["rollup-sales"])
+    assert result.exit_code == 0, result.output
+    assert "0 caja(s)" in result.output
+
+    result = runner.invoke(args=["rollup-sales", "--rebuild"])
+    assert result.exit_code == 0, result.output
+    assert f"{len(seeded['closed'])} caja(s), {sum(closed_orders.values())} pedidos" in result.output
+    with app.app_context():
+        assert _rollup_rows() == first
+
+
+def test_rebuild_only_touches_its_register(app, database):
+    from app.models import Order, SalesDaily
+
+    seeded = seed_sales(app, orders=400)
+    target, other = seeded["closed"][0], seeded["closed"][1]
+
+    with app.app_context():
+        before = _rollup_rows()
+        other_rows = SalesDaily.query.filter_by(cash_register_id=other).count()
+
+        # todos los pedidos de la caja dejan de estar cerrados: la caja queda sin filas
+        db.session.execute(db.update(Order).where(Order.cash_register_id == target).values(status="cancelled"))
+        assert build_register_rollup(target) == 0
+        db.session.commit()
+
+        assert SalesDaily.query.filter_by(cash_register_id=target).count() == 0
+        assert SalesDaily.query.filter_by(cash_register_id=other).count() == other_rows
+        # las demás cajas quedan igual, fila por fila (la 2a columna es cash_register_id)
+        after = _rollup_rows()
+        for table, rows in before.items():
+            assert [r for r in rows if r[1] != str(target)] == after[table], table
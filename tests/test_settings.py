@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import pytest
+from conftest import count_selects
+
+from app import settings
+from app.settings import SETTINGS_RECHECK_SECONDS, get_setting, get_settings, set_settings
+
+
+def _fake_clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(settings, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_snapshot_is_read_once_per_window(app, database, monkeypatch):
+    now = _fake_clock(monkeypatch)
+
+    with app.app_context():
+        set_settings({"business_name": "Barra Centro", "qr_size": "150"})
+        with count_selects(app) as selects:
+            assert get_setting("business_name") == "Barra Centro"
+            assert get_setting("qr_size") == "150"
+            assert get_setting("receipt_footer", "Gracias") == "Gracias"
+        assert selects == []
+
+        # pasada la ventana sin cambios: solo el contador, no las settings
+        now[0] += SETTINGS_RECHECK_SECONDS + 1
+        with count_selects(app) as selects:
+            assert get_setting("business_name") == "Barra Centro"
+        assert len(selects) == 1 and "app_counters" in selects[0]
+
+        with pytest.raises(TypeError):  # snapshot de solo lectura
+            get_settings()["business_name"] = "x"
+
+
+def test_set_settings_reaches_other_worker_within_window(app, client, monkeypatch):
+    now = _fake_clock(monkeypatch)
+
+    with app.app_context():
+        set_settings({"business_name": "Antes", "receipt_footer": "Chao"})
+        worker_b = (settings._snapshot, settings._checked_at)
+
+    # "worker A" guarda desde admin (las 4 settings en una transacción): lo ve al instante
+    resp = client.post("/admin/settings", data={"business_name": "Después", "receipt_footer": "", "qr_size": "999"})
+    assert resp.status_code == 302
+    with app.app_context():
+        assert get_setting("business_name") == "Después"
+        assert get_setting("qr_size") == "400"
+        assert get_setting("receipt_autoprint") == "0"
+
+        # "worker B" sigue con su snapshot solo dentro de la ventana
+        settings._snapshot, settings._checked_at = worker_b
+        now[0] += SETTINGS_RECHECK_SECONDS - 1
+        assert get_setting("business_name") == "Antes"
+
+        now[0] += 2
+        assert get_settings() == {"business_name": "Después", "receipt_footer": "", "receipt_autoprint": "0",
+                                  "qr_size": "400"}
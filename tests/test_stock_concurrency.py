@@ -0,0 +1,50 @@
+import threading
+from decimal import Decimal
+
+from conftest import add_products, login, sale
+
+from app.extensions import db
+
+THREADS = 8
+SALES_PER_THREAD = 3
+STOCK = 10  # menos que THREADS * SALES_PER_THREAD: algunas ventas tienen que fallar
+
+
+def test_parallel_sales_never_oversell(app, database, open_register):
+    (pid,) = add_products(app, {"name": "Empanada", "price": 1000, "stock_qty": STOCK})
+    clients = [login(app) for _ in range(THREADS)]
+
+    results = []
+    lock = threading.Lock()
+    start = threading.Barrier(THREADS)
+
+    def worker(client):
+        start.wait()
+        for _ in range(SALES_PER_THREAD):
+            resp = client.post("/pos/orders", json=sale(pid, 1, 1000))
+            with lock:
+                results.append((resp.status_code, resp.get_json()))
+
+    threads = [threading.Thread(target=worker, args=(c,)) for c in clients]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    ok = [body for status, body in results if status == 200 and body.get("ok")]
+    failed = [body for status, body in results if not (status == 200 and body.get("ok"))]
+
+    assert len(results) == THREADS * SALES_PER_THREAD
+    assert len(ok) == STOCK
+    assert all("Stock insuficiente" in (body or {}).get("error", "") for body in failed)
+
+    numbers = [body["order_number"] for body in ok]
+    assert len(set(numbers)) == len(numbers)
+    assert sorted(numbers) == list(range(1, STOCK + 1))
+
+    from app.models import Order, Product, StockMove
+
+    with app.app_context():
+        assert db.session.get(Product, pid).stock_qty == Decimal("0")
+        assert Order.query.count() == STOCK
+        assert StockMove.query.filter_by(product_id=pid).count() == STOCK